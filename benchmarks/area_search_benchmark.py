@@ -0,0 +1,66 @@
+"""
+Benchmark of the search of the meters within an area, comparing the spatial index used by fetch_meters_location
+(k-d tree over the unit sphere, followed by the vectorized haversine over the candidates) with the previous scan
+(scalar haversine over every meter of the dataset), for a synthetic registry of meters around Porto.
+
+Usage (from the repository's root):
+	python benchmarks/area_search_benchmark.py [--meters 10000] [--radius 4] [--queries 200]
+"""
+import argparse
+import numpy as np
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from helpers.calculate_circle import haversine  # noqa: E402
+from helpers.meter_location_index import MeterLocationIndex  # noqa: E402
+
+
+def synthetic_locations(nr_meters: int, rng: np.random.Generator) -> dict[str, list[float]]:
+	latitudes = 41.15 + rng.normal(0, 0.2, nr_meters)
+	longitudes = -8.62 + rng.normal(0, 0.2, nr_meters)
+	return {f'meter_{nr}': [latitude, longitude] for nr, (latitude, longitude) in enumerate(zip(latitudes, longitudes))}
+
+
+def scan(locations: dict[str, list[float]], latitude: float, longitude: float, radius: float) -> list[str]:
+	# previous search, kept here as the reference
+	return [meter_id for meter_id, location in locations.items()
+			if haversine((latitude, longitude), tuple(location)) <= radius]
+
+
+def mean_time(function, queries: list[tuple]) -> (float, list):
+	tic = time.perf_counter()
+	found = [function(*query) for query in queries]
+	return (time.perf_counter() - tic) / len(queries), found
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+	parser.add_argument('--meters', type=int, default=10000)
+	parser.add_argument('--radius', type=float, default=4)
+	parser.add_argument('--queries', type=int, default=200)
+	args = parser.parse_args()
+
+	rng = np.random.default_rng(0)
+	locations = synthetic_locations(args.meters, rng)
+	queries = [(41.15 + rng.normal(0, 0.1), -8.62 + rng.normal(0, 0.1), args.radius) for _ in range(args.queries)]
+
+	tic = time.perf_counter()
+	location_index = MeterLocationIndex(locations)
+	build = time.perf_counter() - tic
+
+	previous, previous_found = mean_time(lambda *query: scan(locations, *query), queries)
+	indexed, indexed_found = mean_time(location_index.within_circle, queries)
+
+	assert previous_found == indexed_found, 'the searches found different meters'
+	nr_found = sum(map(len, indexed_found)) / len(queries)
+	print(f'{args.meters} meters, {args.radius} km radius ({nr_found:.0f} meters found per query on average)')
+	print(f'index built in:    {build * 1000:.1f} ms')
+	print(f'scalar scan:       {previous * 1000:.3f} ms per query')
+	print(f'spatial index:     {indexed * 1000:.3f} ms per query ({previous / indexed:.0f}x faster)')
+
+
+if __name__ == '__main__':
+	main()
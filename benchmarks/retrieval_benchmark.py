@@ -0,0 +1,147 @@
+"""
+Benchmark of the retrieval of the results of large (non-clustered) orders, comparing the lean serialization path of
+milp_return_structure (explicit SELECTs, records built straight from the rows and encoded by orjson) with the previous
+one (SELECT *, pandas DataFrames reshaped and converted to records, encoded by the standard library's JSON encoder).
+
+Usage (from the repository's root):
+	python benchmarks/retrieval_benchmark.py [--meters 50] [--days 30] [--repeat 3] [--store sqlite|duckdb]
+"""
+import argparse
+import json
+import numpy as np
+import os
+import pandas as pd
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from helpers.database_interactions import (  # noqa: E402
+	connect_to_database,
+	store_milp_results
+)
+from helpers.main_helpers import (  # noqa: E402
+	milp_return_structure,
+	to_json
+)
+
+
+# Previous serialization path, kept here as the reference ##############################################################
+def __reference_records(cursor, order_id: str, table: str, columns: list[str], order_by: str = 'id') -> list[dict]:
+	cursor.execute(f'SELECT * FROM {table} WHERE order_id = ? ORDER BY {order_by}', (order_id,))
+	df = pd.DataFrame(cursor.fetchall())
+	df.columns = ['index', 'order_id'] + columns
+	del df['index']
+	del df['order_id']
+	if 'step' in columns:
+		cursor.execute('SELECT start_epoch FROM Orders WHERE order_id = ?', (order_id,))
+		start_epoch = cursor.fetchone()[0]
+		datetimes = pd.to_datetime(start_epoch + df['step'].to_numpy(dtype=np.int64) * 900, unit='s', utc=True)
+		df.insert(df.columns.get_loc('step'), 'datetime', list(datetimes.strftime('%Y-%m-%dT%H:%M:%SZ')))
+		del df['step']
+	return df.to_dict('records')
+
+
+def reference_return_structure(cursor, order_id: str) -> dict:
+	milp_return = {'order_id': order_id}
+	milp_return.update(__reference_records(cursor, order_id, 'General_MILP_Outputs',
+										   ['objective_value', 'milp_status', 'total_rec_cost'])[0])
+	milp_return['member_costs'] = __reference_records(
+		cursor, order_id, 'Member_Costs', ['meter_id', 'member_cost', 'member_cost_compensation', 'member_savings'])
+	milp_return['meter_investment_outputs'] = __reference_records(
+		cursor, order_id, 'Meter_Investment_Outputs',
+		['meter_id', 'installation_cost', 'installation_cost_compensation', 'installation_savings', 'installed_pv',
+		 'pv_investment_cost', 'installed_storage', 'storage_investment_cost', 'total_pv', 'total_storage',
+		 'contracted_power', 'contracted_power_cost', 'retailer_exchange_costs', 'sc_tariffs_costs'])
+	milp_return['meter_operation_inputs'] = __reference_records(
+		cursor, order_id, 'Meter_Operation_Inputs',
+		['meter_id', 'step', 'energy_generated', 'energy_consumed', 'buy_tariff', 'sell_tariff'], 'meter_id, step')
+	milp_return['meter_operation_outputs'] = __reference_records(
+		cursor, order_id, 'Meter_Operation_Outputs',
+		['meter_id', 'step', 'energy_surplus', 'energy_supplied', 'energy_purchased_lem', 'energy_sold_lem',
+		 'net_load', 'bess_energy_charged', 'bess_energy_discharged', 'bess_energy_content'], 'meter_id, step')
+	milp_return['self_consumption_tariffs'] = __reference_records(
+		cursor, order_id, 'Pool_Self_Consumption_Tariffs', ['step', 'self_consumption_tariff'], 'step')
+	milp_return['lem_prices'] = __reference_records(cursor, order_id, 'Lem_Prices', ['step', 'value'], 'step')
+	return milp_return
+
+
+def reference_body(milp_return: dict) -> bytes:
+	# serialization of the API's JSONResponse
+	return json.dumps(milp_return, ensure_ascii=False, allow_nan=False, indent=None, separators=(',', ':')).encode()
+
+
+# Synthetic order ######################################################################################################
+def store_synthetic_order(db, order_id: str, nr_meters: int, nr_steps: int):
+	rng = np.random.default_rng(0)
+	meter_ids = [f'meter_{nr}' for nr in range(nr_meters)]
+
+	def series_by_meter():
+		return {meter_id: list(rng.random(nr_steps)) for meter_id in meter_ids}
+
+	def scalar_by_meter():
+		return {meter_id: float(rng.random()) for meter_id in meter_ids}
+
+	inputs = {
+		'meters': {meter_id: {key: list(rng.random(nr_steps)) for key in ('e_g_factor', 'e_c', 'l_buy', 'l_sell')}
+				   for meter_id in meter_ids},
+		'l_grid': list(rng.random(nr_steps))
+	}
+	results = {'milp_status': 'Optimal', 'e_cmet': series_by_meter()}
+	results_pp = {'obj_value': float(rng.random()), 'dual_prices': list(rng.random(nr_steps))}
+	for key in ('e_sur', 'e_sup', 'e_pur_pool', 'e_sale_pool', 'e_bc', 'e_bd', 'e_bat', 'e_slc_pool'):
+		results_pp[key] = series_by_meter()
+	for key in ('member_cost', 'member_cost_compensations', 'installation_cost_compensations', 'p_gn_new',
+				'PV_investments_cost', 'e_bn_new', 'batteries_investments_cost', 'p_gn_total', 'e_bn_total', 'p_cont',
+				'contractedpower_cost'):
+		results_pp[key] = scalar_by_meter()
+	datetimes = list(pd.date_range('2024-01-01', periods=nr_steps, freq='15min', tz='UTC')
+					 .strftime('%Y-%m-%dT%H:%M:%SZ'))
+
+	with db.writer() as conn:
+		conn.execute('''
+			INSERT INTO Orders (order_id, processed, error, message, clustered, created_at) VALUES (?, ?, ?, ?, ?, ?)
+		''', (order_id, True, '', '', False, int(time.time())))
+	store_milp_results(db, order_id, set(meter_ids), meter_ids, inputs, results, results_pp, datetimes)
+
+
+# Benchmark ############################################################################################################
+def best_time(function, repeat: int) -> (float, bytes):
+	timings = []
+	for _ in range(repeat):
+		tic = time.perf_counter()
+		body = function()
+		timings.append(time.perf_counter() - tic)
+	return min(timings), body
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+	parser.add_argument('--meters', type=int, default=50)
+	parser.add_argument('--days', type=int, default=30)
+	parser.add_argument('--repeat', type=int, default=3)
+	parser.add_argument('--store', choices=('sqlite', 'duckdb'), default='sqlite')
+	args = parser.parse_args()
+
+	with tempfile.TemporaryDirectory() as directory:
+		# the databases are created under "files/", relative to the working directory
+		os.chdir(directory)
+		os.makedirs('files')
+		db = connect_to_database(args.store)
+		store_synthetic_order(db, 'benchmark', args.meters, args.days * 96)
+		cursor = db.reader().cursor()
+
+		previous, previous_body = best_time(lambda: reference_body(reference_return_structure(cursor, 'benchmark')),
+											args.repeat)
+		lean, lean_body = best_time(lambda: to_json(milp_return_structure(cursor, 'benchmark')), args.repeat)
+		db.release()
+
+	assert json.loads(previous_body) == json.loads(lean_body), 'the serialization paths returned different results'
+	print(f'{args.meters} meters x {args.days} days ({args.store}), {len(lean_body) / 1024 / 1024:.1f} MB response')
+	print(f'pandas + json:          {previous:.3f} s')
+	print(f'explicit rows + orjson: {lean:.3f} s ({previous / lean:.1f}x faster)')
+
+
+if __name__ == '__main__':
+	main()
@@ -1,4 +1,8 @@
 import math
+import numpy as np
+
+
+EARTH_RADIUS = 6371  # Radius of the Earth in km
 
 
 def haversine(coord1, coord2):
@@ -8,7 +12,7 @@ def haversine(coord1, coord2):
     :param coord2: Tuple of (latitude, longitude) for the second point.
     :return: Distance in kilometers.
     """
-    R = 6371  # Radius of the Earth in km
+    R = EARTH_RADIUS
 
     lat1, lon1 = coord1
     lat2, lon2 = coord2
@@ -26,3 +30,72 @@ def haversine(coord1, coord2):
 
     distance = R * c  # Output distance in km
     return distance
+
+
+def haversine_distances(coord, latitudes, longitudes):
+    """
+    Calculate the great-circle distances between one point and many others, vectorized over NumPy arrays.
+    :param coord: Tuple of (latitude, longitude) of the point.
+    :param latitudes: Array with the latitudes of the other points.
+    :param longitudes: Array with the longitudes of the other points.
+    :return: Array with the distances in kilometers.
+    """
+    lat1, lon1 = coord
+
+    phi1 = np.radians(lat1)
+    phi2 = np.radians(latitudes)
+
+    delta_phi = phi2 - phi1
+    delta_lambda = np.radians(np.asarray(longitudes) - lon1)
+
+    a = np.sin(delta_phi / 2) ** 2 + \
+        np.cos(phi1) * np.cos(phi2) * \
+        np.sin(delta_lambda / 2) ** 2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+    return EARTH_RADIUS * c
+
+
+def unit_vectors(latitudes, longitudes):
+    """
+    Map points on the Earth to the unit sphere, where the (straight) distance between two points grows with their
+    great-circle distance, so that they can be indexed by a k-d tree.
+    :param latitudes: Array with the latitudes of the points.
+    :param longitudes: Array with the longitudes of the points.
+    :return: (nr. points x 3) array with the cartesian coordinates of the points.
+    """
+    phi = np.radians(latitudes)
+    lambda_ = np.radians(longitudes)
+    return np.column_stack((np.cos(phi) * np.cos(lambda_), np.cos(phi) * np.sin(lambda_), np.sin(phi)))
+
+
+def chord_length(distance):
+    """
+    Straight distance, on the unit sphere, between two points separated by a great-circle distance (in km).
+    """
+    return 2 * math.sin(min(distance / EARTH_RADIUS, math.pi) / 2)
+
+
+def points_in_polygon(latitudes, longitudes, polygon_latitudes, polygon_longitudes):
+    """
+    Check which points lie within a polygon (even-odd rule), vectorized over the points and the polygon's edges.
+    The polygon's edges are taken as straight lines in the (latitude, longitude) plane.
+    :param latitudes: Array with the latitudes of the points.
+    :param longitudes: Array with the longitudes of the points.
+    :param polygon_latitudes: Array with the latitudes of the polygon's vertices.
+    :param polygon_longitudes: Array with the longitudes of the polygon's vertices.
+    :return: Boolean array, True for the points within the polygon.
+    """
+    y = np.asarray(latitudes)[:, np.newaxis]
+    x = np.asarray(longitudes)[:, np.newaxis]
+    y1 = np.asarray(polygon_latitudes)
+    x1 = np.asarray(polygon_longitudes)
+    y2 = np.roll(y1, -1)
+    x2 = np.roll(x1, -1)
+
+    # edges crossed by the ray cast eastwards from each point (horizontal edges are never crossed)
+    crosses = (y1 > y) != (y2 > y)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x_crossing = x1 + (y - y1) * (x2 - x1) / (y2 - y1)
+
+    return np.count_nonzero(crosses & (x < x_crossing), axis=1) % 2 == 1
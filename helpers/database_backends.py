@@ -0,0 +1,377 @@
+import abc
+import os
+import pandas as pd
+import re
+import sqlite3
+import threading
+
+from contextlib import contextmanager
+
+
+# Paths to the database files of each backend
+DB_PATH = r'files/orders.db'
+DUCKDB_PATH = r'files/orders.duckdb'
+
+# Backend where the orders and their results are stored:
+# - "sqlite": row-oriented SQLite database (default);
+# - "duckdb": embedded, column-oriented DuckDB database, faster at scanning and aggregating the results' time series
+#   (requires the "duckdb" package).
+RESULT_STORE = os.getenv('SIZING_RESULT_STORE', 'sqlite')
+
+# Time, in seconds, that a connection waits for a lock held by another connection before raising an error
+BUSY_TIMEOUT = 30
+
+# Auto-vacuum mode of the SQLite database; in INCREMENTAL mode, the pages freed by deleted orders are only returned to
+# the file system on request (see "reclaim_free_pages"), in small steps that do not hold the write lock for long
+AUTO_VACUUM_INCREMENTAL = 2
+
+
+class ResultDatabase(abc.ABC):
+    """
+    Thread-safe access layer to the database where the orders and their results are stored.
+    Each thread gets its own read connection and its own write connection, so that connections (and cursors) are never
+    shared between the API's request handlers and the threads processing the orders.
+    Subclasses connect to a specific (embedded) database engine; all of them accept the same (SQLite) SQL statements,
+    so the rest of the API does not depend on the backend chosen.
+    """
+    BEGIN_STATEMENT = 'BEGIN TRANSACTION'
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._connections = set()
+        self._connections_lock = threading.Lock()
+
+    @abc.abstractmethod
+    def _connect(self, read_only: bool):
+        """
+        Open a new connection to the database, read-only or not.
+        """
+
+    def _thread_connection(self, read_only: bool):
+        attribute = 'reader' if read_only else 'writer'
+        conn = getattr(self._local, attribute, None)
+        if conn is None:
+            conn = self._connect(read_only)
+            with self._connections_lock:
+                self._connections.add(conn)
+            setattr(self._local, attribute, conn)
+        return conn
+
+    def reader(self):
+        """
+        Return the read-only connection of the calling thread.
+        """
+        return self._thread_connection(read_only=True)
+
+    @contextmanager
+    def writer(self):
+        """
+        Context manager that yields the write connection of the calling thread within a transaction,
+        committed at the end of the block or rolled back if an exception is raised.
+        """
+        conn = self._thread_connection(read_only=False)
+        conn.execute(self.BEGIN_STATEMENT)
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    @contextmanager
+    def dedicated_reader(self):
+        """
+        Context manager that yields a new read-only connection, not bound to the calling thread, e.g., for a response
+        streamed from a cursor by different threads; the connection is closed at the end of the block.
+        """
+        conn = self._connect(read_only=True)
+        with self._connections_lock:
+            self._connections.add(conn)
+        try:
+            yield conn
+        finally:
+            with self._connections_lock:
+                self._connections.discard(conn)
+            conn.close()
+
+    def release(self):
+        """
+        Close the connections of the calling thread, e.g., before a short-lived thread finishes.
+        """
+        for attribute in ('reader', 'writer'):
+            conn = getattr(self._local, attribute, None)
+            if conn is not None:
+                with self._connections_lock:
+                    self._connections.discard(conn)
+                conn.close()
+                setattr(self._local, attribute, None)
+
+    def close(self):
+        """
+        Close all connections still open, from all threads.
+        """
+        with self._connections_lock:
+            connections, self._connections = self._connections, set()
+        for conn in connections:
+            conn.close()
+
+    # MAINTENANCE (used by the retention policy) #######################################################################
+    @abc.abstractmethod
+    def used_size(self) -> int:
+        """
+        Size, in bytes, of the database's storage in use, i.e., excluding the free space not yet reclaimed.
+        """
+
+    @abc.abstractmethod
+    def reclaim_free_pages(self, max_pages: int) -> int:
+        """
+        Return up to max_pages of the storage freed by deleted orders to the file system.
+        :param max_pages: maximum number of pages to reclaim
+        :return: number of pages reclaimed (0 once there is nothing left to reclaim)
+        """
+
+    @abc.abstractmethod
+    def enable_space_reclaim(self) -> bool:
+        """
+        Prepare the database, if needed, so that the storage freed by deleted orders can be reclaimed.
+        This is a one-off migration of databases created before the retention policy existed, that can block writes
+        to the database for long, so it is meant to be run at startup, before any order is processed.
+        :return: True if the database had to be migrated
+        """
+
+
+class SQLiteDatabase(ResultDatabase):
+    """
+    Access layer to the SQLite database. The database is set to WAL journal mode, so readers are never blocked by an
+    ongoing write, while concurrent writers wait (up to BUSY_TIMEOUT) for each other.
+    """
+    # the database's write lock is acquired when the transaction begins, so that it is never upgraded midway
+    BEGIN_STATEMENT = 'BEGIN IMMEDIATE'
+
+    def __init__(self, db_path: str = DB_PATH, busy_timeout: float = BUSY_TIMEOUT):
+        super().__init__(db_path)
+        self.busy_timeout = busy_timeout
+
+    def _connect(self, read_only: bool) -> sqlite3.Connection:
+        # transactions are explicitly managed (see "writer"), so connections are opened in autocommit mode
+        conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout, isolation_level=None, check_same_thread=False)
+        conn.execute(f'PRAGMA busy_timeout = {int(self.busy_timeout * 1000)}')
+        if read_only:
+            conn.execute('PRAGMA query_only = ON')
+        else:
+            # auto-vacuum mode only takes effect if set before the database's first table (and journal mode) is created
+            conn.execute(f'PRAGMA auto_vacuum = {AUTO_VACUUM_INCREMENTAL}')
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('PRAGMA synchronous = NORMAL')
+        return conn
+
+    def vacuum(self, max_pages: int = None):
+        """
+        Reclaim the free pages of the database, outside any transaction (as SQLite requires for a VACUUM):
+        - if max_pages is None, rebuild the whole database file with a full VACUUM, which is also how a change of the
+          auto-vacuum mode is applied to a database that already has tables;
+        - otherwise, return up to max_pages free pages to the file system (INCREMENTAL auto-vacuum mode only);
+          the pragma is run as a script, since it only frees one page per step of the statement.
+        """
+        conn = self._thread_connection(read_only=False)
+        if max_pages is None:
+            conn.execute(f'PRAGMA auto_vacuum = {AUTO_VACUUM_INCREMENTAL}')
+            conn.execute('VACUUM')
+        else:
+            conn.executescript(f'PRAGMA incremental_vacuum({int(max_pages)})')
+
+    def used_size(self) -> int:
+        conn = self.reader()
+        page_size, = conn.execute('PRAGMA page_size').fetchone()
+        page_count, = conn.execute('PRAGMA page_count').fetchone()
+        freelist_count, = conn.execute('PRAGMA freelist_count').fetchone()
+        return (page_count - freelist_count) * page_size
+
+    def reclaim_free_pages(self, max_pages: int) -> int:
+        # (only databases in INCREMENTAL auto-vacuum mode are reduced by the incremental vacuum)
+        conn = self.reader()
+        freelist_count_before, = conn.execute('PRAGMA freelist_count').fetchone()
+        if not freelist_count_before:
+            return 0
+
+        self.vacuum(max_pages)
+        freelist_count_after, = conn.execute('PRAGMA freelist_count').fetchone()
+        return freelist_count_before - freelist_count_after
+
+    def enable_space_reclaim(self) -> bool:
+        # Switch databases created before the retention policy existed to INCREMENTAL auto-vacuum mode;
+        # this requires a (one-off) full VACUUM, during which writes to the database wait.
+        # (read through the write connection, since a connection only reads the database's auto-vacuum mode when opened)
+        with self.writer() as conn:
+            auto_vacuum, = conn.execute('PRAGMA auto_vacuum').fetchone()
+        if auto_vacuum == AUTO_VACUUM_INCREMENTAL:
+            return False
+        self.vacuum()
+        return True
+
+
+class DuckDBConnection:
+    """
+    Adapter of a DuckDB connection to the subset of the sqlite3 connection / cursor API used by the API,
+    so that the same SQL statements run on both engines:
+    - the schema's statements are translated to DuckDB's types, with sequences instead of AUTOINCREMENT columns,
+      and without foreign keys or indexes (DuckDB prunes its scans with the min-max indexes kept for each column,
+      while explicit indexes would only slow down bulk inserts and block later schema changes);
+    - the rows of an "executemany" INSERT are inserted at once, from a DataFrame,
+      since DuckDB is slow at executing the statement row by row.
+    The connection also acts as its own cursor, so that all statements of a transaction run on the same connection.
+    """
+    INSERT_VALUES_PATTERN = re.compile(r'\s*INSERT INTO (?P<table>\w+)\s*\((?P<columns>[^)]*)\)\s*'
+                                       r'VALUES\s*\([?,\s]*\)\s*', re.IGNORECASE)
+    AUTOINCREMENT_PATTERN = re.compile(r'CREATE TABLE (?:IF NOT EXISTS )?(?P<table>\w+)\s*\(\s*'
+                                       r'(?P<column>\w+) INTEGER PRIMARY KEY AUTOINCREMENT', re.IGNORECASE)
+    FOREIGN_KEY_PATTERN = re.compile(r',\s*FOREIGN KEY\s*\([^)]*\)\s*REFERENCES\s*\w+\s*\([^)]*\)', re.IGNORECASE)
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def translate(self, sql: str) -> list[str]:
+        """
+        Translate a (SQLite) SQL statement into the DuckDB statements that have the same effect.
+        """
+        statement = sql.strip()
+        if re.match(r'CREATE (UNIQUE )?INDEX', statement, re.IGNORECASE):
+            return []
+        if not re.match(r'(CREATE|ALTER) TABLE', statement, re.IGNORECASE):
+            return [sql]
+
+        statements = []
+        match = self.AUTOINCREMENT_PATTERN.match(statement)
+        if match:
+            sequence = f'{match["table"]}_{match["column"]}_seq'
+            statements.append(f'CREATE SEQUENCE IF NOT EXISTS {sequence}')
+            statement = statement.replace(match.group(0), match.group(0).replace(
+                'INTEGER PRIMARY KEY AUTOINCREMENT', f"BIGINT DEFAULT nextval('{sequence}')"))
+        statement = self.FOREIGN_KEY_PATTERN.sub('', statement)
+        # SQLite's REAL and INTEGER are 64-bit, while DuckDB's are 32-bit
+        statement = re.sub(r'\bREAL\b', 'DOUBLE', statement)
+        statement = re.sub(r'\bINTEGER\b', 'BIGINT', statement)
+        statements.append(statement)
+        return statements
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql: str, parameters=()):
+        for statement in self.translate(sql):
+            self._conn.execute(statement, parameters)
+        return self
+
+    def executemany(self, sql: str, seq_of_parameters):
+        rows = list(seq_of_parameters)
+        if not rows:
+            return self
+
+        match = self.INSERT_VALUES_PATTERN.fullmatch(sql)
+        if match is None:
+            self._conn.executemany(sql, rows)
+            return self
+
+        columns = [column.strip() for column in match['columns'].split(',')]
+        rows_df = pd.DataFrame.from_records(rows, columns=columns)
+        self._conn.register('executemany_rows', rows_df)
+        try:
+            self._conn.execute(f'INSERT INTO {match["table"]} ({", ".join(columns)}) '
+                               f'SELECT {", ".join(columns)} FROM executemany_rows')
+        finally:
+            self._conn.unregister('executemany_rows')
+        return self
+
+    def fetchone(self):
+        return self._conn.fetchone()
+
+    def fetchmany(self, size: int) -> list:
+        return self._conn.fetchmany(size)
+
+    def fetchall(self) -> list:
+        return self._conn.fetchall()
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def close(self):
+        self._conn.close()
+
+
+class DuckDBDatabase(ResultDatabase):
+    """
+    Access layer to the DuckDB database. All threads' connections are cursors of a single database instance;
+    readers see a consistent snapshot of the database, while writers are serialized, so that concurrent transactions
+    never conflict.
+    """
+    def __init__(self, db_path: str = DUCKDB_PATH):
+        try:
+            import duckdb
+        except ImportError as e:
+            raise ImportError('the "duckdb" result store requires the "duckdb" package (pip install duckdb)') from e
+
+        super().__init__(db_path)
+        self._database = duckdb.connect(db_path)
+        self._write_lock = threading.RLock()
+
+    def _connect(self, read_only: bool) -> DuckDBConnection:
+        return DuckDBConnection(self._database.cursor())
+
+    @contextmanager
+    def writer(self) -> DuckDBConnection:
+        with self._write_lock:
+            with super().writer() as conn:
+                yield conn
+
+    def close(self):
+        super().close()
+        self._database.close()
+
+    def used_size(self) -> int:
+        # the blocks in use only count the rows written so far once they are checkpointed from the WAL
+        self.checkpoint()
+        conn = self.reader()
+        block_size, used_blocks = conn.execute('''
+            SELECT block_size, used_blocks FROM pragma_database_size()
+        ''').fetchone()
+
+        # the blocks of deleted rows are only freed once all rows of their row group are deleted, so the blocks in use
+        # are scaled by the share of the stored rows (deleted or not) that were not deleted, for the size to drop as
+        # soon as orders are deleted
+        tables = conn.execute('SELECT table_name, estimated_size FROM duckdb_tables()').fetchall()
+        stored_rows = sum(estimated_size for _, estimated_size in tables)
+        if not stored_rows:
+            return block_size * used_blocks
+        live_rows = sum(conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0] for table, _ in tables)
+        return int(block_size * used_blocks * live_rows / stored_rows)
+
+    def checkpoint(self):
+        """
+        Write the changes in the WAL to the database file, freeing the blocks of deleted rows
+        (to be reused by new rows; the file itself is not truncated).
+        """
+        with self._write_lock:
+            self.reader().execute('CHECKPOINT')
+
+    def reclaim_free_pages(self, max_pages: int) -> int:
+        # DuckDB frees the blocks of deleted rows when the database is checkpointed (see "used_size")
+        self.checkpoint()
+        return 0
+
+    def enable_space_reclaim(self) -> bool:
+        # DuckDB reuses the blocks freed by deleted rows without any change to the database
+        return False
+
+
+def open_result_database(result_store: str = RESULT_STORE) -> ResultDatabase:
+    """
+    Open the access layer to the database of the result store configured.
+    :param result_store: "sqlite" or "duckdb"
+    :return: the database's access layer
+    """
+    if result_store == 'sqlite':
+        return SQLiteDatabase()
+    if result_store == 'duckdb':
+        return DuckDBDatabase()
+    raise ValueError(f'unknown result store "{result_store}"; expected "sqlite" or "duckdb"')
@@ -1,207 +1,984 @@
+import itertools
+import numpy as np
 import os
+import pandas as pd
 import sqlite3
+import time
+import zlib
 
+from helpers.database_backends import (
+    RESULT_STORE,
+    ResultDatabase,
+    open_result_database
+)
 
-def connect_to_sqlite_db() -> (sqlite3.Connection, sqlite3.Cursor):
+
+# How the time series of new orders are stored:
+# - "rows": one row per time step (and meter ID) in each of the time-varying results' tables;
+# - "columnar": one compressed blob per results' table (and meter ID), with a single time axis per order.
+STORAGE_MODE = os.getenv('SIZING_STORAGE_MODE', 'rows')
+if STORAGE_MODE not in ('rows', 'columnar'):
+    raise ValueError(f'unknown storage mode "{STORAGE_MODE}"; expected "rows" or "columnar"')
+
+# Energy flows summed (per meter ID and for the whole community) and statistics of the LEM prices, per period,
+# in the summaries of the orders' results; the statistics are the mean and the percentiles (0 and 100 being the
+# minimum and maximum) of the prices
+SUMMARY_ENERGY_COLUMNS = ('energy_supplied', 'energy_purchased_lem', 'energy_sold_lem')
+SUMMARY_PRICE_PERCENTILES = {
+    'lem_price_min': 0,
+    'lem_price_p10': 10,
+    'lem_price_median': 50,
+    'lem_price_p90': 90,
+    'lem_price_max': 100
+}
+SUMMARY_PRICE_COLUMNS = ('lem_price_mean', *SUMMARY_PRICE_PERCENTILES)
+
+
+def connect_to_database(result_store: str = RESULT_STORE) -> ResultDatabase:
     """
-    Function to return the connection and cursor to the SQLite database.
-    :return:
+    Function to return the access layer to the database of the result store, creating its tables and indexes if needed.
+    :param result_store: backend of the result store, "sqlite" or "duckdb"
+    :return: the database's access layer
     """
-    # Define the path to the database file
-    db_path = r'files/orders.db'
-
-    # Connect to the SQLIte database
+    # Connect to the database
     # If the database doesn't exist, it will be created
-    conn = sqlite3.connect(db_path, check_same_thread=False)
-    curs = conn.cursor()
+    db = open_result_database(result_store)
 
-    # Check if the database file just got created
-    if os.path.getsize(db_path) == 0:
-        # The database file did not exist before, so we need to create the tables
+    with db.writer() as conn:
+        curs = conn.cursor()
+        if not __table_columns(curs, 'Orders'):
+            # The database did not have tables yet, so we need to create them
+            create_tables(curs)
 
-        # TO STORE ORDERS ##############################################################################################
-        # Create the Orders table
-        curs.execute('''
-        CREATE TABLE Orders (
-        order_id TEXT PRIMARY KEY,
-        processed BOOLEAN,
-        error TEXT,
-        message TEXT,
-        clustered BOOLEAN
-        )
-        ''')
+        # Add the tables and columns introduced after the database was created by a previous version of the API
+        migrate_tables(curs)
 
-        # TO STORE MILP OUTPUTS ########################################################################################
-        # Create the General_MILP_Outputs, for single scalar values + the status of the MILP solution
-        curs.execute('''
-        CREATE TABLE General_MILP_Outputs (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        order_id TEXT,
-        objective_value REAL,
-        milp_status TEXT,
-        total_rec_cost REAL,
-        FOREIGN KEY(order_id) REFERENCES Orders(order_id)
-        )
-        ''')
+        # Create the indexes used to retrieve the results of an order;
+        # since these are only created if missing, this also migrates databases created by previous versions of the API
+        create_indexes(curs)
 
-        # Create the Meter_Costs, for outputs that are dependent on the meter ID but not time-varying
-        curs.execute('''
-        CREATE TABLE Member_Costs (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        order_id TEXT,
-        meter_id TEXT,
-        member_cost REAL,
-        member_cost_compensation REAL,
-        member_savings REAL,
-        FOREIGN KEY(order_id) REFERENCES Orders(order_id)
-        )
-        ''')
+    return db
 
-        # TO STORE Investments Outputs #################################################################################
-        # Create the Meter_Investment_Outputs
-        curs.execute('''
-        CREATE TABLE Meter_Investment_Outputs (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        order_id TEXT,
-        meter_id TEXT,
-        installation_cost REAL,
-        installation_cost_compensation REAL,
-        installation_savings REAL,
-        installed_pv REAL,
-        pv_investment_cost REAL,
-        installed_storage REAL,
-        storage_investment_cost REAL,
-        total_pv REAL,
-        total_storage REAL,
-        contracted_power REAL,
-        contracted_power_cost REAL,
-        retailer_exchange_costs REAL,
-        sc_tariffs_costs REAL,
-        FOREIGN KEY(order_id) REFERENCES Orders(order_id)
-        )
-        ''')
 
-        # TO STORE LEM Prices ##########################################################################################
-        # Create the Lem_Prices
-        curs.execute('''
-        CREATE TABLE Lem_Prices (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        order_id TEXT,
-        datetime TEXT,
-        value REAL,
-        FOREIGN KEY(order_id) REFERENCES Orders(order_id)
-        )
-        ''')
+# Time-varying results' tables, as {table: CREATE TABLE statement};
+# time is stored as the integer index of the 15' step within the order's horizon, which starts at the order's
+# "start_epoch" (for clustered orders, step // 96 is the cluster number and step % 96 the step within the day)
+TIME_VARYING_TABLES = {
+    # LEM prices
+    'Lem_Prices': '''
+    CREATE TABLE Lem_Prices (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    order_id TEXT,
+    step INTEGER,
+    value REAL,
+    FOREIGN KEY(order_id) REFERENCES Orders(order_id)
+    )
+    ''',
+    # (clustered) LEM prices
+    'Clustered_Lem_Prices': '''
+    CREATE TABLE Clustered_Lem_Prices (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    order_id TEXT,
+    step INTEGER,
+    cluster_weight INTEGER,
+    value REAL,
+    FOREIGN KEY(order_id) REFERENCES Orders(order_id)
+    )
+    ''',
+    # self-consumption tariffs
+    'Pool_Self_Consumption_Tariffs': '''
+    CREATE TABLE Pool_Self_Consumption_Tariffs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    order_id TEXT,
+    step INTEGER,
+    self_consumption_tariff REAL,
+    FOREIGN KEY(order_id) REFERENCES Orders(order_id)
+    )
+    ''',
+    # (clustered) self-consumption tariffs
+    'Clustered_Pool_Self_Consumption_Tariffs': '''
+    CREATE TABLE Clustered_Pool_Self_Consumption_Tariffs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    order_id TEXT,
+    step INTEGER,
+    cluster_weight INTEGER,
+    self_consumption_tariff REAL,
+    FOREIGN KEY(order_id) REFERENCES Orders(order_id)
+    )
+    ''',
+    # meter-dependent, time-varying inputs used to feed the MILP
+    'Meter_Operation_Inputs': '''
+    CREATE TABLE Meter_Operation_Inputs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    order_id TEXT,
+    meter_id TEXT,
+    step INTEGER,
+    energy_generated REAL,
+    energy_consumed REAL,
+    buy_tariff REAL,
+    sell_tariff REAL,
+    FOREIGN KEY(order_id) REFERENCES Orders(order_id)
+    )
+    ''',
+    # (clustered) meter-dependent, time-varying inputs used to feed the MILP
+    'Clustered_Meter_Operation_Inputs': '''
+    CREATE TABLE Clustered_Meter_Operation_Inputs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    order_id TEXT,
+    meter_id TEXT,
+    step INTEGER,
+    cluster_weight INTEGER,
+    energy_generated REAL,
+    energy_consumed REAL,
+    buy_tariff REAL,
+    sell_tariff REAL,
+    FOREIGN KEY(order_id) REFERENCES Orders(order_id)
+    )
+    ''',
+    # meter-dependent, time-varying outputs from the MILP
+    'Meter_Operation_Outputs': '''
+    CREATE TABLE Meter_Operation_Outputs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    order_id TEXT,
+    meter_id TEXT,
+    step INTEGER,
+    energy_surplus REAL,
+    energy_supplied REAL,
+    energy_purchased_lem REAL,
+    energy_sold_lem REAL,
+    net_load REAL,
+    bess_energy_charged REAL,
+    bess_energy_discharged REAL,
+    bess_energy_content REAL,
+    FOREIGN KEY(order_id) REFERENCES Orders(order_id)
+    )
+    ''',
+    # (clustered) meter-dependent, time-varying outputs from the MILP
+    'Clustered_Meter_Operation_Outputs': '''
+    CREATE TABLE Clustered_Meter_Operation_Outputs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    order_id TEXT,
+    meter_id TEXT,
+    step INTEGER,
+    cluster_weight INTEGER,
+    energy_surplus REAL,
+    energy_supplied REAL,
+    energy_purchased_lem REAL,
+    energy_sold_lem REAL,
+    net_load REAL,
+    bess_energy_charged REAL,
+    bess_energy_discharged REAL,
+    bess_energy_content REAL,
+    FOREIGN KEY(order_id) REFERENCES Orders(order_id)
+    )
+    '''
+}
 
-        # Create the (clustered) Lem_Prices
-        curs.execute('''
-        CREATE TABLE Clustered_Lem_Prices (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        order_id TEXT,
-        time TEXT,
-        cluster_nr INTEGER,
-        cluster_weight INTEGER,
-        value REAL,
-        FOREIGN KEY(order_id) REFERENCES Orders(order_id)
+
+def create_tables(curs: sqlite3.Cursor):
+    """
+    Create all the tables of a new database.
+    :param curs: cursor to the database
+    """
+    # TO STORE ORDERS ##################################################################################################
+    # Create the Orders table
+    curs.execute('''
+    CREATE TABLE Orders (
+    order_id TEXT PRIMARY KEY,
+    processed BOOLEAN,
+    error TEXT,
+    message TEXT,
+    clustered BOOLEAN
+    )
+    ''')
+
+    # TO STORE MILP OUTPUTS ############################################################################################
+    # Create the General_MILP_Outputs, for single scalar values + the status of the MILP solution
+    curs.execute('''
+    CREATE TABLE General_MILP_Outputs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    order_id TEXT,
+    objective_value REAL,
+    milp_status TEXT,
+    total_rec_cost REAL,
+    FOREIGN KEY(order_id) REFERENCES Orders(order_id)
+    )
+    ''')
+
+    # Create the Meter_Costs, for outputs that are dependent on the meter ID but not time-varying
+    curs.execute('''
+    CREATE TABLE Member_Costs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    order_id TEXT,
+    meter_id TEXT,
+    member_cost REAL,
+    member_cost_compensation REAL,
+    member_savings REAL,
+    FOREIGN KEY(order_id) REFERENCES Orders(order_id)
+    )
+    ''')
+
+    # TO STORE Investments Outputs #####################################################################################
+    # Create the Meter_Investment_Outputs
+    curs.execute('''
+    CREATE TABLE Meter_Investment_Outputs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    order_id TEXT,
+    meter_id TEXT,
+    installation_cost REAL,
+    installation_cost_compensation REAL,
+    installation_savings REAL,
+    installed_pv REAL,
+    pv_investment_cost REAL,
+    installed_storage REAL,
+    storage_investment_cost REAL,
+    total_pv REAL,
+    total_storage REAL,
+    contracted_power REAL,
+    contracted_power_cost REAL,
+    retailer_exchange_costs REAL,
+    sc_tariffs_costs REAL,
+    FOREIGN KEY(order_id) REFERENCES Orders(order_id)
+    )
+    ''')
+
+    # TO STORE LEM Prices, Self Consumption Tariffs and Meter Operation Inputs / Outputs ###############################
+    # Create the time-varying results' tables (regular and clustered)
+    for create_table_statement in TIME_VARYING_TABLES.values():
+        curs.execute(create_table_statement)
+
+
+def __table_columns(curs: sqlite3.Cursor, table: str) -> list[str]:
+    # (an empty list if the table does not exist)
+    curs.execute('SELECT name FROM sqlite_master WHERE type = ? AND name = ?', ('table', table))
+    if curs.fetchone() is None:
+        return []
+    return [row[1] for row in curs.execute(f'PRAGMA table_info({table})').fetchall()]
+
+
+def __migrate_to_integer_steps(curs: sqlite3.Cursor):
+    """
+    Rebuild the time-varying results' tables of databases created before time was stored as integer time steps.
+    """
+    for table in TIME_VARYING_TABLES:
+        curs.execute(f'ALTER TABLE {table} RENAME TO Legacy_{table}')
+
+    # the horizon of (non-clustered) orders starts at the first datetime of their LEM prices
+    curs.execute('''
+        UPDATE Orders
+        SET start_epoch = (
+            SELECT MIN(CAST(strftime('%s', datetime) AS INTEGER)) FROM Legacy_Lem_Prices
+            WHERE Legacy_Lem_Prices.order_id = Orders.order_id
         )
+        WHERE start_epoch IS NULL
+    ''')
+
+    for table, create_table_statement in TIME_VARYING_TABLES.items():
+        curs.execute(create_table_statement)
+        columns = [column for column in __table_columns(curs, table) if column not in ('id', 'step')]
+        if table.startswith('Clustered_'):
+            step = "legacy.cluster_nr * 96 + CAST(strftime('%s', '1970-01-01 ' || legacy.time) AS INTEGER) / 900"
+        else:
+            step = "(CAST(strftime('%s', legacy.datetime) AS INTEGER) - Orders.start_epoch) / 900"
+        curs.execute(f'''
+            INSERT INTO {table} ({', '.join(columns)}, step)
+            SELECT {', '.join(f'legacy.{column}' for column in columns)}, {step}
+            FROM Legacy_{table} AS legacy JOIN Orders ON Orders.order_id = legacy.order_id
+            ORDER BY legacy.id
         ''')
+        curs.execute(f'DROP TABLE Legacy_{table}')
+
+
+def migrate_tables(curs: sqlite3.Cursor):
+    """
+    Create the tables and add the columns that were introduced after the original database schema, if missing.
+    :param curs: cursor to the database
+    """
+    # TO STORE HOW THE ORDER'S TIME SERIES WERE STORED #################################################################
+    # ("rows" or "columnar"; orders stored before this column existed were stored as rows)
+    if 'storage_mode' not in __table_columns(curs, 'Orders'):
+        curs.execute("ALTER TABLE Orders ADD COLUMN storage_mode TEXT DEFAULT 'rows'")
+
+    # TO STORE THE START OF THE ORDER'S HORIZON ########################################################################
+    # (as a UNIX epoch, in seconds, from which the integer time steps of the time-varying results' tables are counted)
+    if 'start_epoch' not in __table_columns(curs, 'Orders'):
+        curs.execute('ALTER TABLE Orders ADD COLUMN start_epoch INTEGER')
+
+    # TO STORE WHEN THE ORDER WAS CREATED AND IF IT IS EXCLUDED FROM THE RETENTION POLICY ##############################
+    # (orders created before these columns existed are considered to have been created at the time of the migration)
+    if 'created_at' not in __table_columns(curs, 'Orders'):
+        curs.execute('ALTER TABLE Orders ADD COLUMN created_at INTEGER')
+        curs.execute('UPDATE Orders SET created_at = ?', (int(time.time()),))
+    if 'pinned' not in __table_columns(curs, 'Orders'):
+        curs.execute('ALTER TABLE Orders ADD COLUMN pinned BOOLEAN DEFAULT 0')
+
+    # CONVERT DATETIME / TIME TEXT COLUMNS TO INTEGER TIME STEPS #######################################################
+    if 'datetime' in __table_columns(curs, 'Lem_Prices'):
+        __migrate_to_integer_steps(curs)
+
+    # TO STORE TIME SERIES IN COLUMNAR MODE ############################################################################
+    # Create the Timeseries_Axes, with the time axis shared by all time series of an order:
+    # - for regular orders, the first datetime of the horizon, the time step (in minutes) and the number of steps;
+    # - for clustered orders, also the weight of each cluster (as a compressed blob)
+    curs.execute('''
+    CREATE TABLE IF NOT EXISTS Timeseries_Axes (
+    order_id TEXT PRIMARY KEY,
+    start_datetime TEXT,
+    step_minutes INTEGER,
+    nr_steps INTEGER,
+    cluster_weights BLOB,
+    FOREIGN KEY(order_id) REFERENCES Orders(order_id)
+    )
+    ''')
+
+    # Create the Timeseries_Blobs, with one compressed (nr. columns x nr. steps) array per results' table and meter ID
+    # (meter_id is an empty string for tables that do not depend on the meter ID)
+    curs.execute('''
+    CREATE TABLE IF NOT EXISTS Timeseries_Blobs (
+    order_id TEXT,
+    table_name TEXT,
+    meter_id TEXT,
+    columns TEXT,
+    encoding TEXT,
+    data BLOB,
+    PRIMARY KEY(order_id, table_name, meter_id),
+    FOREIGN KEY(order_id) REFERENCES Orders(order_id)
+    )
+    ''')
+
+    # TO STORE THE SUMMARIES OF THE ORDER'S RESULTS ####################################################################
+    # Create the Period_Aggregates, with the energy flows of the whole community and the statistics of the LEM prices
+    # per period (day and month, or representative day, for clustered orders), computed when the results are stored;
+    # first_step is the first time step of the period and nr_days the number of days it covers (or represents)
+    curs.execute(f'''
+    CREATE TABLE IF NOT EXISTS Period_Aggregates (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    order_id TEXT,
+    granularity TEXT,
+    period TEXT,
+    first_step INTEGER,
+    nr_days REAL,
+    {', '.join(f'{column} REAL' for column in (*SUMMARY_ENERGY_COLUMNS, *SUMMARY_PRICE_COLUMNS))},
+    FOREIGN KEY(order_id) REFERENCES Orders(order_id)
+    )
+    ''')
+
+    # Create the Meter_Period_Aggregates, with the energy flows of each meter ID per period
+    curs.execute(f'''
+    CREATE TABLE IF NOT EXISTS Meter_Period_Aggregates (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    order_id TEXT,
+    granularity TEXT,
+    period TEXT,
+    first_step INTEGER,
+    meter_id TEXT,
+    {', '.join(f'{column} REAL' for column in SUMMARY_ENERGY_COLUMNS)},
+    FOREIGN KEY(order_id) REFERENCES Orders(order_id)
+    )
+    ''')
+
+    # TO STORE THE DAY-TO-CLUSTER ASSIGNMENT OF CLUSTERED ORDERS #######################################################
+    # Create the Cluster_Assignments, with the representative day (cluster number) of each day of the horizon
+    # (counted from the order's "start_epoch"), from which clustered results are expanded to the full horizon
+    curs.execute('''
+    CREATE TABLE IF NOT EXISTS Cluster_Assignments (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    order_id TEXT,
+    day INTEGER,
+    cluster_nr INTEGER,
+    FOREIGN KEY(order_id) REFERENCES Orders(order_id)
+    )
+    ''')
+
+    # TO STORE THE DATA AVAILABILITY OF THE METERS #####################################################################
+    # Create the Meter_Data_Availability, with the number of 15' time steps of each (UTC) day that were checked for
+    # each meter ID of a dataset, and of those with measured data, as found whenever the meters' data is fetched from
+    # the dataspace (day is counted from the UNIX epoch); it is not related to any order, hence never expires
+    curs.execute('''
+    CREATE TABLE IF NOT EXISTS Meter_Data_Availability (
+    dataset_origin TEXT,
+    meter_id TEXT,
+    day INTEGER,
+    checked_steps INTEGER,
+    observed_steps INTEGER,
+    updated_at INTEGER,
+    PRIMARY KEY(dataset_origin, meter_id, day)
+    )
+    ''')
+
+
+# Indexes on the result tables, as {index name: (table, indexed columns)};
+# all results are retrieved (and deleted) by order ID, and time-varying ones are also ordered/filtered by meter ID and
+# time; orders are also searched by creation time, to enforce the retention policy
+RESULT_TABLE_INDEXES = {
+    'idx_orders_created_at': ('Orders', ('created_at',)),
+    'idx_general_milp_outputs_order': ('General_MILP_Outputs', ('order_id',)),
+    'idx_member_costs_order': ('Member_Costs', ('order_id', 'meter_id')),
+    'idx_meter_investment_outputs_order': ('Meter_Investment_Outputs', ('order_id', 'meter_id')),
+    'idx_lem_prices_order': ('Lem_Prices', ('order_id', 'step')),
+    'idx_clustered_lem_prices_order': ('Clustered_Lem_Prices', ('order_id', 'step')),
+    'idx_pool_sc_tariffs_order': ('Pool_Self_Consumption_Tariffs', ('order_id', 'step')),
+    'idx_clustered_pool_sc_tariffs_order': ('Clustered_Pool_Self_Consumption_Tariffs', ('order_id', 'step')),
+    'idx_meter_operation_inputs_order': ('Meter_Operation_Inputs', ('order_id', 'meter_id', 'step')),
+    'idx_clustered_meter_operation_inputs_order': ('Clustered_Meter_Operation_Inputs',
+                                                   ('order_id', 'meter_id', 'step')),
+    'idx_meter_operation_outputs_order': ('Meter_Operation_Outputs', ('order_id', 'meter_id', 'step')),
+    'idx_clustered_meter_operation_outputs_order': ('Clustered_Meter_Operation_Outputs',
+                                                    ('order_id', 'meter_id', 'step')),
+    'idx_period_aggregates_order': ('Period_Aggregates', ('order_id', 'granularity', 'first_step')),
+    'idx_meter_period_aggregates_order': ('Meter_Period_Aggregates',
+                                          ('order_id', 'granularity', 'meter_id', 'first_step')),
+    'idx_cluster_assignments_order': ('Cluster_Assignments', ('order_id', 'day')),
+    'idx_meter_data_availability_day': ('Meter_Data_Availability', ('dataset_origin', 'day')),
+}
+
+
+def create_indexes(curs: sqlite3.Cursor):
+    """
+    Create the (composite) indexes on the result tables, if they do not exist yet.
+    :param curs: cursor to the database
+    """
+    for index_name, (table, columns) in RESULT_TABLE_INDEXES.items():
+        curs.execute(f'CREATE INDEX IF NOT EXISTS {index_name} ON {table} ({", ".join(columns)})')
+
+
+# Tables with data of an order, from which all its rows are deleted when the order expires
+# (Orders is the last one, so that an order is only forgotten once all its results are deleted)
+ORDER_TABLES = ('General_MILP_Outputs', 'Member_Costs', 'Meter_Investment_Outputs', *TIME_VARYING_TABLES,
+                'Timeseries_Axes', 'Timeseries_Blobs', 'Period_Aggregates', 'Meter_Period_Aggregates',
+                'Cluster_Assignments', 'Orders')
+
+
+def expired_order_ids(db: ResultDatabase, created_before: int, limit: int) -> list[str]:
+    """
+    Find the (unpinned) orders created before a given time, oldest first.
+    :param db: access layer to the database
+    :param created_before: UNIX epoch, in seconds
+    :param limit: maximum number of order IDs to return
+    :return: list of order IDs
+    """
+    return [order_id for order_id, in db.reader().execute('''
+        SELECT order_id FROM Orders
+        WHERE NOT pinned AND created_at < ?
+        ORDER BY created_at LIMIT ?
+    ''', (created_before, limit))]
+
+
+def oldest_order_ids(db: ResultDatabase, limit: int) -> list[str]:
+    """
+    Find the oldest (unpinned) orders that were already processed.
+    :param db: access layer to the database
+    :param limit: maximum number of order IDs to return
+    :return: list of order IDs
+    """
+    return [order_id for order_id, in db.reader().execute('''
+        SELECT order_id FROM Orders
+        WHERE NOT pinned AND processed
+        ORDER BY created_at LIMIT ?
+    ''', (limit,))]
+
+
+def delete_orders(db: ResultDatabase, order_ids: list[str]):
+    """
+    Delete the orders provided, and all their results, within a single (short) transaction.
+    :param db: access layer to the database
+    :param order_ids: list of order IDs
+    """
+    placeholders = ', '.join('?' * len(order_ids))
+    with db.writer() as conn:
+        for table in ORDER_TABLES:
+            conn.execute(f'DELETE FROM {table} WHERE order_id IN ({placeholders})', order_ids)
+
+
+def __to_rounded_array(values, nr_steps: int, decimals: int = 3) -> np.ndarray:
+    # works for lists, arrays and dictionaries indexed by the time step
+    return np.round(np.fromiter((values[idx] for idx in range(nr_steps)), dtype=np.float64, count=nr_steps), decimals)
+
+
+def __time_major_columns(meter_ids: list[str], values_by_meter: list[dict], nr_steps: int) -> list[list]:
+    """
+    Build, for each time-varying variable, a column with the values of all meters, ordered by time step and then by
+    meter ID (i.e., in the same order in which the rows are inserted in the database).
+    :param meter_ids: ordered list of meter IDs
+    :param values_by_meter: list of dictionaries with the time series per meter ID, one per variable
+    :param nr_steps: number of time steps
+    :return: list of columns
+    """
+    return [
+        np.stack([__to_rounded_array(values[meter_id], nr_steps) for meter_id in meter_ids]).T.ravel().tolist()
+        for values in values_by_meter
+    ]
+
+
+def encode_timeseries(values: np.ndarray) -> (str, bytes):
+    """
+    Encode a (nr. columns x nr. steps) array as fixed-point integers with 3 decimal places (i.e., matching the rounding
+    applied to all stored time series), compressed with zlib.
+    :param values: array with the time series
+    :return: the encoding used and the encoded data
+    """
+    fixed_point = np.round(np.asarray(values, dtype=np.float64) * 1000)
+    dtype = '<i4' if np.abs(fixed_point).max(initial=0) < np.iinfo(np.int32).max else '<i8'
+    return f'{dtype}:1000:zlib', zlib.compress(fixed_point.astype(dtype).tobytes())
+
+
+def decode_timeseries(encoding: str, data: bytes, nr_columns: int) -> np.ndarray:
+    """
+    Decode a (nr. columns x nr. steps) array encoded with "encode_timeseries".
+    :param encoding: the encoding used
+    :param data: the encoded data
+    :param nr_columns: number of columns (i.e., of time series) in the array
+    :return: array with the time series
+    """
+    dtype, scale, compression = encoding.split(':')
+    if compression != 'zlib':
+        raise ValueError(f'unknown time series compression "{compression}"; expected "zlib"')
+    return np.frombuffer(zlib.decompress(data), dtype=dtype).reshape(nr_columns, -1) / int(scale)
+
+
+def encode_cluster_weights(cluster_weights: list[int]) -> bytes:
+    return zlib.compress(np.asarray(cluster_weights, dtype='<i4').tobytes())
+
+
+def decode_cluster_weights(data: bytes) -> np.ndarray:
+    return np.frombuffer(zlib.decompress(data), dtype='<i4')
+
 
-        # TO STORE Self Consumption Tariffs ############################################################################
-        # Create the Pool_Self_Consumption_Tariffs
+# Columns of the time series stored in columnar mode, per (logical) results' table
+TIMESERIES_COLUMNS = {
+    'lem_prices': ('value',),
+    'self_consumption_tariffs': ('self_consumption_tariff',),
+    'meter_operation_inputs': ('energy_generated', 'energy_consumed', 'buy_tariff', 'sell_tariff'),
+    'meter_operation_outputs': ('energy_surplus', 'energy_supplied', 'energy_purchased_lem', 'energy_sold_lem',
+                                'net_load', 'bess_energy_charged', 'bess_energy_discharged', 'bess_energy_content')
+}
+
+
+def __store_timeseries_blobs(curs: sqlite3.Cursor,
+                             id_order: str,
+                             meter_ids: list[str],
+                             series: dict[str, list],
+                             nr_steps: int,
+                             list_of_datetimes: list[str],
+                             cluster_weights: list[int] = None):
+    """
+    Store the time series of an order in columnar mode.
+    :param curs: cursor to the database
+    :param id_order: order ID
+    :param meter_ids: ordered list of meter IDs
+    :param series: per (logical) results' table, the list of time series (as a dictionary per meter ID, for tables
+        that depend on the meter ID), in the same order as in TIMESERIES_COLUMNS
+    :param nr_steps: number of time steps
+    :param list_of_datetimes: all datetimes (in string format) of the horizon
+    :param cluster_weights: weight of each cluster, for clustered orders
+    """
+    if cluster_weights is None:
         curs.execute('''
-        CREATE TABLE Pool_Self_Consumption_Tariffs (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        order_id TEXT,
-        datetime TEXT,
-        self_consumption_tariff REAL,
-        FOREIGN KEY(order_id) REFERENCES Orders(order_id)
-        )
-        ''')
+            INSERT INTO Timeseries_Axes (order_id, start_datetime, step_minutes, nr_steps, cluster_weights)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (id_order, list_of_datetimes[0], 15, nr_steps, None))
+    else:
+        curs.execute('''
+            INSERT INTO Timeseries_Axes (order_id, start_datetime, step_minutes, nr_steps, cluster_weights)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (id_order, None, 15, nr_steps, encode_cluster_weights(cluster_weights)))
+
+    blobs = []
+    for table_name, table_series in series.items():
+        columns = ','.join(TIMESERIES_COLUMNS[table_name])
+        if table_name.startswith('meter_'):
+            for meter_id in meter_ids:
+                values = np.stack([__to_rounded_array(variable[meter_id], nr_steps) for variable in table_series])
+                blobs.append((id_order, table_name, meter_id, columns, *encode_timeseries(values)))
+        else:
+            values = np.stack([__to_rounded_array(variable, nr_steps) for variable in table_series])
+            blobs.append((id_order, table_name, '', columns, *encode_timeseries(values)))
+
+    curs.executemany('''
+        INSERT INTO Timeseries_Blobs (order_id, table_name, meter_id, columns, encoding, data)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', blobs)
+
 
-        # Create the (clustered) Pool_Self_Consumption_Tariffs
+def __summary_periods(start_epoch: int, nr_steps: int, cluster_weights: list[int] = None) \
+        -> dict[str, tuple[np.ndarray, np.ndarray]]:
+    """
+    Split the horizon of an order into the periods over which its results are summarized.
+    :param start_epoch: start of the horizon, as a UNIX epoch, in seconds
+    :param nr_steps: number of (15') time steps
+    :param cluster_weights: weight of each cluster, for clustered orders
+    :return: per granularity, the label of the period of each time step and the number of days each time step covers
+        (for clustered orders, the only periods are the representative days, each standing for as many days as its
+        weight)
+    """
+    steps = np.arange(nr_steps)
+    if cluster_weights is not None:
+        clusters = steps // 96
+        return {'representative_day': (clusters.astype(str), np.asarray(cluster_weights)[clusters] / 96)}
+
+    datetimes = np.datetime64(start_epoch, 's') + steps * 900
+    return {
+        'day': (datetimes.astype('datetime64[D]').astype(str), np.full(nr_steps, 1 / 96)),
+        'month': (datetimes.astype('datetime64[M]').astype(str), np.full(nr_steps, 1 / 96))
+    }
+
+
+def __store_summaries(curs: sqlite3.Cursor,
+                      id_order: str,
+                      meter_ids: list[str],
+                      energies: np.ndarray,
+                      lem_prices: np.ndarray,
+                      periods: dict[str, tuple[np.ndarray, np.ndarray]]):
+    """
+    Aggregate, per period, the energy flows and LEM prices of an order, and store them in the Period_Aggregates and
+    Meter_Period_Aggregates tables.
+    :param curs: cursor to the database
+    :param id_order: order ID
+    :param meter_ids: ordered list of meter IDs
+    :param energies: (nr. columns x nr. meters x nr. steps) array, with the columns in SUMMARY_ENERGY_COLUMNS
+    :param lem_prices: (nr. steps) array with the LEM prices
+    :param periods: periods of the horizon, as returned by "__summary_periods"
+    """
+    period_rows, meter_rows = [], []
+    for granularity, (step_periods, step_days) in periods.items():
+        # the time steps of each period are contiguous
+        first_steps = np.flatnonzero(np.r_[True, step_periods[1:] != step_periods[:-1]])
+        nr_days = np.round(np.add.reduceat(step_days, first_steps), 2).tolist()
+        sums = np.round(np.add.reduceat(energies, first_steps, axis=2), 3)
+        totals = np.round(sums.sum(axis=1), 3)
+        for nr, prices in enumerate(np.split(lem_prices, first_steps[1:])):
+            period, first_step = str(step_periods[first_steps[nr]]), int(first_steps[nr])
+            price_statistics = [prices.mean(), *np.percentile(prices, list(SUMMARY_PRICE_PERCENTILES.values()))]
+            period_rows.append((id_order, granularity, period, first_step, nr_days[nr], *totals[:, nr].tolist(),
+                                *np.round(price_statistics, 3).tolist()))
+            meter_rows.extend((id_order, granularity, period, first_step, meter_id, *sums[:, meter_nr, nr].tolist())
+                              for meter_nr, meter_id in enumerate(meter_ids))
+
+    columns = (*SUMMARY_ENERGY_COLUMNS, *SUMMARY_PRICE_COLUMNS)
+    curs.executemany(f'''
+        INSERT INTO Period_Aggregates (order_id, granularity, period, first_step, nr_days, {', '.join(columns)})
+        VALUES (?, ?, ?, ?, ?, {', '.join('?' * len(columns))})
+    ''', period_rows)
+    curs.executemany(f'''
+        INSERT INTO Meter_Period_Aggregates (order_id, granularity, period, first_step, meter_id,
+            {', '.join(SUMMARY_ENERGY_COLUMNS)})
+        VALUES (?, ?, ?, ?, ?, {', '.join('?' * len(SUMMARY_ENERGY_COLUMNS))})
+    ''', meter_rows)
+
+
+def __stored_summary_series(curs: sqlite3.Cursor, id_order: str) \
+        -> (list[str], np.ndarray, np.ndarray, dict[str, tuple[np.ndarray, np.ndarray]]):
+    """
+    Read back, from either storage mode, the time series that are summarized, for orders stored without summaries
+    (i.e., before these were introduced).
+    :return: the meter IDs, energy flows, LEM prices and periods, as expected by "__store_summaries"
+    """
+    curs.execute('''
+        SELECT clustered, storage_mode, start_epoch FROM Orders WHERE order_id = ?
+    ''', (id_order,))
+    clustered, storage_mode, start_epoch = curs.fetchone()
+
+    if storage_mode == 'columnar':
         curs.execute('''
-        CREATE TABLE Clustered_Pool_Self_Consumption_Tariffs (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        order_id TEXT,
-        time TEXT,
-        cluster_nr INTEGER,
-        cluster_weight INTEGER,
-        self_consumption_tariff REAL,
-        FOREIGN KEY(order_id) REFERENCES Orders(order_id)
-        )
-        ''')
+            SELECT nr_steps, cluster_weights FROM Timeseries_Axes WHERE order_id = ?
+        ''', (id_order,))
+        nr_steps, cluster_weights = curs.fetchone()
+        if cluster_weights is not None:
+            cluster_weights = decode_cluster_weights(cluster_weights).tolist()
 
-        # Create the Meter_Operation_Inputs, for the meter-dependent, time-varying inputs used to feed the MILP
         curs.execute('''
-        CREATE TABLE Meter_Operation_Inputs (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        order_id TEXT,
-        meter_id TEXT,
-        datetime TEXT,
-        energy_generated REAL,
-        energy_consumed REAL,
-        buy_tariff REAL,
-        sell_tariff REAL,
-        FOREIGN KEY(order_id) REFERENCES Orders(order_id)
-        )
-        ''')
+            SELECT table_name, meter_id, columns, encoding, data FROM Timeseries_Blobs
+            WHERE order_id = ? AND table_name IN (?, ?)
+            ORDER BY table_name, meter_id
+        ''', (id_order, 'lem_prices', 'meter_operation_outputs'))
+        meter_ids, energies, lem_prices = [], [], None
+        for table_name, meter_id, columns, encoding, data in curs.fetchall():
+            columns = columns.split(',')
+            values = decode_timeseries(encoding, data, len(columns))
+            if table_name == 'lem_prices':
+                lem_prices = values[0]
+            else:
+                meter_ids.append(meter_id)
+                energies.append(values[[columns.index(column) for column in SUMMARY_ENERGY_COLUMNS]])
+        energies = np.stack(energies, axis=1)
+
+    else:
+        prefix = 'Clustered_' * bool(clustered)
+        curs.execute(f'''
+            SELECT {'cluster_weight, ' * bool(clustered)}value FROM {prefix}Lem_Prices WHERE order_id = ?
+            ORDER BY step
+        ''', (id_order,))
+        lem_prices = np.array(curs.fetchall(), dtype=np.float64)
+        nr_steps = len(lem_prices)
+        cluster_weights = lem_prices[::96, 0].astype(int).tolist() if clustered else None
+        lem_prices = lem_prices[:, -1]
+
+        curs.execute(f'''
+            SELECT meter_id, {', '.join(SUMMARY_ENERGY_COLUMNS)} FROM {prefix}Meter_Operation_Outputs
+            WHERE order_id = ?
+            ORDER BY meter_id, step
+        ''', (id_order,))
+        rows = curs.fetchall()
+        meter_ids = [row[0] for row in rows[::nr_steps]]
+        energies = np.array([row[1:] for row in rows], dtype=np.float64) \
+            .reshape(len(meter_ids), nr_steps, len(SUMMARY_ENERGY_COLUMNS)).transpose(2, 0, 1)
 
-        # Create the (clustered) Meter_Operation_Inputs, for the meter-dependent,
-        # time-varying inputs used to feed the MILP
+    return meter_ids, energies, lem_prices, __summary_periods(start_epoch, nr_steps, cluster_weights)
+
+
+def store_missing_summaries(db: ResultDatabase, id_order: str):
+    """
+    Compute and store the summaries of a (correctly processed) order, if they were not stored with its results.
+    :param db: access layer to the database
+    :param id_order: order ID
+    """
+    with db.writer() as conn:
+        curs = conn.cursor()
         curs.execute('''
-        CREATE TABLE Clustered_Meter_Operation_Inputs (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        order_id TEXT,
-        meter_id TEXT,
-        time TEXT,
-        cluster_nr INTEGER,
-        cluster_weight INTEGER,
-        energy_generated REAL,
-        energy_consumed REAL,
-        buy_tariff REAL,
-        sell_tariff REAL,
-        FOREIGN KEY(order_id) REFERENCES Orders(order_id)
-        )
-        ''')
+            SELECT COUNT(*) FROM Period_Aggregates WHERE order_id = ?
+        ''', (id_order,))
+        if curs.fetchone()[0]:
+            return
+        __store_summaries(curs, id_order, *__stored_summary_series(curs, id_order))
+
+
+def store_milp_results(db: ResultDatabase,
+                       id_order: str,
+                       meter_ids: set[str],
+                       member_meter_ids: list[str],
+                       inputs: dict,
+                       results: dict,
+                       results_pp: dict,
+                       list_of_datetimes: list[str],
+                       nr_clusters: int = 0,
+                       day_clusters: list[int] = None):
+    """
+    Persist the MILP inputs and outputs of an order in the database, with its time series stored as set in STORAGE_MODE,
+    and the summaries (daily and monthly aggregates) of its energy flows and LEM prices.
+    All rows are written with batched inserts, within a single transaction that also flags the order as processed.
+    :param db: access layer to the database
+    :param id_order: order ID
+    :param meter_ids: set of meter IDs of the order
+    :param member_meter_ids: meter IDs for which member costs are to be stored
+    :param inputs: structure used as input of the MILP
+    :param results: MILP outputs
+    :param results_pp: post-processed MILP outputs
+    :param list_of_datetimes: all datetimes (in string format) of the horizon
+    :param nr_clusters: number of representative days, if clustering was performed, 0 otherwise
+    :param day_clusters: if clustering was performed, the representative day (cluster number) of each day of the horizon
+    """
+    meter_ids = sorted(meter_ids)
+
+    with db.writer() as conn:
+        curs = conn.cursor()
 
-        # Create the Meter_Operation_Outputs, for the meter-dependent, time-varying outputs from the MILP
         curs.execute('''
-        CREATE TABLE Meter_Operation_Outputs (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        order_id TEXT,
-        meter_id TEXT,
-        datetime TEXT,
-        energy_surplus REAL,
-        energy_supplied REAL,
-        energy_purchased_lem REAL,
-        energy_sold_lem REAL,
-        net_load REAL,
-        bess_energy_charged REAL,
-        bess_energy_discharged REAL,
-        bess_energy_content REAL,
-        FOREIGN KEY(order_id) REFERENCES Orders(order_id)
-        )
-        ''')
+            INSERT INTO General_MILP_Outputs (order_id, objective_value, milp_status, total_rec_cost)
+            VALUES (?, ?, ?, ?)
+        ''', (
+            id_order,
+            round(results_pp['obj_value'], 2),
+            results['milp_status'],
+            round(results_pp['obj_value'], 2)
+        ))
+
+        curs.executemany('''
+            INSERT INTO Member_Costs (order_id, meter_id, member_cost, member_cost_compensation, member_savings)
+            VALUES (?, ?, ?, ?, ?)
+        ''', [(
+            id_order,
+            meter_id,
+            round(results_pp['member_cost'][meter_id], 2),
+            round(results_pp['member_cost_compensations'][meter_id], 2),
+            0
+        ) for meter_id in member_meter_ids])
+
+        curs.executemany('''
+            INSERT INTO Meter_Investment_Outputs (
+            order_id, meter_id, installation_cost, installation_cost_compensation, installation_savings, 
+            installed_pv, pv_investment_cost, installed_storage, storage_investment_cost, total_pv, total_storage, 
+            contracted_power, contracted_power_cost, retailer_exchange_costs, sc_tariffs_costs)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [(
+            id_order,
+            meter_id,
+            round(results_pp['installation_cost_compensations'][meter_id], 3),
+            round(results_pp['installation_cost_compensations'][meter_id], 3),
+            0,
+            round(results_pp['p_gn_new'][meter_id], 3),
+            round(results_pp['PV_investments_cost'][meter_id], 3),
+            round(results_pp['e_bn_new'][meter_id], 3),
+            round(results_pp['batteries_investments_cost'][meter_id], 3),
+            round(results_pp['p_gn_total'][meter_id], 3),
+            round(results_pp['e_bn_total'][meter_id], 3),
+            round(results_pp['p_cont'][meter_id], 3),
+            round(results_pp['contractedpower_cost'][meter_id], 3),
+            round(sum(results_pp['e_sup'][meter_id]), 3),
+            round(sum(results_pp['e_slc_pool'][meter_id]), 3)
+        ) for meter_id in meter_ids])
+
+        # time-varying inputs and outputs, per meter ID
+        meters = inputs['meters']
+        input_series = [
+            {meter_id: meters[meter_id][variable] for meter_id in meter_ids}
+            for variable in ('e_g_factor', 'e_c', 'l_buy', 'l_sell')
+        ]
+        output_series = [results_pp['e_sur'], results_pp['e_sup'], results_pp['e_pur_pool'],
+                         results_pp['e_sale_pool'], results['e_cmet'], results_pp['e_bc'], results_pp['e_bd'],
+                         results_pp['e_bat']]
+
+        nr_steps = nr_clusters * 96 if nr_clusters else len(list_of_datetimes)
+        start_epoch = int(pd.Timestamp(list_of_datetimes[0]).timestamp())
+        cluster_weights = [int(inputs['w_clustering'][nr * 96]) for nr in range(nr_clusters)] \
+            if nr_clusters else None
+
+        # summaries of the energy flows and LEM prices, per period
+        output_columns = TIMESERIES_COLUMNS['meter_operation_outputs']
+        energies = np.stack([
+            np.stack([__to_rounded_array(output_series[output_columns.index(column)][meter_id], nr_steps)
+                      for meter_id in meter_ids])
+            for column in SUMMARY_ENERGY_COLUMNS
+        ])
+        __store_summaries(curs, id_order, meter_ids, energies,
+                          __to_rounded_array(results_pp['dual_prices'], nr_steps),
+                          __summary_periods(start_epoch, nr_steps, cluster_weights))
+
+        if day_clusters is not None:
+            curs.executemany('''
+                INSERT INTO Cluster_Assignments (order_id, day, cluster_nr)
+                VALUES (?, ?, ?)
+            ''', [(id_order, day, int(cluster_nr)) for day, cluster_nr in enumerate(day_clusters)])
+
+        if STORAGE_MODE == 'columnar':
+            __store_timeseries_blobs(curs, id_order, meter_ids, {
+                'lem_prices': [results_pp['dual_prices']],
+                'self_consumption_tariffs': [inputs['l_grid']],
+                'meter_operation_inputs': input_series,
+                'meter_operation_outputs': output_series
+            }, nr_steps, list_of_datetimes, cluster_weights)
 
-        # Create the (clustered) Meter_Operation_Outputs, for the meter-dependent, time-varying outputs from the MILP
+        else:
+            # time is stored as the integer step within the horizon; for clustered orders, each step also carries
+            # the weight of its representative day
+            steps = list(range(nr_steps))
+            if nr_clusters:
+                prefix = 'Clustered_'
+                step_columns = 'step, cluster_weight'
+                step_identifiers = [steps, [int(inputs['w_clustering'][idx]) for idx in range(nr_steps)]]
+            else:
+                prefix = ''
+                step_columns = 'step'
+                step_identifiers = [steps]
+            # identifiers of each row of the meters' tables, ordered by time step and then by meter ID
+            nr_meters = len(meter_ids)
+            meter_identifiers = [np.tile(meter_ids, nr_steps).tolist()] + \
+                [np.repeat(identifiers, nr_meters).tolist() for identifiers in step_identifiers]
+            placeholders = ', '.join('?' * len(step_identifiers))
+
+            curs.executemany(f'''
+                INSERT INTO {prefix}Lem_Prices (order_id, {step_columns}, value)
+                VALUES (?, {placeholders}, ?)
+            ''', zip(itertools.repeat(id_order), *step_identifiers,
+                     __to_rounded_array(results_pp['dual_prices'], nr_steps).tolist()))
+
+            curs.executemany(f'''
+                INSERT INTO {prefix}Pool_Self_Consumption_Tariffs (order_id, {step_columns}, self_consumption_tariff)
+                VALUES (?, {placeholders}, ?)
+            ''', zip(itertools.repeat(id_order), *step_identifiers,
+                     __to_rounded_array(inputs['l_grid'], nr_steps).tolist()))
+
+            # todo: energy_generated é, na verdade,e_g_factor
+            curs.executemany(f'''
+                INSERT INTO {prefix}Meter_Operation_Inputs (order_id, meter_id, {step_columns}, energy_generated, 
+                    energy_consumed, buy_tariff, sell_tariff)
+                VALUES (?, ?, {placeholders}, ?, ?, ?, ?)
+            ''', zip(itertools.repeat(id_order), *meter_identifiers,
+                     *__time_major_columns(meter_ids, input_series, nr_steps)))
+
+            curs.executemany(f'''
+                INSERT INTO {prefix}Meter_Operation_Outputs (order_id, meter_id, {step_columns}, energy_surplus, 
+                    energy_supplied, energy_purchased_lem, energy_sold_lem, net_load, 
+                    bess_energy_charged, bess_energy_discharged, bess_energy_content)
+                VALUES (?, ?, {placeholders}, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', zip(itertools.repeat(id_order), *meter_identifiers,
+                     *__time_major_columns(meter_ids, output_series, nr_steps)))
+
+        # only flag the order as processed once all its results are written
         curs.execute('''
-        CREATE TABLE Clustered_Meter_Operation_Outputs (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        order_id TEXT,
-        meter_id TEXT,
-        time TEXT,
-        cluster_nr INTEGER,
-        cluster_weight INTEGER,
-        energy_surplus REAL,
-        energy_supplied REAL,
-        energy_purchased_lem REAL,
-        energy_sold_lem REAL,
-        net_load REAL,
-        bess_energy_charged REAL,
-        bess_energy_discharged REAL,
-        bess_energy_content REAL,
-        FOREIGN KEY(order_id) REFERENCES Orders(order_id)
-        )
-        ''')
+            UPDATE Orders
+            SET processed = ?, storage_mode = ?, start_epoch = ?
+            WHERE order_id = ?
+        ''', (True, STORAGE_MODE, start_epoch, id_order))
+
+
+def epoch_days(datetimes: pd.DatetimeIndex) -> np.ndarray:
+    """
+    (UTC) day of each datetime, counted from the UNIX epoch, as used by the data availability index.
+    """
+    return np.asarray((datetimes.floor('D') - pd.Timestamp(0, tz='UTC')) // pd.Timedelta(days=1), dtype=np.int64)
+
+
+def store_data_availability(db: ResultDatabase, dataset_origin: str, availability: dict[str, pd.DataFrame]):
+    """
+    Update the data availability index with the availability found when fetching the meters' data from the dataspace.
+    The availability of a day is only replaced if at least as many of its time steps were checked now as before
+    (e.g., a day fully checked by a previous order is not replaced by the few hours of it checked by a later one).
+    :param db: access layer to the database
+    :param dataset_origin: dataset from which the data was fetched ("SEL" or "INDATA")
+    :param availability: per meter ID, a DataFrame indexed by day with the "checked_steps" and "observed_steps"
+    """
+    updated_at = int(time.time())
+    with db.writer() as conn:
+        curs = conn.cursor()
+        for meter_id, days in availability.items():
+            if days.empty:
+                continue
+            curs.execute('''
+                SELECT day, checked_steps FROM Meter_Data_Availability
+                WHERE dataset_origin = ? AND meter_id = ? AND day BETWEEN ? AND ?
+            ''', (dataset_origin, meter_id, int(days.index.min()), int(days.index.max())))
+            previously_checked = pd.Series(dict(curs.fetchall()), dtype=np.float64)
+            days = days[days['checked_steps'] >= previously_checked.reindex(days.index).fillna(0)]
+            curs.executemany('''
+                DELETE FROM Meter_Data_Availability WHERE dataset_origin = ? AND meter_id = ? AND day = ?
+            ''', [(dataset_origin, meter_id, int(day)) for day in days.index])
+            curs.executemany('''
+                INSERT INTO Meter_Data_Availability (dataset_origin, meter_id, day, checked_steps, observed_steps,
+                    updated_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', [(dataset_origin, meter_id, int(day), int(checked), int(observed), updated_at)
+                  for day, checked, observed in zip(days.index, days['checked_steps'], days['observed_steps'])])
+
+
+def meter_data_coverage(db: ResultDatabase,
+                        dataset_origin: str,
+                        meter_ids: list[str],
+                        horizon: pd.DatetimeIndex) -> pd.DataFrame:
+    """
+    Estimate, from the data availability index only, the share of the 15' time steps of a horizon with measured data,
+    for each meter ID. The share observed on each indexed day is applied to the day's time steps within the horizon;
+    days not indexed are left out of the estimate.
+    :param db: access layer to the database
+    :param dataset_origin: dataset of the meter IDs ("SEL" or "INDATA")
+    :param meter_ids: list of meter IDs
+    :param horizon: the (UTC) time steps of the horizon
+    :return: DataFrame indexed by meter ID with the estimated "coverage" (NaN if no day of the horizon is indexed)
+        and the share of the horizon's time steps on indexed days ("indexed")
+    """
+    if horizon.empty:
+        return pd.DataFrame({'coverage': np.nan, 'indexed': 0.0}, index=pd.Index(meter_ids, name='meter_id'))
+    horizon_days = pd.Series(epoch_days(horizon)).value_counts()
+    rows = db.reader().execute('''
+        SELECT meter_id, day, checked_steps, observed_steps FROM Meter_Data_Availability
+        WHERE dataset_origin = ? AND day BETWEEN ? AND ?
+    ''', (dataset_origin, int(horizon_days.index.min()), int(horizon_days.index.max()))).fetchall()
+    indexed = pd.DataFrame(rows, columns=['meter_id', 'day', 'checked_steps', 'observed_steps'])
+    indexed = indexed[indexed['meter_id'].isin(meter_ids) & (indexed['checked_steps'] > 0)]
 
-    return conn, curs
+    # time steps of the horizon on each indexed day, and those estimated to have measured data
+    indexed['horizon_steps'] = indexed['day'].map(horizon_days).fillna(0)
+    indexed['observed_steps'] *= indexed['horizon_steps'] / indexed['checked_steps']
+    per_meter = indexed.groupby('meter_id')[['horizon_steps', 'observed_steps']].sum().reindex(meter_ids, fill_value=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        coverage = per_meter['observed_steps'] / per_meter['horizon_steps'].where(per_meter['horizon_steps'] > 0)
+    return pd.DataFrame({'coverage': coverage, 'indexed': per_meter['horizon_steps'] / len(horizon)})
@@ -1,12 +1,11 @@
 import itertools
 import json
 import numpy as np
-import os
 import pandas as pd
-import pickle
 import pytz
 import requests
 
+from concurrent.futures import ThreadPoolExecutor
 from copy import deepcopy
 from datetime import timedelta
 from dotenv import dotenv_values
@@ -14,7 +13,11 @@ from loguru import logger
 from tsg_client.controllers import TSGController
 from typing import Union
 
-from helpers.calculate_circle import haversine
+from helpers.database_backends import ResultDatabase
+from helpers.database_interactions import (
+	epoch_days,
+	meter_data_coverage
+)
 from helpers.indata_shelly_info import INDATA_SHELLY_INFO
 from helpers.meter_locations import (
 	INDATA_LOCATION_INFO,
@@ -22,6 +25,7 @@ from helpers.meter_locations import (
 	SEL_LOCATION_INFO,
 	SEL_LOCATIONS
 )
+from helpers.meter_location_index import MeterLocationIndex
 from helpers.meter_installed_pv import (
 	INDATA_PV_INFO,
 	SEL_PV_INFO
@@ -32,42 +36,138 @@ from helpers.meter_tariff_cycles import (
 )
 from helpers.pvgis_interactions import fetch_pvgis
 from helpers.sel_shelly_info import SEL_SHELLY_INFO
+from helpers.tariff_engine import (
+	get_sell_tariffs,
+	get_tariffs
+)
 from schemas.input_schemas import (
 	MeterByArea,
+	MeterByAreas,
+	NearestMeters,
 	SizingInputs,
 	SizingInputsWithShared)
-from schemas.output_schemas import MeterIDs
+from schemas.output_schemas import (
+	MeterCoverage,
+	MeterIDs,
+	MeterIDsWithCoverage,
+	MeterIDsByArea,
+	NearbyMeter,
+	NearestMeterIDs
+)
+
 
+# Pool of threads where PVGIS requests are performed, concurrently with the requests to the dataspace
+PVGIS_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix='pvgis')
 
-def fetch_meters_location(meter_by_area: MeterByArea) -> MeterIDs:
+# Spatial indices over the locations of the meters of each dataset, built once (when the API is started)
+LOCATION_INDICES = {
+	'SEL': MeterLocationIndex(SEL_LOCATIONS),
+	'INDATA': MeterLocationIndex(INDATA_LOCATIONS)
+}
+
+
+def fetch_meters_location(meter_by_area: MeterByArea, db: ResultDatabase = None) \
+		-> Union[MeterIDs, MeterIDsWithCoverage]:
 	"""
 	Function that evaluates which meter IDs from either INDATA or SEL, belong within a certain radius.
 	By providing a geographical point, characterized by latitude and longitude coordinates, and a radius in km,
 	this function returns to the user the meter IDs whose coordinates fall within the circle formed by those parameters.
+	If a horizon is provided, the meter IDs are also annotated with their data coverage for it (and, optionally,
+	filtered by it), as estimated from the local data availability index; the dataspace is not queried.
 	:param meter_by_area: structure with the coordinates and radius provided by the user
-	:return: a list with the meter IDs found
+	:param db: access layer to the database with the data availability index (required if a horizon is provided)
+	:return: a list with the meter IDs found (and their data coverage, if a horizon is provided)
 	"""
-	rec_location = (meter_by_area.rec_location.latitude, meter_by_area.rec_location.longitude)
-	radius = meter_by_area.radius
+	# check which database to use
+	location_index = LOCATION_INDICES.get(meter_by_area.dataset_origin)
+	if location_index is None:
+		raise ValueError('unknown database passed; valid values: ["SEL", "INDATA"]')
 
+	found_meters = location_index.within_circle(float(meter_by_area.rec_location.latitude),
+												float(meter_by_area.rec_location.longitude),
+												meter_by_area.radius)
+
+	if meter_by_area.start_datetime is None:
+		return MeterIDs(meter_ids=found_meters)
+
+	# time steps of the horizon (both ends included), as in the time series of a sizing with the same horizon
+	horizon = pd.date_range(meter_by_area.start_datetime, meter_by_area.end_datetime, freq='15T')
+	coverage = meter_data_coverage(db, meter_by_area.dataset_origin.value, found_meters, horizon)
+	if meter_by_area.min_coverage is not None:
+		# meter IDs whose coverage is not known (NaN) are kept
+		coverage = coverage[~(coverage['coverage'] < meter_by_area.min_coverage)]
+
+	return MeterIDsWithCoverage(
+		meter_ids=list(coverage.index),
+		coverage=[MeterCoverage(meter_id=meter_id,
+								coverage=None if np.isnan(meter_coverage) else round(meter_coverage, 4),
+								indexed=round(indexed, 4))
+				  for meter_id, (meter_coverage, indexed) in coverage[['coverage', 'indexed']].iterrows()]
+	)
+
+
+def fetch_meters_in_areas(meter_by_areas: MeterByAreas) -> MeterIDsByArea:
+	"""
+	Function that evaluates which meter IDs from either INDATA or SEL, belong within each of many circles and polygons.
+	All shapes are searched in the (shared) spatial index of the dataset; the circles are queried all at once.
+	:param meter_by_areas: structure with the circles and polygons provided by the user
+	:return: the meter IDs found within each circle and each polygon
+	"""
 	# check which database to use
-	if meter_by_area.dataset_origin == 'SEL':
-		locations = SEL_LOCATIONS
-	elif meter_by_area.dataset_origin == 'INDATA':
-		locations = INDATA_LOCATIONS
-	else:
+	location_index = LOCATION_INDICES.get(meter_by_areas.dataset_origin)
+	if location_index is None:
 		raise ValueError('unknown database passed; valid values: ["SEL", "INDATA"]')
 
-	found_meters = [
-		meter_id for meter_id, location in locations.items()
-		if haversine(rec_location, tuple(location)) <= radius
+	circles = location_index.within_circles(
+		[(float(circle.center.latitude), float(circle.center.longitude)) for circle in meter_by_areas.circles],
+		[circle.radius for circle in meter_by_areas.circles]
+	)
+	polygons = [
+		location_index.within_polygon([(float(vertex.latitude), float(vertex.longitude)) for vertex in polygon.vertices])
+		for polygon in meter_by_areas.polygons
 	]
 
-	return MeterIDs(meter_ids=found_meters)
+	return MeterIDsByArea(circles=[MeterIDs(meter_ids=found_meters) for found_meters in circles],
+						  polygons=[MeterIDs(meter_ids=found_meters) for found_meters in polygons])
+
+
+def fetch_nearest_meters(nearest_meters: NearestMeters) -> NearestMeterIDs:
+	"""
+	Function that finds the meter IDs from either INDATA or SEL closest to a geographical point, characterized by
+	latitude and longitude coordinates, optionally up to a maximum distance, by querying the dataset's spatial index.
+	:param nearest_meters: structure with the coordinates and number of meters provided by the user
+	:return: the meter IDs found, with their distances in km, from the closest to the farthest
+	"""
+	# check which database to use
+	location_index = LOCATION_INDICES.get(nearest_meters.dataset_origin)
+	if location_index is None:
+		raise ValueError('unknown database passed; valid values: ["SEL", "INDATA"]')
+
+	found_meters = location_index.nearest(float(nearest_meters.location.latitude),
+										  float(nearest_meters.location.longitude),
+										  nearest_meters.nr_meters,
+										  nearest_meters.max_distance)
+
+	return NearestMeterIDs(meters=[NearbyMeter(meter_id=meter_id, distance=distance)
+								   for meter_id, distance in found_meters])
+
+
+def data_availability(observed: pd.DatetimeIndex, horizon: pd.DatetimeIndex) -> pd.DataFrame:
+	"""
+	Count, per (UTC) day of a horizon, its 15' time steps and those with measured data, i.e., with at least one
+	measurement before any resampling or interpolation.
+	:param observed: datetimes of the measurements of a meter
+	:param horizon: the (UTC) time steps of the horizon
+	:return: a pandas DataFrame indexed by day (counted from the UNIX epoch), with the "checked_steps" and
+		"observed_steps" of each day
+	"""
+	is_observed = horizon.isin(observed.floor('15T'))
+	return pd.DataFrame({'day': epoch_days(horizon), 'is_observed': is_observed}) \
+		.groupby('day')['is_observed'].agg(checked_steps='size', observed_steps='sum')
 
 
 def fetch_dataspace(user_params: Union[SizingInputs, SizingInputsWithShared]) \
-		-> (pd.DataFrame, pd.Series, list[str], list[str], dict[str, list[str]]):
+		-> (pd.DataFrame, pd.Series, list[str], list[str], dict[str, list[str]], dict[str, pd.DataFrame]):
 	"""
 	Auxiliary function to fetch all necessary data to answer a "vanilla" request, from the dataspace.
 	Necessary data includes:
@@ -78,7 +178,8 @@ def fetch_dataspace(user_params: Union[SizingInputs, SizingInputsWithShared]) \
 		a pandas Series with the self-consumption tariffs applicable to the desired operation horizon,
 		a list of all datetimes (in string format) that comprise the horizon set by the user,
 		a list with all missing meter_id
-		and a dictionary listing all missing datetimes per meter ID
+		a dictionary listing all missing datetimes per meter ID
+		and a dictionary with the data availability of each meter ID per day, to update the availability index
 	"""
 	dataset_origin = user_params.dataset_origin
 	if dataset_origin == 'INDATA':
@@ -90,7 +191,7 @@ def fetch_dataspace(user_params: Union[SizingInputs, SizingInputsWithShared]) \
 
 
 def fetch_indata(user_params: Union[SizingInputs, SizingInputsWithShared]) \
-		-> (pd.DataFrame, pd.Series, list[str], list[str], dict[str, list[str]]):
+		-> (pd.DataFrame, pd.Series, list[str], list[str], dict[str, list[str]], dict[str, pd.DataFrame]):
 	"""
 	Auxiliary function specific for fetching INDATA data.
 	:param user_params: class with all parameters passed by the user
@@ -98,7 +199,8 @@ def fetch_indata(user_params: Union[SizingInputs, SizingInputsWithShared]) \
 		a pandas Series with the self-consumption tariffs applicable to the desired operation horizon,
 		a list of all datetimes (in string format) that comprise the horizon set by the user,
 		a list with all missing meter_id
-		and a dictionary listing all missing datetimes per meter ID
+		a dictionary listing all missing datetimes per meter ID
+		and a dictionary with the data availability of each meter ID per day, to update the availability index
 	"""
 	# load environment variables
 	config = dotenv_values('.env')
@@ -118,8 +220,9 @@ def fetch_indata(user_params: Union[SizingInputs, SizingInputsWithShared]) \
 		end_datetime = pytz.utc.localize(end_datetime)
 
 	# if there are meters without PV or shared meters, that will require estimated data for potential PV generation,
-	# fetch here all necessary data from PVGIS for the period desired
-	pvgis_df = fetch_pvgis(start_datetime, end_datetime, *INDATA_LOCATION_INFO)
+	# fetch here all necessary data from PVGIS for the period desired;
+	# PVGIS is queried in the background, while data is retrieved from the dataspace, and joined before parsing
+	pvgis_future = PVGIS_EXECUTOR.submit(fetch_pvgis, start_datetime, end_datetime, *INDATA_LOCATION_INFO)
 
 	# todo: function to truncate dates (end_datetime) to ensure that the horizon is a multiple of 24h;
 	#  if changes are made to start_datetime or end_datetime, log a warning;
@@ -129,6 +232,8 @@ def fetch_indata(user_params: Union[SizingInputs, SizingInputsWithShared]) \
 
 	# create a placeholder for the final dataframe to return
 	final_df = pd.DataFrame()
+	# placeholder for the datetimes of the measurements of each meter, before any resampling or interpolation
+	observed_datetimes = {}
 
 	####################################################################################################################
 	# Set up a connection to the dataspace through a dedicated TSG connector
@@ -246,12 +351,8 @@ def fetch_indata(user_params: Union[SizingInputs, SizingInputsWithShared]) \
 	# convert the current dataset to a pandas dataframe
 	dataset_df = pd.DataFrame(dataset)
 
-	# load the local file with buying and selling tariffs per tariff cycle
-	current_dir = os.path.dirname(os.path.abspath(__file__))
-	parent_dir = os.path.abspath(os.path.join(current_dir, os.pardir))
-	pkl_file_path = os.path.join(parent_dir, 'pickles', 'prices_and_tariffs.pkl')
-	with open(pkl_file_path, 'rb') as handle:
-		tariffs_df = pickle.load(handle)
+	# wait for the PV generation profiles from PVGIS
+	pvgis_df = pvgis_future.result()
 
 	# parse all data
 	logger.info('Parsing retrieved data...')
@@ -271,6 +372,7 @@ def fetch_indata(user_params: Union[SizingInputs, SizingInputsWithShared]) \
 			# filter by shelly_id
 			shelly_df = dataset_df[dataset_df['shelly_id'] == shelly_id].copy()
 			del shelly_df['shelly_id']
+			observed_datetimes[shelly_id] = shelly_df.index[shelly_df['value'].notna()]
 			# sort datetime index
 			shelly_df.sort_index(inplace=True)
 			# add boundary dates if their missing
@@ -317,9 +419,9 @@ def fetch_indata(user_params: Union[SizingInputs, SizingInputsWithShared]) \
 			# - check the tariff type of the shelly_id (one of "simples", "bi-horárias", "tri-horárias")
 			tariff_type = INDATA_TARIFF_CYCLES[shelly_id]
 			# add buy and sell tariffs information for the meter_id
-			energy_df['buy_tariff'] = tariffs_df[tariff_type].loc[start_datetime:end_datetime]
-			# - obtain sell tariffs by considering 25% of the buy tariffs for the same period
-			energy_df['sell_tariff'] = energy_df['buy_tariff'] * 0.25
+			energy_df['buy_tariff'] = get_tariffs(tariff_type, start_datetime, end_datetime)
+			# - obtain sell tariffs from the buy tariffs for the same period
+			energy_df['sell_tariff'] = get_sell_tariffs(energy_df['buy_tariff'])
 
 			# concatenate parsed dataframe to final dataframe
 			if final_df.empty:
@@ -339,9 +441,9 @@ def fetch_indata(user_params: Union[SizingInputs, SizingInputsWithShared]) \
 		# - check the tariff type for 'shared' IDs (one of "simples", "bi-horárias", "tri-horárias")
 		tariff_type = INDATA_TARIFF_CYCLES['shared']
 		# add buy and sell tariffs information for the meter_id
-		energy_df['buy_tariff'] = tariffs_df[tariff_type].loc[start_datetime:end_datetime]
-		# - obtain sell tariffs by considering 25% of the buy tariffs for the same period
-		energy_df['sell_tariff'] = energy_df['buy_tariff'] * 0.25
+		energy_df['buy_tariff'] = get_tariffs(tariff_type, start_datetime, end_datetime)
+		# - obtain sell tariffs from the buy tariffs for the same period
+		energy_df['sell_tariff'] = get_sell_tariffs(energy_df['buy_tariff'])
 
 		# concatenate parsed dataframe to final dataframe
 		if final_df.empty:
@@ -370,15 +472,21 @@ def fetch_indata(user_params: Union[SizingInputs, SizingInputsWithShared]) \
 		missing_dts = [dt for dt in datetime_range_str if dt not in meter_id_data.index]
 		missing_meter_id_dt[meter_id] = missing_dts
 
+	# check which time steps of each day had measured data, for each meter ID (including those missing from dataspace)
+	availability = {
+		meter_id: data_availability(observed_datetimes.get(meter_id, pd.DatetimeIndex([], tz='UTC')), datetime_range_dt)
+		for meter_id in meter_ids
+	}
+
 	# get the self-consumption grid tariffs for the respective operation horizon
-	sc_tariffs_df = tariffs_df['autoconsumo_simples'].loc[start_datetime:end_datetime]
+	sc_tariffs_df = get_tariffs('autoconsumo_simples', start_datetime, end_datetime)
 	sc_tariffs_df.name = 'l_grid'
 
-	return final_df, sc_tariffs_df, datetime_range_str, missing_meter_ids, missing_meter_id_dt
+	return final_df, sc_tariffs_df, datetime_range_str, missing_meter_ids, missing_meter_id_dt, availability
 
 
 def fetch_sel(user_params: Union[SizingInputs, SizingInputsWithShared]) \
-		-> (pd.DataFrame, pd.Series, list[str], list[str], dict[str, list[str]]):
+		-> (pd.DataFrame, pd.Series, list[str], list[str], dict[str, list[str]], dict[str, pd.DataFrame]):
 	"""
 	Auxiliary function specific for fetching SEL data.
 	:param user_params: class with all parameters passed by the user
@@ -386,7 +494,8 @@ def fetch_sel(user_params: Union[SizingInputs, SizingInputsWithShared]) \
 		a pandas Series with the self-consumption tariffs applicable to the desired operation horizon,
 		a list of all datetimes (in string format) that comprise the horizon set by the user,
 		a list with all missing meter_id
-		and a dictionary listing all missing datetimes per meter ID
+		a dictionary listing all missing datetimes per meter ID
+		and a dictionary with the data availability of each meter ID per day, to update the availability index
 	"""
 	# load environment variables
 	config = dotenv_values('.env')
@@ -405,8 +514,9 @@ def fetch_sel(user_params: Union[SizingInputs, SizingInputsWithShared]) \
 		end_datetime = pytz.utc.localize(end_datetime)
 
 	# if there are meters without PV or shared meters, that will require estimated data for potential PV generation,
-	# fetch here all necessary data from PVGIS for the period desired
-	pvgis_df = fetch_pvgis(start_datetime, end_datetime, *SEL_LOCATION_INFO)
+	# fetch here all necessary data from PVGIS for the period desired;
+	# PVGIS is queried in the background, while data is retrieved from the dataspace, and joined before parsing
+	pvgis_future = PVGIS_EXECUTOR.submit(fetch_pvgis, start_datetime, end_datetime, *SEL_LOCATION_INFO)
 
 	# todo: function to truncate dates (end_datetime) to ensure that the horizon is a multiple of 24h;
 	#  if changes are made to start_datetime or end_datetime, log a warning;
@@ -417,6 +527,8 @@ def fetch_sel(user_params: Union[SizingInputs, SizingInputsWithShared]) \
 
 	# create a placeholder for the final dataframe to return
 	final_df = pd.DataFrame()
+	# placeholder for the datetimes of the measurements of each meter, before any resampling or interpolation
+	observed_datetimes = {}
 
 	####################################################################################################################
 	# Set up a connection to the dataspace through a dedicated TSG connector
@@ -552,12 +664,8 @@ def fetch_sel(user_params: Union[SizingInputs, SizingInputsWithShared]) \
 	# convert the current dataset to a pandas dataframe
 	dataset_df = pd.DataFrame(dataset)
 
-	# load the local file with buying and selling tariffs per tariff cycle
-	current_dir = os.path.dirname(os.path.abspath(__file__))
-	parent_dir = os.path.abspath(os.path.join(current_dir, os.pardir))
-	pkl_file_path = os.path.join(parent_dir, 'pickles', 'prices_and_tariffs.pkl')
-	with open(pkl_file_path, 'rb') as handle:
-		tariffs_df = pickle.load(handle)
+	# wait for the PV generation profiles from PVGIS
+	pvgis_df = pvgis_future.result()
 
 	# CREATE A PARSED VERSION #################################################
 	logger.info('Parsing retrieved data...')
@@ -586,6 +694,7 @@ def fetch_sel(user_params: Union[SizingInputs, SizingInputsWithShared]) \
 			# filter by shelly_id
 			shelly_df = dataset_df[dataset_df['meter_id'] == shelly_id].copy()
 			del shelly_df['meter_id']
+			observed_datetimes[shelly_id] = shelly_df.index
 			# sort datetime index
 			shelly_df.sort_index(inplace=True)
 			# add boundary dates if their missing
@@ -623,9 +732,9 @@ def fetch_sel(user_params: Union[SizingInputs, SizingInputsWithShared]) \
 			# - check the tariff type of the shelly_id (one of "simples", "bi-horárias", "tri-horárias")
 			tariff_type = SEL_TARIFF_CYCLES[shelly_id]
 			# add buy and sell tariffs information for the meter_id
-			energy_df['buy_tariff'] = tariffs_df[tariff_type].loc[start_datetime:end_datetime]
-			# - obtain sell tariffs by considering 25% of the buy tariffs for the same period
-			energy_df['sell_tariff'] = energy_df['buy_tariff'] * 0.25
+			energy_df['buy_tariff'] = get_tariffs(tariff_type, start_datetime, end_datetime)
+			# - obtain sell tariffs from the buy tariffs for the same period
+			energy_df['sell_tariff'] = get_sell_tariffs(energy_df['buy_tariff'])
 
 			# concatenate parsed dataframe to final dataframe
 			if final_df.empty:
@@ -645,9 +754,9 @@ def fetch_sel(user_params: Union[SizingInputs, SizingInputsWithShared]) \
 		# - check the tariff type for 'shared' IDs (one of "simples", "bi-horárias", "tri-horárias")
 		tariff_type = SEL_TARIFF_CYCLES['shared']
 		# add buy and sell tariffs information for the meter_id
-		energy_df['buy_tariff'] = tariffs_df[tariff_type].loc[start_datetime:end_datetime]
-		# - obtain sell tariffs by considering 25% of the buy tariffs for the same period
-		energy_df['sell_tariff'] = energy_df['buy_tariff'] * 0.25
+		energy_df['buy_tariff'] = get_tariffs(tariff_type, start_datetime, end_datetime)
+		# - obtain sell tariffs from the buy tariffs for the same period
+		energy_df['sell_tariff'] = get_sell_tariffs(energy_df['buy_tariff'])
 
 		# concatenate parsed dataframe to final dataframe
 		if final_df.empty:
@@ -676,8 +785,14 @@ def fetch_sel(user_params: Union[SizingInputs, SizingInputsWithShared]) \
 		missing_dts = [dt for dt in datetime_range_str if dt not in meter_id_data.index]
 		missing_meter_id_dt[meter_id] = missing_dts
 
+	# check which time steps of each day had measured data, for each meter ID (including those missing from dataspace)
+	availability = {
+		meter_id: data_availability(observed_datetimes.get(meter_id, pd.DatetimeIndex([], tz='UTC')), datetime_range_dt)
+		for meter_id in meter_ids
+	}
+
 	# get the self-consumption grid tariffs for the respective operation horizon
-	sc_tariffs_df = tariffs_df['autoconsumo_simples'].loc[start_datetime:end_datetime]
+	sc_tariffs_df = get_tariffs('autoconsumo_simples', start_datetime, end_datetime)
 	sc_tariffs_df.name = 'l_grid'
 
-	return final_df, sc_tariffs_df, datetime_range_str, missing_meter_ids, missing_meter_id_dt
+	return final_df, sc_tariffs_df, datetime_range_str, missing_meter_ids, missing_meter_id_dt, availability
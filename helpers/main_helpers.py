@@ -1,8 +1,28 @@
+import itertools
+import numpy as np
+import operator
+import orjson
 import pandas as pd
 import secrets
 import sqlite3
-from typing import Union
+import time
+from loguru import logger
+from scipy.optimize import linear_sum_assignment
+from scipy.spatial.distance import cdist
+from typing import (
+	Iterator,
+	Union
+)
 
+from helpers.database_backends import ResultDatabase
+from helpers.database_interactions import (
+	SUMMARY_ENERGY_COLUMNS,
+	SUMMARY_PRICE_COLUMNS,
+	TIMESERIES_COLUMNS,
+	decode_cluster_weights,
+	decode_timeseries,
+	store_missing_summaries
+)
 from helpers.meter_contracted_powers import (
 	INDATA_CONTRACTED_POWERS,
 	SEL_CONTRACTED_POWERS
@@ -12,16 +32,30 @@ from helpers.meter_installed_pv import (
 	SEL_PV_INFO
 )
 from rec_sizing.custom_types.collective_milp_pool_types import BackpackCollectivePoolDict
+from schemas.enums import (
+	ResponseFormat,
+	SummaryGranularity
+)
 from schemas.input_schemas import (
+	DatetimeRetrievalParams,
+	ExpansionParams,
+	RetrievalParams,
 	SizingInputs,
 	SizingInputsWithShared
 )
 from schemas.output_schemas import (
 	ClusteredMILPOutputs,
-	MILPOutputs
+	MILPOutputs,
+	OrderSummary
 )
 
 
+# Time of the day of each 15' step (e.g., of the representative days of clustered orders)
+STEP_TIMES = list(map(str, pd.date_range(start=pd.Timestamp('00:00:00'),
+										 end=pd.Timestamp('23:45:00'),
+										 freq='15T').time))
+
+
 def generate_order_id() -> str:
 	"""
 	Return an unequivocal ID that identifies the request and can be used
@@ -129,6 +163,70 @@ def milp_inputs(user_params: Union[SizingInputs, SizingInputsWithShared],
 	return backpack
 
 
+def daily_profiles(inputs: BackpackCollectivePoolDict) -> np.ndarray:
+	"""
+	Stack the consumption and generation profiles of all meters, per day of the horizon, so that each day can later be
+	assigned to a representative day (clustering replaces the profiles of the inputs by those of the representative days)
+	:param inputs: structure used as input of the MILP
+	:return: (nr. days x (2 * nr. meters * 96)) array
+	"""
+	meters = inputs['meters']
+	profiles = np.array([meters[meter_id][variable] for meter_id in sorted(meters) for variable in ('e_c', 'e_g_factor')],
+						dtype=np.float64)
+	nr_days = profiles.shape[1] // 96
+	return profiles[:, :nr_days * 96].reshape(len(profiles), nr_days, 96).transpose(1, 0, 2).reshape(nr_days, -1)
+
+
+def cluster_assignment(day_profiles: np.ndarray, inputs: BackpackCollectivePoolDict, nr_clusters: int) -> list[int]:
+	"""
+	Assign each day of the horizon to the representative day (cluster) with the closest profiles. When the weights of
+	the clusters add up to the number of days, each cluster gets as many days as its weight (i.e., the assignment with
+	the smallest total distance that keeps the weights used by the MILP); otherwise, each day is assigned to its closest
+	cluster, and a warning is logged.
+	:param day_profiles: profiles of each day of the horizon, as returned by "daily_profiles" before clustering
+	:param inputs: structure used as input of the MILP, after clustering
+	:param nr_clusters: number of representative days
+	:return: the cluster number of each day of the horizon
+	"""
+	representative_profiles = daily_profiles(inputs)[:nr_clusters]
+	# (standardized, so that consumption and generation profiles weigh the same)
+	scale = day_profiles.std(axis=0)
+	scale[scale == 0] = 1
+	distances = cdist(day_profiles / scale, representative_profiles / scale, 'sqeuclidean')
+
+	weights = [int(inputs['w_clustering'][nr * 96]) for nr in range(nr_clusters)]
+	if sum(weights) != len(day_profiles):
+		logger.warning(f'The weights of the clusters add up to {sum(weights)}, instead of the {len(day_profiles)} days '
+					   f'of the horizon; each day is assigned to its closest cluster, regardless of the weights.')
+		return distances.argmin(axis=1).tolist()
+	clusters = np.repeat(np.arange(nr_clusters), weights)
+	_, assigned = linear_sum_assignment(distances[:, clusters])
+	return clusters[assigned].tolist()
+
+
+# Columns of the non time-varying results' tables, as returned in the responses
+SCALAR_COLUMNS = {
+	'General_MILP_Outputs': ('objective_value', 'milp_status', 'total_rec_cost'),
+	'Member_Costs': ('meter_id', 'member_cost', 'member_cost_compensation', 'member_savings'),
+	'Meter_Investment_Outputs': (
+		'meter_id', 'installation_cost', 'installation_cost_compensation', 'installation_savings', 'installed_pv',
+		'pv_investment_cost', 'installed_storage', 'storage_investment_cost', 'total_pv', 'total_storage',
+		'contracted_power', 'contracted_power_cost', 'retailer_exchange_costs', 'sc_tariffs_costs')
+}
+
+
+def __scalar_records(cursor: sqlite3.Cursor, order_id: str, table: str) -> list[dict]:
+	"""
+	Fetch the rows of a non time-varying results' table of an order, straight into records, with the columns (and in
+	the order) they are returned.
+	"""
+	columns = SCALAR_COLUMNS[table]
+	cursor.execute(f'''
+		SELECT {', '.join(columns)} FROM {table} WHERE order_id = ? ORDER BY id
+	''', (order_id,))
+	return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
 def __common_milp_return_structure(cursor, order_id):
 	"""
 	Common output structure generation, for both clustered and non-clustered outputs.
@@ -140,71 +238,73 @@ def __common_milp_return_structure(cursor, order_id):
 
 	# GENERAL MILP OUTPUTS #############################################################################################
 	# Retrieve the general MILP outputs calculated for the order ID
-	cursor.execute('''
-			SELECT * FROM General_MILP_Outputs WHERE order_id = ?
-		''', (order_id,))
-	general_milp_outputs = cursor.fetchall()
+	milp_return.update(__scalar_records(cursor, order_id, 'General_MILP_Outputs')[0])
 
-	# Convert to dataframe for easy manipulation
-	general_milp_outputs_df = pd.DataFrame(general_milp_outputs)
-	general_milp_outputs_df.columns = ['index', 'order_id', 'objective_value', 'milp_status', 'total_rec_cost']
-	del general_milp_outputs_df['index']
-	del general_milp_outputs_df['order_id']
+	# INDIVIDUAL COSTS #################################################################################################
+	# Retrieve the individual costs calculated for the order ID
+	milp_return['member_costs'] = __scalar_records(cursor, order_id, 'Member_Costs')
 
-	# Create final dictionary substructure
-	general_milp_outputs_dict = general_milp_outputs_df.to_dict('records')[0]
+	# Meter Investments Outputs ########################################################################################
+	# Retrieve the investments calculated for the order ID
+	milp_return['meter_investment_outputs'] = __scalar_records(cursor, order_id, 'Meter_Investment_Outputs')
 
-	# Update the return dictionary
-	milp_return.update(general_milp_outputs_dict)
+	return milp_return
 
-	# INDIVIDUAL COSTS #################################################################################################
-	# Retrieve the individual costs calculated for the order ID
+
+def __columnar_identifiers(cursor: sqlite3.Cursor, order_id: str) -> dict[str, list]:
+	"""
+	Build the identifiers of each time step (datetime, or time, cluster number and weight, for clustered orders)
+	of an order whose time series were stored in columnar mode.
+	"""
 	cursor.execute('''
-			SELECT * FROM Member_Costs WHERE order_id = ?
-		''', (order_id,))
-	member_costs = cursor.fetchall()
-
-	# Convert to dataframe for easy manipulation
-	member_costs_df = pd.DataFrame(member_costs)
-	member_costs_df.columns = [
-		'index', 'order_id', 'meter_id', 'member_cost', 'member_cost_compensation', 'member_savings'
-	]
-	del member_costs_df['index']
-	del member_costs_df['order_id']
-
-	# Create final dictionary substructure
-	member_costs_outputs_dict = {
-		'member_costs': member_costs_df.to_dict('records')
-	}
+		SELECT start_datetime, step_minutes, nr_steps, cluster_weights FROM Timeseries_Axes WHERE order_id = ?
+	''', (order_id,))
+	start_datetime, step_minutes, nr_steps, cluster_weights = cursor.fetchone()
 
-	# Update the return dictionary
-	milp_return.update(member_costs_outputs_dict)
+	if cluster_weights is None:
+		datetimes = pd.date_range(start=start_datetime, periods=nr_steps, freq=f'{step_minutes}T')
+		return {
+			'datetime': list(datetimes.strftime('%Y-%m-%dT%H:%M:%SZ'))
+		}
 
-	# Meter Investments Outputs ########################################################################################
-	# Retrieve the individual costs calculated for the order ID
-	cursor.execute('''
-			SELECT * FROM Meter_Investment_Outputs WHERE order_id = ?
-		''', (order_id,))
-	meter_investment_outputs = cursor.fetchall()
-
-	# Convert to dataframe for easy manipulation
-	meter_investment_outputs_df = pd.DataFrame(meter_investment_outputs)
-	meter_investment_outputs_df.columns = [
-		'index', 'order_id', 'meter_id', 'installation_cost', 'installation_cost_compensation', 'installation_savings',
-		'installed_pv', 'pv_investment_cost', 'installed_storage', 'storage_investment_cost', 'total_pv',
-		'total_storage', 'contracted_power', 'contracted_power_cost', 'retailer_exchange_costs', 'sc_tariffs_costs']
-	del meter_investment_outputs_df['index']
-	del meter_investment_outputs_df['order_id']
-
-	# Create final dictionary substructure
-	meter_investment_outputs_dict = {
-		'meter_investment_outputs': meter_investment_outputs_df.to_dict('records')
+	steps_per_day = 24 * 60 // step_minutes
+	times = np.array(list(map(str, pd.date_range(start=pd.Timestamp('00:00:00'),
+												 periods=steps_per_day,
+												 freq=f'{step_minutes}T').time)))
+	steps = np.arange(nr_steps)
+	cluster_nrs = steps // steps_per_day
+	return {
+		'time': times[steps % steps_per_day].tolist(),
+		'cluster_nr': cluster_nrs.tolist(),
+		'cluster_weight': decode_cluster_weights(cluster_weights)[cluster_nrs].tolist()
 	}
 
-	# Update the return dictionary
-	milp_return.update(meter_investment_outputs_dict)
 
-	return milp_return
+def __columnar_records(identifiers: dict[str, list],
+					   meter_id: str,
+					   columns: str,
+					   encoding: str,
+					   data: bytes,
+					   fields: list[str] = None,
+					   steps: slice = slice(None)) -> Iterator[dict]:
+	"""
+	Decode the time series of a results' table (and meter ID) stored in columnar mode
+	and convert them to the same records as in "rows" mode.
+	Optionally, only the given fields and time steps (the same as those of the identifiers provided) are kept.
+	"""
+	columns = columns.split(',')
+	values = decode_timeseries(encoding, data, len(columns))
+	if fields is not None:
+		values = values[[columns.index(field) for field in fields]]
+		columns = fields
+	values = values[:, steps]
+	if meter_id:
+		keys = ['meter_id', *identifiers.keys(), *columns]
+		rows = zip(itertools.repeat(meter_id), *identifiers.values(), *values.tolist())
+	else:
+		keys = [*identifiers.keys(), *columns]
+		rows = zip(*identifiers.values(), *values.tolist())
+	return (dict(zip(keys, row)) for row in rows)
 
 
 def milp_return_structure(cursor: sqlite3.Cursor,
@@ -219,194 +319,571 @@ def milp_return_structure(cursor: sqlite3.Cursor,
 	# Get non time-varying output structure:
 	milp_return = __common_milp_return_structure(cursor, order_id)
 
-	# METER INPUTS #####################################################################################################
-	# Retrieve the meter inputs used in the order ID
-	cursor.execute('''
-		SELECT * FROM Meter_Operation_Inputs WHERE order_id = ?
-	''', (order_id,))
-	meter_inputs = cursor.fetchall()
-
-	# Convert to dataframe for easy manipulation
-	meter_inputs_df = pd.DataFrame(meter_inputs)
-	meter_inputs_df.columns = ['index', 'order_id', 'meter_id', 'datetime',
-							   'energy_generated', 'energy_consumed',
-							   'buy_tariff', 'sell_tariff']
-	del meter_inputs_df['index']
-	del meter_inputs_df['order_id']
-
-	# Create final dictionary substructure
-	meter_inputs_dict = {
-		'meter_operation_inputs': meter_inputs_df.to_dict('records')
-	}
+	# Get the time-varying output structure, built straight from the rows (or blobs) fetched
+	_, batches_by_key = __timeseries_batches(cursor, order_id, clustered=False, params=RetrievalParams())
+	for key, batches in batches_by_key:
+		milp_return[key] = list(itertools.chain.from_iterable(batches))
 
-	# Update the return dictionary
-	milp_return.update(meter_inputs_dict)
+	return milp_return
 
-	# METER OUTPUTS ####################################################################################################
-	# Retrieve the meter outputs calculated for the order ID
-	cursor.execute('''
-		SELECT * FROM Meter_Operation_Outputs WHERE order_id = ?
-	''', (order_id,))
-	meter_operation_outputs = cursor.fetchall()
-
-	# Convert to dataframe for easy manipulation
-	meter_operation_outputs_df = pd.DataFrame(meter_operation_outputs)
-	meter_operation_outputs_df.columns = ['index', 'order_id', 'meter_id', 'datetime',
-							   'energy_surplus', 'energy_supplied', 'energy_purchased_lem', 'energy_sold_lem',
-								'net_load', 'bess_energy_charged',
-								'bess_energy_discharged', 'bess_energy_content']
-	del meter_operation_outputs_df['index']
-	del meter_operation_outputs_df['order_id']
-
-	# Create final dictionary substructure
-	meter_operation_outputs_dict = {
-		'meter_operation_outputs': meter_operation_outputs_df.to_dict('records')
-	}
 
-	# Update the return dictionary
-	milp_return.update(meter_operation_outputs_dict)
+def milp_return_clustered_structure(cursor: sqlite3.Cursor,
+						  order_id: str) \
+		-> ClusteredMILPOutputs:
+	"""
+	Prepare the structure to be returned with the (clustered) MILP outputs, in accordance with the API specifications
+	:param cursor: cursor to the database
+	:param order_id: order id provided by the user
+	:return: structure with (clustered) MILP outputs in the API specified outputs' format
+	"""
+	# Get non time-varying output structure:
+	milp_return = __common_milp_return_structure(cursor, order_id)
 
-	# SELF CONSUMPTION TARIFFS #########################################################################################
-	# Retrieve the self-consumption tariffs used for the order ID
-	cursor.execute('''
-		SELECT * FROM Pool_Self_Consumption_Tariffs WHERE order_id = ?
-	''', (order_id,))
-	self_consumption_tariffs = cursor.fetchall()
+	# Get the (clustered) time-varying output structure, built straight from the rows (or blobs) fetched
+	_, batches_by_key = __timeseries_batches(cursor, order_id, clustered=True, params=RetrievalParams())
+	for key, batches in batches_by_key:
+		milp_return[key] = list(itertools.chain.from_iterable(batches))
+
+	return milp_return
 
-	# Convert to dataframe for easy manipulation
-	self_consumption_tariff_df = pd.DataFrame(self_consumption_tariffs)
-	self_consumption_tariff_df.columns = ['index', 'order_id', 'datetime', 'self_consumption_tariff']
-	del self_consumption_tariff_df['index']
-	del self_consumption_tariff_df['order_id']
 
-	self_consumption_tariff_dict = {
-		'self_consumption_tariffs': self_consumption_tariff_df.to_dict('records')
-	}
+# WINDOWED AND STREAMED RESPONSES ######################################################################################
+# Tables where the time series of each response key are stored in "rows" mode
+# (prefixed with "Clustered_" for clustered orders); the keys are in the same order as in the non-streamed responses
+TIMESERIES_TABLES = {
+	'meter_operation_inputs': 'Meter_Operation_Inputs',
+	'meter_operation_outputs': 'Meter_Operation_Outputs',
+	'self_consumption_tariffs': 'Pool_Self_Consumption_Tariffs',
+	'lem_prices': 'Lem_Prices'
+}
+
+# Number of records fetched from the database, and serialized, at a time
+STREAM_BATCH_SIZE = 5000
+
 
-	# Update the return dictionary
-	milp_return.update(self_consumption_tariff_dict)
+def to_json(content) -> bytes:
+	# compact UTF-8 JSON, as the API's JSONResponse, but encoded (much faster) by orjson
+	return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY)
 
-	# LEM PRICES #######################################################################################################
-	# Retrieve the LEM prices calculated for the order ID
+
+def __to_json(content) -> str:
+	return to_json(content).decode()
+
+
+def __timeseries_storage(cursor: sqlite3.Cursor, order_id: str) -> (bool, int):
+	"""
+	Return if the time series of an order were stored in columnar mode, and the epoch of its first time step.
+	"""
 	cursor.execute('''
-		SELECT * FROM Lem_Prices WHERE order_id = ?
+		SELECT storage_mode, start_epoch FROM Orders WHERE order_id = ?
 	''', (order_id,))
-	lem_prices = cursor.fetchall()
+	storage_mode, start_epoch = cursor.fetchone()
+	return storage_mode == 'columnar', start_epoch
+
+
+def __selected_fields(key: str, params: Union[RetrievalParams, DatetimeRetrievalParams, ExpansionParams]) -> list[str]:
+	return [field for field in TIMESERIES_COLUMNS[key] if params.fields is None or field in params.fields]
+
+
+def __datetime_window(start_epoch: int,
+					  first: int,
+					  last: int,
+					  params: Union[RetrievalParams, DatetimeRetrievalParams, ExpansionParams]) -> (int, int):
+	# datetimes are rounded to the time steps that fall within the window
+	start = getattr(params, 'start', None)
+	end = getattr(params, 'end', None)
+	if start is not None:
+		first = max(first, -(-(int(start.timestamp()) - start_epoch) // 900))
+	if end is not None:
+		last = min(last, (int(end.timestamp()) - start_epoch) // 900)
+	return first, last
+
+
+def __step_bounds(cursor: sqlite3.Cursor,
+				  order_id: str,
+				  clustered: bool,
+				  is_columnar: bool,
+				  start_epoch: int,
+				  params: Union[RetrievalParams, DatetimeRetrievalParams]) -> (int, int, Union[int, None]):
+	"""
+	Translate the time window and page requested into the first and last time steps (both included) to return.
+	:return: first and last time steps, and the cursor of the following page (None if there is no following page)
+	"""
+	if is_columnar:
+		cursor.execute('''
+			SELECT nr_steps FROM Timeseries_Axes WHERE order_id = ?
+		''', (order_id,))
+		first, last = 0, cursor.fetchone()[0] - 1
+	else:
+		cursor.execute(f'''
+			SELECT MAX(step) FROM {'Clustered_' * clustered}Lem_Prices WHERE order_id = ?
+		''', (order_id,))
+		first, last = 0, cursor.fetchone()[0]
 
-	# Convert to dataframe for easy manipulation
-	lem_prices_df = pd.DataFrame(lem_prices)
-	lem_prices_df.columns = ['index', 'order_id', 'datetime', 'value']
-	del lem_prices_df['index']
-	del lem_prices_df['order_id']
+	first, last = __datetime_window(start_epoch, first, last, params)
 
-	lem_prices_dict = {
-		'lem_prices': lem_prices_df.to_dict('records')
-	}
+	if params.cursor is not None:
+		first = max(first, params.cursor)
+	next_cursor = None
+	if params.limit is not None and first + params.limit <= last:
+		next_cursor = first + params.limit
+		last = next_cursor - 1
 
-	# Update the return dictionary
-	milp_return.update(lem_prices_dict)
+	return first, last, next_cursor
 
-	return milp_return
 
+def __step_labels(clustered: bool, start_epoch: int, first: int, last: int) -> list[tuple]:
+	"""
+	Build, once per response, the identifiers of each time step between first and last, as returned in the records:
+	the datetime (in string format), or the time of the day and the cluster number, for clustered orders.
+	"""
+	if clustered:
+		return [(STEP_TIMES[step % 96], step // 96) for step in range(first, last + 1)]
+	return [(time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(start_epoch + step * 900)),)
+			for step in range(first, last + 1)]
+
+
+def __rows_records(cursor: sqlite3.Cursor,
+				   order_id: str,
+				   key: str,
+				   clustered: bool,
+				   step_labels: list[tuple],
+				   fields: list[str],
+				   meter_ids: Union[list[str], None],
+				   first: int,
+				   last: int) -> Iterator[list[dict]]:
+	"""
+	Fetch, in batches, the records of a time-varying response key of an order stored in "rows" mode;
+	only the requested fields, meter IDs and time steps are read from the database.
+	"""
+	by_meter = key.startswith('meter_')
+	columns = ['meter_id'] * by_meter + ['step'] + ['cluster_weight'] * clustered + fields
+	keys = ['meter_id'] * by_meter + (['time', 'cluster_nr', 'cluster_weight'] if clustered else ['datetime']) + fields
+
+	filters, values = 'order_id = ? AND step BETWEEN ? AND ?', [order_id, first, last]
+	if by_meter and meter_ids is not None:
+		filters += f' AND meter_id IN ({", ".join("?" * len(meter_ids))})'
+		values.extend(meter_ids)
+
+	cursor.execute(f'''
+		SELECT {', '.join(columns)} FROM {'Clustered_' * clustered}{TIMESERIES_TABLES[key]} WHERE {filters}
+		ORDER BY {'meter_id, ' * by_meter}step
+	''', values)
+	while rows := cursor.fetchmany(STREAM_BATCH_SIZE):
+		# the integer time step of each row is replaced by its identifiers
+		if by_meter:
+			yield [dict(zip(keys, (row[0], *step_labels[row[1] - first], *row[2:]))) for row in rows]
+		else:
+			yield [dict(zip(keys, (*step_labels[row[0] - first], *row[1:]))) for row in rows]
+
+
+def __columnar_batches(cursor: sqlite3.Cursor,
+					   order_id: str,
+					   key: str,
+					   fields: list[str],
+					   meter_ids: Union[list[str], None],
+					   first: int,
+					   last: int) -> Iterator[list[dict]]:
+	"""
+	Decode, one meter ID at a time, the records of a time-varying response key of an order stored in columnar mode;
+	only the blobs of the requested meter IDs are read from the database, and then sliced to the requested fields
+	and time steps.
+	"""
+	steps = slice(first, max(first, last + 1))
+	identifiers = {name: values[steps] for name, values in __columnar_identifiers(cursor, order_id).items()}
+
+	filters, values = 'order_id = ? AND table_name = ?', [order_id, key]
+	if key.startswith('meter_') and meter_ids is not None:
+		filters += f' AND meter_id IN ({", ".join("?" * len(meter_ids))})'
+		values.extend(meter_ids)
+
+	cursor.execute(f'''
+		SELECT meter_id, columns, encoding, data FROM Timeseries_Blobs WHERE {filters}
+		ORDER BY meter_id
+	''', values)
+	while (blob := cursor.fetchone()) is not None:
+		records = __columnar_records(identifiers, *blob, fields=fields, steps=steps)
+		while batch := list(itertools.islice(records, STREAM_BATCH_SIZE)):
+			yield batch
+
+
+def __timeseries_batches(cursor: sqlite3.Cursor,
+						 order_id: str,
+						 clustered: bool,
+						 params: Union[RetrievalParams, DatetimeRetrievalParams]) \
+		-> (Union[int, None], Iterator[tuple[str, Iterator[list[dict]]]]):
+	"""
+	Prepare the retrieval, in batches, of the time-varying response keys of an order, restricted to the fields,
+	meter IDs, time window and page requested.
+	The batches must be consumed key by key, in order, since they share the same cursor.
+	:return: the cursor of the following page, and an iterator over the response keys and their batches of records
+	"""
+	is_columnar, start_epoch = __timeseries_storage(cursor, order_id)
+	first, last, next_cursor = __step_bounds(cursor, order_id, clustered, is_columnar, start_epoch, params)
+	step_labels = None if is_columnar else __step_labels(clustered, start_epoch, first, last)
+
+	def batches_by_key():
+		for key in TIMESERIES_TABLES:
+			fields = __selected_fields(key, params)
+			if not fields:
+				# response keys without any of the requested fields are left out
+				continue
+			if is_columnar:
+				yield key, __columnar_batches(cursor, order_id, key, fields, params.meter_ids, first, last)
+			else:
+				yield key, __rows_records(cursor, order_id, key, clustered, step_labels, fields, params.meter_ids,
+										  first, last)
+
+	return next_cursor, batches_by_key()
+
+
+def __time_axis(cursor: sqlite3.Cursor,
+				order_id: str,
+				clustered: bool,
+				is_columnar: bool,
+				start_epoch: int,
+				first: int,
+				last: int) -> dict[str, list]:
+	"""
+	Build the identifiers of the time steps requested (datetime, or time, cluster number and weight, for clustered
+	orders), shared by all arrays of the columnar response format.
+	"""
+	if is_columnar:
+		steps = slice(first, max(first, last + 1))
+		return {name: values[steps] for name, values in __columnar_identifiers(cursor, order_id).items()}
+
+	if not clustered:
+		return {
+			'datetime': [time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(start_epoch + step * 900))
+						 for step in range(first, last + 1)]
+		}
+
+	cursor.execute('''
+		SELECT step, cluster_weight FROM Clustered_Lem_Prices WHERE order_id = ? AND step BETWEEN ? AND ?
+		ORDER BY step
+	''', (order_id, first, last))
+	rows = cursor.fetchall()
+	steps, cluster_weights = zip(*rows) if rows else ((), ())
+	return {
+		'time': [STEP_TIMES[step % 96] for step in steps],
+		'cluster_nr': [step // 96 for step in steps],
+		'cluster_weight': list(cluster_weights)
+	}
 
-def milp_return_clustered_structure(cursor: sqlite3.Cursor,
-						  order_id: str) \
-		-> ClusteredMILPOutputs:
+
+def __rows_arrays(cursor: sqlite3.Cursor,
+				  order_id: str,
+				  key: str,
+				  clustered: bool,
+				  fields: list[str],
+				  meter_ids: Union[list[str], None],
+				  first: int,
+				  last: int) -> Iterator[tuple[str, dict[str, list]]]:
 	"""
-	Prepare the structure to be returned with the (clustered) MILP outputs, in accordance with the API specifications
+	Fetch, one meter ID at a time, the arrays of each requested field of a time-varying response key of an order
+	stored in "rows" mode (a single set of arrays, with an empty meter ID, for keys that do not depend on the meter).
+	"""
+	by_meter = key.startswith('meter_')
+	columns = ['meter_id'] * by_meter + fields
+
+	filters, values = 'order_id = ? AND step BETWEEN ? AND ?', [order_id, first, last]
+	if by_meter and meter_ids is not None:
+		filters += f' AND meter_id IN ({", ".join("?" * len(meter_ids))})'
+		values.extend(meter_ids)
+
+	cursor.execute(f'''
+		SELECT {', '.join(columns)} FROM {'Clustered_' * clustered}{TIMESERIES_TABLES[key]} WHERE {filters}
+		ORDER BY {'meter_id, ' * by_meter}step
+	''', values)
+	rows = itertools.chain.from_iterable(iter(lambda: cursor.fetchmany(STREAM_BATCH_SIZE), []))
+	if not by_meter:
+		arrays = list(zip(*rows)) or [()] * len(fields)
+		yield '', dict(zip(fields, map(list, arrays)))
+		return
+	for meter_id, meter_rows in itertools.groupby(rows, key=operator.itemgetter(0)):
+		_, *arrays = zip(*meter_rows)
+		yield meter_id, dict(zip(fields, map(list, arrays)))
+
+
+def __columnar_arrays(cursor: sqlite3.Cursor,
+					  order_id: str,
+					  key: str,
+					  fields: list[str],
+					  meter_ids: Union[list[str], None],
+					  first: int,
+					  last: int) -> Iterator[tuple[str, dict[str, list]]]:
+	"""
+	Decode, one meter ID at a time, the arrays of each requested field of a time-varying response key of an order
+	stored in columnar mode (a single set of arrays, with an empty meter ID, for keys that do not depend on the meter).
+	"""
+	steps = slice(first, max(first, last + 1))
+
+	filters, values = 'order_id = ? AND table_name = ?', [order_id, key]
+	if key.startswith('meter_') and meter_ids is not None:
+		filters += f' AND meter_id IN ({", ".join("?" * len(meter_ids))})'
+		values.extend(meter_ids)
+
+	cursor.execute(f'''
+		SELECT meter_id, columns, encoding, data FROM Timeseries_Blobs WHERE {filters}
+		ORDER BY meter_id
+	''', values)
+	while (blob := cursor.fetchone()) is not None:
+		meter_id, columns, encoding, data = blob
+		columns = columns.split(',')
+		arrays = decode_timeseries(encoding, data, len(columns))
+		yield meter_id, {field: arrays[columns.index(field), steps].tolist() for field in fields}
+
+
+def __timeseries_arrays(cursor: sqlite3.Cursor,
+						order_id: str,
+						clustered: bool,
+						params: Union[RetrievalParams, DatetimeRetrievalParams]) \
+		-> (Union[int, None], dict[str, list], Iterator[tuple[str, Iterator[tuple[str, dict[str, list]]]]]):
+	"""
+	Prepare the retrieval, in the columnar response format, of the time-varying response keys of an order, restricted
+	to the fields, meter IDs, time window and page requested.
+	The arrays must be consumed key by key, in order, since they share the same cursor.
+	:return: the cursor of the following page, the shared time axis and an iterator over the response keys and their
+		arrays (per meter ID)
+	"""
+	is_columnar, start_epoch = __timeseries_storage(cursor, order_id)
+	first, last, next_cursor = __step_bounds(cursor, order_id, clustered, is_columnar, start_epoch, params)
+	time_axis = __time_axis(cursor, order_id, clustered, is_columnar, start_epoch, first, last)
+
+	def arrays_by_key():
+		for key in TIMESERIES_TABLES:
+			fields = __selected_fields(key, params)
+			if not fields:
+				# response keys without any of the requested fields are left out
+				continue
+			if is_columnar:
+				yield key, __columnar_arrays(cursor, order_id, key, fields, params.meter_ids, first, last)
+			else:
+				yield key, __rows_arrays(cursor, order_id, key, clustered, fields, params.meter_ids, first, last)
+
+	return next_cursor, time_axis, arrays_by_key()
+
+
+def arrays_milp_return_structure(cursor: sqlite3.Cursor,
+								 order_id: str,
+								 clustered: bool,
+								 params: Union[RetrievalParams, DatetimeRetrievalParams]) -> dict:
+	"""
+	Prepare the structure to be returned with the MILP outputs in the columnar response format: the same non
+	time-varying outputs, a single "time_axis" and, for each time-varying response key, one array per field (per
+	meter ID, for the keys that depend on the meter), aligned with the time axis
 	:param cursor: cursor to the database
 	:param order_id: order id provided by the user
-	:return: structure with (clustered) MILP outputs in the API specified outputs' format
+	:param clustered: if the order is a clustered one
+	:param params: the time-varying outputs requested
+	:return: structure with the requested MILP outputs in the columnar response format
 	"""
 	# Get non time-varying output structure:
 	milp_return = __common_milp_return_structure(cursor, order_id)
 
-	# CLUSTERED METER INPUTS ###########################################################################################
-	# Retrieve the (clustered) meter inputs used in the order ID
-	cursor.execute('''
-		SELECT * FROM Clustered_Meter_Operation_Inputs WHERE order_id = ?
-	''', (order_id,))
-	meter_inputs = cursor.fetchall()
-
-	# Convert to dataframe for easy manipulation
-	meter_inputs_df = pd.DataFrame(meter_inputs)
-	meter_inputs_df.columns = ['index', 'order_id', 'meter_id', 'time', 'cluster_nr', 'cluster_weight',
-							   'energy_generated', 'energy_consumed',
-							   'buy_tariff', 'sell_tariff']
-	del meter_inputs_df['index']
-	del meter_inputs_df['order_id']
-
-	# Create final dictionary substructure
-	meter_inputs_dict = {
-		'meter_operation_inputs': meter_inputs_df.to_dict('records')
-	}
+	# Get the requested time-varying output structure
+	next_cursor, time_axis, arrays_by_key = __timeseries_arrays(cursor, order_id, clustered, params)
+	milp_return['time_axis'] = time_axis
+	for key, arrays in arrays_by_key:
+		milp_return[key] = dict(arrays) if key.startswith('meter_') else next(arrays)[1]
+	if params.limit is not None:
+		milp_return['next_cursor'] = next_cursor
 
-	# Update the return dictionary
-	milp_return.update(meter_inputs_dict)
+	return milp_return
 
-	# CLUSTERED METER OUTPUTS ##########################################################################################
-	# Retrieve the (clustered) meter outputs calculated for the order ID
-	cursor.execute('''
-		SELECT * FROM Clustered_Meter_Operation_Outputs WHERE order_id = ?
-	''', (order_id,))
-	meter_operation_outputs = cursor.fetchall()
-
-	# Convert to dataframe for easy manipulation
-	meter_operation_outputs_df = pd.DataFrame(meter_operation_outputs)
-	meter_operation_outputs_df.columns = ['index', 'order_id', 'meter_id', 'time', 'cluster_nr', 'cluster_weight',
-							   'energy_surplus', 'energy_supplied', 'energy_purchased_lem', 'energy_sold_lem',
-								'net_load', 'bess_energy_charged',
-								'bess_energy_discharged', 'bess_energy_content']
-	del meter_operation_outputs_df['index']
-	del meter_operation_outputs_df['order_id']
-
-	# Create final dictionary substructure
-	meter_operation_outputs_dict = {
-		'meter_operation_outputs': meter_operation_outputs_df.to_dict('records')
-	}
 
-	# Update the return dictionary
-	milp_return.update(meter_operation_outputs_dict)
+def windowed_milp_return_structure(cursor: sqlite3.Cursor,
+								   order_id: str,
+								   clustered: bool,
+								   params: Union[RetrievalParams, DatetimeRetrievalParams]) \
+		-> Union[MILPOutputs, ClusteredMILPOutputs]:
+	"""
+	Prepare the same structure returned by milp_return_structure / milp_return_clustered_structure, but with the
+	time-varying outputs restricted to the fields, meter IDs, time window and page requested (all pushed down
+	to the queries to the database)
+	:param cursor: cursor to the database
+	:param order_id: order id provided by the user
+	:param clustered: if the order is a clustered one
+	:param params: the time-varying outputs requested
+	:return: structure with the requested MILP outputs in the API specified outputs' format
+	"""
+	# Get non time-varying output structure:
+	milp_return = __common_milp_return_structure(cursor, order_id)
 
-	# CLUSTERED SELF CONSUMPTION TARIFFS ###############################################################################
-	# Retrieve the (clustered) self-consumption tariffs used for the order ID
-	cursor.execute('''
-		SELECT * FROM Clustered_Pool_Self_Consumption_Tariffs WHERE order_id = ?
-	''', (order_id,))
-	self_consumption_tariffs = cursor.fetchall()
+	# Get the requested time-varying output structure
+	next_cursor, batches_by_key = __timeseries_batches(cursor, order_id, clustered, params)
+	for key, batches in batches_by_key:
+		milp_return[key] = list(itertools.chain.from_iterable(batches))
+	if params.limit is not None:
+		milp_return['next_cursor'] = next_cursor
+
+	return milp_return
 
-	# Convert to dataframe for easy manipulation
-	self_consumption_tariff_df = pd.DataFrame(self_consumption_tariffs)
-	self_consumption_tariff_df.columns = ['index', 'order_id', 'time', 'cluster_nr', 'cluster_weight',
-										  'self_consumption_tariff']
-	del self_consumption_tariff_df['index']
-	del self_consumption_tariff_df['order_id']
 
-	self_consumption_tariff_dict = {
-		'self_consumption_tariffs': self_consumption_tariff_df.to_dict('records')
+def stream_milp_return_structure(db: ResultDatabase,
+								 order_id: str,
+								 clustered: bool,
+								 params: Union[RetrievalParams, DatetimeRetrievalParams] = None) -> Iterator[str]:
+	"""
+	Stream the same JSON structure returned by milp_return_structure / milp_return_clustered_structure (or by
+	windowed_milp_return_structure, if only part of the time-varying outputs is requested, or by
+	arrays_milp_return_structure, for the columnar response format), written incrementally,
+	batch by batch, straight from the database's cursors, so that the memory used does not grow with the size
+	of the order.
+	The response is iterated by different threads, so a dedicated connection is opened for it.
+	:param db: access layer to the database
+	:param order_id: order id provided by the user
+	:param clustered: if the order is a clustered one
+	:param params: the time-varying outputs requested (all of them, if not provided)
+	:return: iterator over the chunks of the JSON structure
+	"""
+	params = params or RetrievalParams()
+	with db.dedicated_reader() as conn:
+		cursor = conn.cursor()
+
+		# Non time-varying output structure (which ends up as the opening of the JSON object)
+		yield __to_json(__common_milp_return_structure(cursor, order_id))[:-1]
+
+		if params.format == ResponseFormat.columnar:
+			# Time-varying output structure, written as the time axis followed by one object per response key,
+			# with the arrays of one meter ID at a time
+			next_cursor, time_axis, arrays_by_key = __timeseries_arrays(cursor, order_id, clustered, params)
+			yield f',"time_axis":{__to_json(time_axis)}'
+			for key, arrays in arrays_by_key:
+				if key.startswith('meter_'):
+					yield f',{__to_json(key)}:{{'
+					separator = ''
+					for meter_id, meter_arrays in arrays:
+						yield f'{separator}{__to_json(meter_id)}:{__to_json(meter_arrays)}'
+						separator = ','
+					yield '}'
+				else:
+					yield f',{__to_json(key)}:{__to_json(next(arrays)[1])}'
+		else:
+			# Time-varying output structure, written as one array per response key
+			next_cursor, batches_by_key = __timeseries_batches(cursor, order_id, clustered, params)
+			for key, batches in batches_by_key:
+				yield f',{__to_json(key)}:['
+				separator = ''
+				for records in batches:
+					yield separator + ','.join(map(__to_json, records))
+					separator = ','
+				yield ']'
+		if params.limit is not None:
+			yield f',"next_cursor":{__to_json(next_cursor)}'
+
+		yield '}'
+
+
+# SUMMARIES ############################################################################################################
+def summary_return_structure(db: ResultDatabase, order_id: str, granularity: SummaryGranularity) -> OrderSummary:
+	"""
+	Prepare the structure to be returned with the summary of the results of an order, i.e., with its energy flows and
+	LEM prices aggregated per period, as precomputed when the results were stored
+	(orders stored before the summaries were introduced are summarized, once, now).
+	:param db: access layer to the database
+	:param order_id: order id provided by the user
+	:param granularity: periods of the aggregates
+	:return: structure with the aggregates in the API specified outputs' format
+	"""
+	store_missing_summaries(db, order_id)
+
+	cursor = db.reader().cursor()
+	columns = ('period', 'nr_days', *SUMMARY_ENERGY_COLUMNS, *SUMMARY_PRICE_COLUMNS)
+	cursor.execute(f'''
+		SELECT {', '.join(columns)} FROM Period_Aggregates WHERE order_id = ? AND granularity = ?
+		ORDER BY first_step
+	''', (order_id, granularity.value))
+	community_aggregates = [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+	meter_columns = ('meter_id', 'period', *SUMMARY_ENERGY_COLUMNS)
+	cursor.execute(f'''
+		SELECT {', '.join(meter_columns)} FROM Meter_Period_Aggregates WHERE order_id = ? AND granularity = ?
+		ORDER BY meter_id, first_step
+	''', (order_id, granularity.value))
+	meter_aggregates = [dict(zip(meter_columns, row)) for row in cursor.fetchall()]
+
+	return {
+		'order_id': order_id,
+		'granularity': granularity.value,
+		'community_aggregates': community_aggregates,
+		'meter_aggregates': meter_aggregates
 	}
 
-	# Update the return dictionary
-	milp_return.update(self_consumption_tariff_dict)
 
-	# CLUSTERED LEM PRICES #############################################################################################
-	# Retrieve the (clustered) LEM prices calculated for the order ID
+# EXPANSION OF CLUSTERED RESULTS #######################################################################################
+def has_cluster_assignment(cursor: sqlite3.Cursor, order_id: str) -> bool:
+	"""
+	Check if the day-to-cluster assignment of a clustered order was stored (i.e., if it was placed after it started to
+	be stored), and hence if its results can be expanded to the full horizon.
+	"""
 	cursor.execute('''
-		SELECT * FROM Clustered_Lem_Prices WHERE order_id = ?
+		SELECT COUNT(*) FROM Cluster_Assignments WHERE order_id = ?
 	''', (order_id,))
-	lem_prices = cursor.fetchall()
+	return bool(cursor.fetchone()[0])
 
-	# Convert to dataframe for easy manipulation
-	lem_prices_df = pd.DataFrame(lem_prices)
-	lem_prices_df.columns = ['index', 'order_id', 'time', 'cluster_nr', 'cluster_weight', 'value']
-	del lem_prices_df['index']
-	del lem_prices_df['order_id']
 
-	lem_prices_dict = {
-		'lem_prices': lem_prices_df.to_dict('records')
-	}
-
-	# Update the return dictionary
-	milp_return.update(lem_prices_dict)
-
-	return milp_return
+def stream_expanded_milp_return_structure(db: ResultDatabase,
+										  order_id: str,
+										  params: ExpansionParams) -> Iterator[str]:
+	"""
+	Stream the results of a clustered order expanded to its full horizon, i.e., with the same structure returned by
+	milp_return_structure, in which each day of the horizon takes the time-varying outputs of its representative day.
+	Only the (compact) time series of the representative days are read, one response key and meter ID at a time,
+	and each record is only built as it is written; the expanded time series are never stored.
+	The response is iterated by different threads, so a dedicated connection is opened for it.
+	:param db: access layer to the database
+	:param order_id: order id provided by the user
+	:param params: the time-varying outputs requested
+	:return: iterator over the chunks of the JSON structure
+	"""
+	with db.dedicated_reader() as conn:
+		cursor = conn.cursor()
+		is_columnar, start_epoch = __timeseries_storage(cursor, order_id)
+		cursor.execute('''
+			SELECT cluster_nr FROM Cluster_Assignments WHERE order_id = ? ORDER BY day
+		''', (order_id,))
+		day_clusters = np.array([row[0] for row in cursor.fetchall()], dtype=np.int64)
+		last_representative_step = (int(day_clusters.max()) + 1) * 96 - 1
+
+		# time steps of the full horizon requested, with their datetimes and the steps of their representative days
+		first, last = __datetime_window(start_epoch, 0, len(day_clusters) * 96 - 1, params)
+		steps = np.arange(first, max(first, last + 1))
+		step_labels = [label for label, in __step_labels(False, start_epoch, first, last)]
+		step_clusters = day_clusters[steps // 96]
+		representative_steps = step_clusters * 96 + steps % 96
+		step_clusters = step_clusters.tolist()
+
+		# Non time-varying output structure (which ends up as the opening of the JSON object)
+		yield __to_json(__common_milp_return_structure(cursor, order_id))[:-1]
+
+		# Time-varying output structure, written as one array per response key
+		for key in TIMESERIES_TABLES:
+			fields = __selected_fields(key, params)
+			if not fields:
+				# response keys without any of the requested fields are left out
+				continue
+			if is_columnar:
+				arrays = __columnar_arrays(cursor, order_id, key, fields, params.meter_ids, 0, last_representative_step)
+			else:
+				arrays = __rows_arrays(cursor, order_id, key, True, fields, params.meter_ids, 0,
+									   last_representative_step)
+
+			by_meter = key.startswith('meter_')
+			keys = ['meter_id'] * by_meter + ['datetime', 'cluster_nr'] + fields
+			yield f',{__to_json(key)}:['
+			separator = ''
+			for meter_id, meter_arrays in arrays:
+				meter_arrays = [np.asarray(meter_arrays[field]) for field in fields]
+				for batch in range(0, len(steps), STREAM_BATCH_SIZE):
+					batch_steps = slice(batch, batch + STREAM_BATCH_SIZE)
+					columns = [values[representative_steps[batch_steps]].tolist() for values in meter_arrays]
+					identifiers = [step_labels[batch_steps], step_clusters[batch_steps]]
+					if by_meter:
+						identifiers.insert(0, itertools.repeat(meter_id))
+					records = [dict(zip(keys, row)) for row in zip(*identifiers, *columns)]
+					yield separator + ','.join(map(__to_json, records))
+					separator = ','
+			yield ']'
+
+		yield '}'
@@ -0,0 +1,117 @@
+import numpy as np
+
+from scipy.spatial import cKDTree
+
+from helpers.calculate_circle import (
+	chord_length,
+	haversine_distances,
+	points_in_polygon,
+	unit_vectors
+)
+
+
+# Relative margin by which the searched chords are widened, so that no meter on the boundary of a circle is missed by
+# the k-d tree due to rounding errors (meters are then kept or not by their exact great-circle distance)
+CHORD_MARGIN = 1e-9
+
+
+class MeterLocationIndex:
+	"""
+	Spatial index over the locations of the meters of a dataset, built once, so that area searches only compute the
+	great-circle distance to (or the point-in-polygon test of) the few meters near the area, instead of every meter of
+	the dataset. The locations are indexed by a k-d tree over their cartesian coordinates on the unit sphere (for
+	circles) and sorted by latitude (for the bounding boxes of polygons).
+	"""
+	def __init__(self, locations: dict[str, list[float]]):
+		"""
+		:param locations: the latitude and longitude of each meter ID
+		"""
+		self.meter_ids = list(locations)
+		coordinates = np.array(list(locations.values()), dtype=np.float64).reshape(-1, 2)
+		self.latitudes = coordinates[:, 0]
+		self.longitudes = coordinates[:, 1]
+		self._tree = cKDTree(unit_vectors(self.latitudes, self.longitudes))
+		self._by_latitude = np.argsort(self.latitudes, kind='stable')
+		self._sorted_latitudes = self.latitudes[self._by_latitude]
+
+	def __len__(self) -> int:
+		return len(self.meter_ids)
+
+	def __meter_ids(self, indices: np.ndarray) -> list[str]:
+		return [self.meter_ids[nr] for nr in indices]
+
+	def within_circles(self, centers: list[tuple[float, float]], radii: list[float]) -> list[list[str]]:
+		"""
+		Find the meter IDs located within each of many circles, querying the k-d tree for all of them at once.
+		:param centers: latitude and longitude of the center of each circle
+		:param radii: radius of each circle, in km
+		:return: the meter IDs found within each circle, in the order they were indexed
+		"""
+		if not self.meter_ids or not centers:
+			return [[] for _ in centers]
+		latitudes, longitudes = np.array(centers, dtype=np.float64).reshape(-1, 2).T
+		chords = np.array([chord_length(radius) for radius in radii]) * (1 + CHORD_MARGIN) + CHORD_MARGIN
+		all_candidates = self._tree.query_ball_point(unit_vectors(latitudes, longitudes), chords, return_sorted=True)
+
+		found_meters = []
+		for center, radius, candidates in zip(centers, radii, all_candidates):
+			candidates = np.asarray(candidates, dtype=np.intp)
+			distances = haversine_distances(center, self.latitudes[candidates], self.longitudes[candidates])
+			found_meters.append(self.__meter_ids(candidates[distances <= radius]))
+		return found_meters
+
+	def within_circle(self, latitude: float, longitude: float, radius: float) -> list[str]:
+		"""
+		Find the meter IDs located within a circle.
+		:param latitude: latitude of the center of the circle
+		:param longitude: longitude of the center of the circle
+		:param radius: radius of the circle, in km
+		:return: the meter IDs found, in the order they were indexed
+		"""
+		return self.within_circles([(latitude, longitude)], [radius])[0]
+
+	def nearest(self, latitude: float, longitude: float, nr_meters: int, max_distance: float = None) \
+			-> list[tuple[str, float]]:
+		"""
+		Find the meter IDs closest to a location (the straight distance between two points on the unit sphere, by which
+		the k-d tree is queried, grows with their great-circle distance, so the order of the meters is kept).
+		:param latitude: latitude of the location
+		:param longitude: longitude of the location
+		:param nr_meters: (maximum) number of meter IDs to find
+		:param max_distance: if provided, only meters up to this distance, in km, are found
+		:return: the meter IDs found and their distance to the location, in km, from the closest to the farthest
+		"""
+		nr_meters = min(nr_meters, len(self.meter_ids))
+		if not nr_meters:
+			return []
+		center = unit_vectors([latitude], [longitude])[0]
+		upper_bound = np.inf if max_distance is None else chord_length(max_distance) * (1 + CHORD_MARGIN) + CHORD_MARGIN
+		chords, candidates = self._tree.query(center, k=[*range(1, nr_meters + 1)], distance_upper_bound=upper_bound)
+		# (missing neighbours, beyond the upper bound, are flagged with an infinite chord)
+		candidates = candidates[np.isfinite(chords)]
+		if len(candidates) == nr_meters:
+			# all meters as far as the farthest one found are candidates, so that ties are broken deterministically
+			candidates = np.asarray(self._tree.query_ball_point(center, chords[-1] * (1 + CHORD_MARGIN) + CHORD_MARGIN),
+									dtype=np.intp)
+		distances = haversine_distances((latitude, longitude), self.latitudes[candidates], self.longitudes[candidates])
+		if max_distance is not None:
+			candidates, distances = candidates[distances <= max_distance], distances[distances <= max_distance]
+		# (meters at the same distance, e.g., in the same building, are kept in the order they were indexed)
+		order = np.lexsort((candidates, distances))[:nr_meters]
+		return list(zip(self.__meter_ids(candidates[order]), distances[order].tolist()))
+
+	def within_polygon(self, vertices: list[tuple[float, float]]) -> list[str]:
+		"""
+		Find the meter IDs located within a polygon. Only the meters within its bounding box are tested.
+		:param vertices: latitude and longitude of each vertex of the polygon
+		:return: the meter IDs found, in the order they were indexed
+		"""
+		polygon_latitudes, polygon_longitudes = np.array(vertices, dtype=np.float64).reshape(-1, 2).T
+		first = np.searchsorted(self._sorted_latitudes, polygon_latitudes.min(), side='left')
+		last = np.searchsorted(self._sorted_latitudes, polygon_latitudes.max(), side='right')
+		candidates = self._by_latitude[first:last]
+		candidates = candidates[(self.longitudes[candidates] >= polygon_longitudes.min())
+								& (self.longitudes[candidates] <= polygon_longitudes.max())]
+		inside = points_in_polygon(self.latitudes[candidates], self.longitudes[candidates],
+								   polygon_latitudes, polygon_longitudes)
+		return self.__meter_ids(np.sort(candidates[inside]))
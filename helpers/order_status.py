@@ -0,0 +1,113 @@
+import threading
+from collections import OrderedDict
+from typing import Union
+
+from helpers.database_backends import ResultDatabase
+from schemas.enums import OrderStage
+
+
+# Maximum number of orders whose status is kept in memory; the least recently updated ones are forgotten first
+# (and, if requested again, their status is read back from the database)
+MAX_STATUS_ENTRIES = 100000
+
+# Headline (scalar) results reported with the status of the orders correctly processed
+HEADLINE_COLUMNS = ('objective_value', 'milp_status', 'total_rec_cost')
+
+
+class OrderStatusRegistry:
+	"""
+	Thread-safe, in-memory map with the status of the orders, kept up to date by the threads that process them,
+	so that polling clients never need to read (let alone serialize) the results of an order.
+	"""
+	def __init__(self, max_entries: int = MAX_STATUS_ENTRIES):
+		self.max_entries = max_entries
+		self._statuses = OrderedDict()
+		self._lock = threading.Lock()
+
+	def update(self, order_id: str, /, **fields):
+		"""
+		Update (or create) the status of an order with the fields given.
+		"""
+		with self._lock:
+			status = self._statuses.pop(order_id, {'order_id': order_id})
+			status.update(fields)
+			self._statuses[order_id] = status
+			while len(self._statuses) > self.max_entries:
+				self._statuses.popitem(last=False)
+
+	def get(self, order_id: str) -> Union[dict, None]:
+		with self._lock:
+			status = self._statuses.get(order_id)
+			return dict(status) if status is not None else None
+
+	def forget(self, order_ids: list[str]):
+		"""
+		Remove the status of the orders given (e.g., once they were deleted).
+		"""
+		with self._lock:
+			for order_id in order_ids:
+				self._statuses.pop(order_id, None)
+
+
+def __headline_results(db: ResultDatabase, order_id: str) -> dict:
+	cursor = db.reader().cursor()
+	cursor.execute(f'''
+		SELECT {', '.join(HEADLINE_COLUMNS)} FROM General_MILP_Outputs WHERE order_id = ?
+	''', (order_id,))
+	return dict(zip(HEADLINE_COLUMNS, cursor.fetchone() or (None,) * len(HEADLINE_COLUMNS)))
+
+
+def __stored_status(db: ResultDatabase, order_id: str) -> Union[dict, None]:
+	"""
+	Read the status of an order from the Orders table, e.g., if it was placed before the API was (re)started, or through
+	another of its worker processes; the stage of the orders still being processed is then unknown.
+	"""
+	cursor = db.reader().cursor()
+	cursor.execute('''
+		SELECT processed, error, message, clustered FROM Orders WHERE order_id = ?
+	''', (order_id,))
+	order = cursor.fetchone()
+	if order is None:
+		return None
+
+	processed, error, message, clustered = order
+	if not processed:
+		stage = None
+	elif error:
+		stage = OrderStage.failed
+	else:
+		stage = OrderStage.finished
+	return {
+		'order_id': order_id,
+		'processed': bool(processed),
+		'clustered': bool(clustered),
+		'stage': stage,
+		'error': error,
+		'message': message
+	}
+
+
+def order_status(db: ResultDatabase, registry: OrderStatusRegistry, order_id: str) -> Union[dict, None]:
+	"""
+	Get the status of an order (and, once correctly processed, its headline results), from the in-memory registry or,
+	if the order is not there, from the Orders table. No results' table other than General_MILP_Outputs is read.
+	:param db: access layer to the database
+	:param registry: in-memory status of the orders
+	:param order_id: order id provided by the user
+	:return: the status of the order, or None if the order is not found
+	"""
+	status = registry.get(order_id)
+	if status is not None and (status['stage'] != OrderStage.finished or 'objective_value' in status):
+		return status
+
+	if status is None:
+		status = __stored_status(db, order_id)
+		if status is None or not status['processed']:
+			# the status of orders still being processed is not remembered, since it is about to change
+			return status
+
+	if status['stage'] == OrderStage.finished:
+		status.update(__headline_results(db, order_id))
+	# the (final) status of processed orders, with their headline results, is only read once from the database
+	registry.update(order_id, **status)
+	return status
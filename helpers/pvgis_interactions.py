@@ -1,35 +1,80 @@
+import calendar
 import datetime
+import hashlib
+import json
+import numpy as np
+import os
 import pvlib
 import pandas as pd
+import tempfile
+
+from loguru import logger
 
 
 MAX_YEAR_PVGIS = 2023
 
+# PV system settings used when requesting the modeled PV power output from PVGIS
+# (a 1 kWp system, so that the power output can be directly translated to a PV generation factor)
+PVGIS_SETTINGS = {
+    'raddatabase': None,
+    'components': True,
+    'surface_tilt': 0,
+    'surface_azimuth': 180,
+    'usehorizon': True,
+    'userhorizon': None,
+    'pvcalculation': True,
+    'peakpower': 1,
+    'pvtechchoice': 'crystSi',
+    'mountingplace': 'free',
+    'loss': 0,
+    'trackingtype': 0,
+    'optimal_surface_tilt': False,
+    'optimalangles': False
+}
 
-def fetch_pvgis(start_dt: datetime.datetime,
-                end_dt: datetime.datetime,
-                latitude: float,
-                longitude: float) -> pd.DataFrame:
+# Directory where the parsed yearly PV generation factor profiles are cached;
+# the cache is kept inside "files" so that it persists in the same (docker) volume as the orders' database
+PVGIS_CACHE_DIR = r'files/pvgis_cache'
+
+
+def pvgis_cache_path(latitude: float, longitude: float, year: int) -> str:
     """
-    Fetches for the given coordinates, and date in the past, the modeled PV power output from PVGIS.
-    Data comes in W and the index is composed of datetime values with tz-awareness.
-    :param start_dt:
-    :param end_dt:
+    Path of the cached 15' PV generation factor profile of a given location and year,
+    for the PV system settings currently defined in PVGIS_SETTINGS.
     :param latitude:
     :param longitude:
-    :return: a pandas dataframe, with a datetime index, and PV generation factor estimates, with 15' time step
+    :param year:
+    :return: path to the .npy file with the profile
     """
-    ####################################################################################################################
-    # UNPACK
-    ####################################################################################################################
-    # year of first and last date in the dataframe
-    # since PVGIS data is only available until MAX_YEAR_PVGIS,
-    # assume that the generation profile on future dates is the same as in MAX_YEAR_PVGIS
-    start = start_dt.year
-    end = end_dt.year
-    fetch_start = start if start <= MAX_YEAR_PVGIS else MAX_YEAR_PVGIS
-    fetch_end = end if end <= MAX_YEAR_PVGIS else MAX_YEAR_PVGIS
+    settings_key = hashlib.sha1(json.dumps(PVGIS_SETTINGS, sort_keys=True).encode()).hexdigest()[:12]
+    return os.path.join(PVGIS_CACHE_DIR, f'{latitude:.6f}_{longitude:.6f}_{year}_{settings_key}.npy')
+
+
+def __year_index(year: int, nr_values: int) -> pd.DatetimeIndex:
+    return pd.date_range(start=pd.Timestamp(f'{year}-01-01', tz='UTC'), periods=nr_values, freq='15T')
+
 
+def __save_to_cache(path: str, values: np.ndarray):
+    # write to a temporary file first and then move it into place, so that a partially written profile is never read
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'wb') as handle:
+        np.save(handle, values)
+    os.replace(tmp_path, path)
+
+
+def request_pvgis(start_year: int,
+                  end_year: int,
+                  latitude: float,
+                  longitude: float) -> pd.DataFrame:
+    """
+    Requests from PVGIS the modeled PV power output for the given coordinates and (past) years.
+    :param start_year:
+    :param end_year:
+    :param latitude:
+    :param longitude:
+    :return: a pandas dataframe, with a datetime index, and PV generation factor estimates, with 15' time step
+    """
     ####################################################################################################################
     # FETCH
     ####################################################################################################################
@@ -37,64 +82,111 @@ def fetch_pvgis(start_dt: datetime.datetime,
     pv_data, _, _ = pvlib.iotools.get_pvgis_hourly(
         latitude,
         longitude,
-        start=fetch_start,
-        end=fetch_end,
-        raddatabase=None,
-        components=True,
-        surface_tilt=0,
-        surface_azimuth=180,
+        start=start_year,
+        end=end_year,
         outputformat='json',
-        usehorizon=True,
-        userhorizon=None,
-        pvcalculation=True,
-        peakpower=1,
-        pvtechchoice='crystSi',
-        mountingplace='free',
-        loss=0,
-        trackingtype=0,
-        optimal_surface_tilt=False,
-        optimalangles=False,
         url='https://re.jrc.ec.europa.eu/api/',
         map_variables=True,
-        timeout=30
+        timeout=30,
+        **PVGIS_SETTINGS
     )
 
     ####################################################################################################################
     # PARSE
     ####################################################################################################################
-    # prune the returned dataframe, keeping only the power timeseries
-    pv_power_series = pv_data['P']
-    pv_power_df = pv_power_series.to_frame(name='e_g')
-    # resample the dataframe to 15' steps (originally in 1h steps)
-    pv_power_df.reset_index(inplace=True)
-    last_mock_row = pv_power_df.iloc[-1].to_dict()
-    last_mock_row['time'] += pd.to_timedelta('60T')
-    last_mock_row = pd.Series(last_mock_row).to_frame().T
-    pv_power_df = pd.concat([pv_power_df, last_mock_row], ignore_index=True)
-    pv_power_df.set_index('time', inplace=True)
-    pv_power_df = pv_power_df.resample('15T').mean().ffill()
-    pv_power_df = pv_power_df[:-1]
-    # convert the time series from W to kW; since 1kWp was set as the installed capacity,
+    # keep only the power timeseries and convert it from W to kW; since 1kWp was set as the installed capacity,
     # this can actually be translated directly to a PV generation factor
-    pv_power_df['e_g'] /= 1000
+    pv_power_series = pv_data['P']
+    hourly_values = pv_power_series.to_numpy(dtype=np.float64) / 1000
+    # PVGIS provides hourly values (stamped some minutes after the hour);
+    # each one is repeated for the four 15' steps of the respective hour
+    pv_power_df = pd.DataFrame(
+        {'e_g': np.repeat(hourly_values, 4)},
+        index=pd.date_range(start=pv_power_series.index[0].floor('60T'), periods=4 * len(hourly_values), freq='15T')
+    )
+
+    return pv_power_df
 
+
+def fetch_pvgis_profiles(years: list[int],
+                         latitude: float,
+                         longitude: float) -> dict[int, pd.Series]:
+    """
+    Returns the 15' PV generation factor profiles of the given coordinates, for each of the (past) years requested.
+    Profiles are read from the local cache whenever available; missing years are requested to PVGIS in a single request
+    and cached for later use.
+    :param years:
+    :param latitude:
+    :param longitude:
+    :return: a dictionary with a pandas Series, with a datetime index, per year
+    """
+    profiles = {}
+    missing_years = []
+    for year in years:
+        path = pvgis_cache_path(latitude, longitude, year)
+        if os.path.exists(path):
+            values = np.load(path)
+            profiles[year] = pd.Series(values, index=__year_index(year, len(values)), name='e_g')
+        else:
+            missing_years.append(year)
+
+    if missing_years:
+        logger.info(f'Requesting PVGIS profiles for {missing_years}.')
+        pv_power_df = request_pvgis(min(missing_years), max(missing_years), latitude, longitude)
+        for year in missing_years:
+            values = pv_power_df.loc[pv_power_df.index.year == year, 'e_g'].to_numpy(dtype=np.float64)
+            __save_to_cache(pvgis_cache_path(latitude, longitude, year), values)
+            profiles[year] = pd.Series(values, index=__year_index(year, len(values)), name='e_g')
+
+    return profiles
+
+
+def fetch_pvgis(start_dt: datetime.datetime,
+                end_dt: datetime.datetime,
+                latitude: float,
+                longitude: float) -> pd.DataFrame:
+    """
+    Fetches for the given coordinates, and date in the past, the modeled PV power output from PVGIS.
+    Data comes in W and the index is composed of datetime values with tz-awareness.
+    Yearly profiles already retrieved for the same coordinates are read from a local cache instead.
+    :param start_dt:
+    :param end_dt:
+    :param latitude:
+    :param longitude:
+    :return: a pandas dataframe, with a datetime index, and PV generation factor estimates, with 15' time step
+    """
     ####################################################################################################################
-    # COMPLEMENT
+    # UNPACK
     ####################################################################################################################
-    # repeat the data fetched for MAX_YEAR_PVGIS if later years are included in the request,
-    # defining that for later years, the same PV generation 15' profile found in MAX_YEAR_PVGIS is the best estimate
-    if end > MAX_YEAR_PVGIS:
-        yearly_data = pv_power_df.loc[pv_power_df.index.year == MAX_YEAR_PVGIS]
-        for i in range(MAX_YEAR_PVGIS + 1, end + 1, 1):
-            # update the year of the MAX_YEAR_PVGIS data
-            new_index = [ts.replace(year=i) for ts in yearly_data.index]
-            yearly_data.index = new_index
-            # add the new yearly data to the original PV data dataframe
-            pv_power_df = pd.concat([pv_power_df, yearly_data])
+    # 15' steps of the requested horizon and the year from which the PV generation profile of each step is taken;
+    # since PVGIS data is only available until MAX_YEAR_PVGIS,
+    # assume that the generation profile on future dates is the same as in MAX_YEAR_PVGIS
+    horizon = pd.date_range(start=start_dt, end=end_dt - pd.to_timedelta('15T'), freq='15T')
+    source_years = np.minimum(horizon.year.to_numpy(), MAX_YEAR_PVGIS)
 
     ####################################################################################################################
-    # PRUNE to requested start_dt and end_dt
+    # FETCH (from the local cache or from PVGIS)
+    ####################################################################################################################
+    profiles = fetch_pvgis_profiles(sorted(set(source_years.tolist())), latitude, longitude)
+
     ####################################################################################################################
-    pv_power_df = pv_power_df.loc[start_dt:end_dt-pd.to_timedelta('15T')]
+    # COMPLEMENT
+    ####################################################################################################################
+    # map each step of the horizon to the same day of the year and time of the day in its source year profile;
+    # when only one of the years is a leap year, 29th February is mapped to the 28th and the remaining days are shifted
+    days_of_year = horizon.dayofyear.to_numpy()
+    steps_of_day = horizon.hour.to_numpy() * 4 + horizon.minute.to_numpy() // 15
+    is_leap_year = horizon.is_leap_year
+    values = np.empty(len(horizon))
+    for year, profile in profiles.items():
+        mask = source_years == year
+        days = days_of_year[mask]
+        if calendar.isleap(year):
+            days = days + (~is_leap_year[mask] & (days >= 60))
+        else:
+            days = days - (is_leap_year[mask] & (days >= 60))
+        values[mask] = profile.to_numpy()[(days - 1) * 96 + steps_of_day[mask]]
+
+    pv_power_df = pd.DataFrame({'e_g': values}, index=horizon)
 
     return pv_power_df
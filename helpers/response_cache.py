@@ -0,0 +1,215 @@
+import gzip
+import hashlib
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Callable
+
+from fastapi import (
+	Request,
+	Response,
+	status
+)
+
+try:
+	import brotli
+except ImportError:
+	# responses are then only compressed with gzip
+	brotli = None
+
+
+# Responses of finished orders never change, so they are cached once serialized (and compressed):
+# - in memory, up to SIZING_RESPONSE_CACHE_MB megabytes, evicting the least recently used ones (0 to disable it);
+# - optionally, also on disk, under SIZING_RESPONSE_CACHE_DIR (empty to disable it), so that they survive restarts.
+RESPONSE_CACHE_MB = float(os.getenv('SIZING_RESPONSE_CACHE_MB', 256))
+RESPONSE_CACHE_DIR = os.getenv('SIZING_RESPONSE_CACHE_DIR', '')
+
+# Order IDs work as access tokens, so responses may only be kept by the client's (private) cache
+CACHE_CONTROL = 'private, max-age=31536000, immutable'
+
+# Smaller responses are not worth compressing
+MIN_COMPRESSED_SIZE = 1024
+COMPRESSORS = {
+	'gzip': lambda body: gzip.compress(body, compresslevel=6),
+	**({'br': lambda body: brotli.compress(body, quality=6)} if brotli is not None else {})
+}
+
+
+def negotiate_encoding(accept_encoding: str) -> str:
+	"""
+	Choose the content encoding of a response from the "Accept-Encoding" header of the request
+	(brotli is preferred over gzip, and identity is used if neither is accepted).
+	"""
+	accepted = {}
+	for coding in accept_encoding.lower().split(','):
+		name, _, parameters = coding.strip().partition(';')
+		try:
+			quality = float(parameters.strip().removeprefix('q=')) if parameters else 1.0
+		except ValueError:
+			quality = 0.0
+		accepted[name.strip()] = quality
+	for encoding in ('br', 'gzip'):
+		if encoding in COMPRESSORS and accepted.get(encoding, accepted.get('*', 0.0)) > 0.0:
+			return encoding
+	return 'identity'
+
+
+class CacheEntry:
+	def __init__(self, body: bytes):
+		self.digest = hashlib.sha256(body).hexdigest()[:32]
+		self.bodies = {'identity': body}
+		# held while a compressed body is added, so that each one is compressed (and written to disk) only once;
+		# the bodies are then replaced by a new dictionary, never changed in place, so they can be read without it
+		self.lock = threading.Lock()
+
+	def __getstate__(self) -> dict:
+		# (the lock is not pickled)
+		return {'digest': self.digest, 'bodies': dict(self.bodies)}
+
+	def __setstate__(self, state: dict):
+		self.__dict__.update(state)
+		self.lock = threading.Lock()
+
+	@property
+	def size(self) -> int:
+		return sum(map(len, self.bodies.values()))
+
+	def entity_tag(self, encoding: str) -> str:
+		# each encoding is a different representation, hence it gets a different (strong) entity tag
+		return f'"{self.digest}"' if encoding == 'identity' else f'"{self.digest}-{encoding}"'
+
+	def is_held_by(self, if_none_match: str) -> bool:
+		# weak comparison of the entity tags, i.e., regardless of the encoding of the representation the client holds
+		if if_none_match.strip() == '*':
+			return True
+		tags = (tag.strip().removeprefix('W/').strip('"') for tag in if_none_match.split(','))
+		return any(tag.split('-')[0] == self.digest for tag in tags)
+
+
+class ResponseCache:
+	"""
+	Thread-safe LRU cache with the serialized responses of finished orders (and their compressed versions),
+	optionally backed by a directory with one subdirectory per order.
+	"""
+	def __init__(self, max_bytes: int = int(RESPONSE_CACHE_MB * 1024 * 1024), directory: str = RESPONSE_CACHE_DIR):
+		self.max_bytes = max_bytes
+		self.directory = directory
+		self._entries = OrderedDict()
+		self._size = 0
+		self._lock = threading.Lock()
+		if directory:
+			os.makedirs(directory, exist_ok=True)
+
+	def __path(self, order_id: str, key: str) -> str:
+		return os.path.join(self.directory, order_id, f'{hashlib.sha256(key.encode()).hexdigest()}.pkl')
+
+	def __load(self, order_id: str, key: str):
+		try:
+			with open(self.__path(order_id, key), 'rb') as handle:
+				return pickle.load(handle)
+		except (FileNotFoundError, pickle.UnpicklingError, EOFError):
+			return None
+
+	def __dump(self, order_id: str, key: str, entry: CacheEntry):
+		# write to a temporary file first, so that a concurrent reader never sees a partial entry
+		path = self.__path(order_id, key)
+		os.makedirs(os.path.dirname(path), exist_ok=True)
+		with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), delete=False) as handle:
+			pickle.dump(entry, handle, protocol=pickle.HIGHEST_PROTOCOL)
+		os.replace(handle.name, path)
+
+	def __remember(self, order_id: str, key: str, entry: CacheEntry):
+		# the size of each entry is kept as it was when (re)inserted, since its compressed bodies are added later on
+		size = entry.size
+		with self._lock:
+			_, previous_size = self._entries.pop((order_id, key), (None, 0))
+			self._size -= previous_size
+			if size > self.max_bytes:
+				return
+			self._entries[(order_id, key)] = (entry, size)
+			self._size += size
+			while self._size > self.max_bytes:
+				_, (_, evicted_size) = self._entries.popitem(last=False)
+				self._size -= evicted_size
+
+	def __entry(self, order_id: str, key: str, build_body: Callable[[], bytes]) -> CacheEntry:
+		with self._lock:
+			entry, _ = self._entries.get((order_id, key), (None, 0))
+			if entry is not None:
+				self._entries.move_to_end((order_id, key))
+				return entry
+
+		entry = self.__load(order_id, key) if self.directory else None
+		if entry is None:
+			entry = CacheEntry(build_body())
+			if self.directory:
+				self.__dump(order_id, key, entry)
+		self.__remember(order_id, key, entry)
+		return entry
+
+	def __body(self, order_id: str, key: str, entry: CacheEntry, encoding: str) -> bytes:
+		body = entry.bodies.get(encoding)
+		if body is not None:
+			return body
+
+		with entry.lock:
+			# (unless another thread compressed it meanwhile) compress, once, the representation for the encoding
+			body = entry.bodies.get(encoding)
+			if body is not None:
+				return body
+			body = COMPRESSORS[encoding](entry.bodies['identity'])
+			entry.bodies = {**entry.bodies, encoding: body}
+			if self.directory:
+				self.__dump(order_id, key, entry)
+		self.__remember(order_id, key, entry)
+		return body
+
+	def response(self,
+				 request: Request,
+				 order_id: str,
+				 key: str,
+				 build_body: Callable[[], bytes],
+				 media_type: str = 'application/json') -> Response:
+		"""
+		Respond to a request for a (finished) order, from the cached response if there is one, or otherwise from the
+		body built (and cached) now. The body is compressed as negotiated with the client, and a "304 Not Modified"
+		is returned if the client already holds it.
+		:param request: the request
+		:param order_id: order id provided by the user
+		:param key: identifier of the response amongst those of the order (e.g., the endpoint and its parameters)
+		:param build_body: function that builds the serialized response
+		:param media_type: media type of the response
+		:return: the response
+		"""
+		entry = self.__entry(order_id, key, build_body)
+		encoding = negotiate_encoding(request.headers.get('accept-encoding', ''))
+		if len(entry.bodies['identity']) < MIN_COMPRESSED_SIZE:
+			encoding = 'identity'
+
+		headers = {
+			'ETag': entry.entity_tag(encoding),
+			'Cache-Control': CACHE_CONTROL,
+			'Vary': 'Accept-Encoding'
+		}
+		if entry.is_held_by(request.headers.get('if-none-match', '')):
+			return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+		body = self.__body(order_id, key, entry, encoding)
+		if encoding != 'identity':
+			headers['Content-Encoding'] = encoding
+		return Response(content=body, media_type=media_type, headers=headers, status_code=status.HTTP_200_OK)
+
+	def evict_orders(self, order_ids: list[str]):
+		"""
+		Remove the cached responses of the orders given (e.g., once they were deleted).
+		"""
+		order_ids = set(order_ids)
+		with self._lock:
+			for order_id, key in [order_key for order_key in self._entries if order_key[0] in order_ids]:
+				self._size -= self._entries.pop((order_id, key))[1]
+		if self.directory:
+			for order_id in order_ids:
+				shutil.rmtree(os.path.join(self.directory, order_id), ignore_errors=True)
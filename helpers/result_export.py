@@ -0,0 +1,235 @@
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import sqlite3
+import tempfile
+import zipfile
+from typing import Iterator
+
+from helpers.database_backends import ResultDatabase
+from helpers.database_interactions import (
+	TIMESERIES_COLUMNS,
+	decode_cluster_weights,
+	decode_timeseries
+)
+from helpers.main_helpers import (
+	SCALAR_COLUMNS,
+	STREAM_BATCH_SIZE,
+	TIMESERIES_TABLES
+)
+from schemas.enums import ExportFormat
+
+
+# Non time-varying results' tables exported, as {file name: (table, columns)}; all other columns are REAL
+SCALAR_TABLES = {table.lower(): (table, columns) for table, columns in SCALAR_COLUMNS.items()}
+STRING_COLUMNS = ('meter_id', 'milp_status')
+
+# File extension of each export format
+EXPORT_EXTENSIONS = {
+	ExportFormat.parquet: 'parquet',
+	ExportFormat.arrow: 'arrow'
+}
+
+# Archives are built in a temporary file, kept in memory up to EXPORT_SPOOL_SIZE bytes and written to disk beyond that,
+# and read back in chunks of EXPORT_CHUNK_SIZE bytes
+EXPORT_SPOOL_SIZE = 16 * 1024 * 1024
+EXPORT_CHUNK_SIZE = 1024 * 1024
+
+
+def __scalar_schema(columns: tuple[str, ...]) -> pa.Schema:
+	return pa.schema([(column, pa.string() if column in STRING_COLUMNS else pa.float64()) for column in columns])
+
+
+def __scalar_batches(cursor: sqlite3.Cursor,
+					 order_id: str,
+					 table: str,
+					 schema: pa.Schema) -> Iterator[pa.RecordBatch]:
+	cursor.execute(f'''
+		SELECT {', '.join(schema.names)} FROM {table} WHERE order_id = ? ORDER BY id
+	''', (order_id,))
+	rows = cursor.fetchall()
+	if rows:
+		yield pa.RecordBatch.from_arrays([pa.array(values, field.type) for field, values in zip(schema, zip(*rows))],
+										 schema=schema)
+
+
+def __timeseries_schema(key: str, clustered: bool) -> pa.Schema:
+	identifiers = [('meter_id', pa.string())] * key.startswith('meter_')
+	if clustered:
+		identifiers += [('time', pa.time32('s')), ('cluster_nr', pa.int32()), ('cluster_weight', pa.int32())]
+	else:
+		identifiers += [('datetime', pa.timestamp('s', tz='UTC'))]
+	return pa.schema(identifiers + [(field, pa.float64()) for field in TIMESERIES_COLUMNS[key]])
+
+
+def __time_arrays(steps: np.ndarray,
+				  start_epoch: int,
+				  step_seconds: int,
+				  cluster_weights: np.ndarray = None) -> list[pa.Array]:
+	"""
+	Convert the integer time steps of an order into its (typed) time identifiers: the datetime, or, for clustered orders
+	(i.e., with the cluster weights given, per step), the time of the day, cluster number and cluster weight.
+	"""
+	if cluster_weights is None:
+		return [pa.array(start_epoch + steps * step_seconds, pa.timestamp('s', tz='UTC'))]
+	steps_per_day = 24 * 3600 // step_seconds
+	return [
+		pa.array((steps % steps_per_day * step_seconds).astype(np.int32), pa.time32('s')),
+		pa.array(steps // steps_per_day, pa.int32()),
+		pa.array(cluster_weights, pa.int32())
+	]
+
+
+def __rows_timeseries_batches(cursor: sqlite3.Cursor,
+							  order_id: str,
+							  key: str,
+							  clustered: bool,
+							  start_epoch: int,
+							  schema: pa.Schema) -> Iterator[pa.RecordBatch]:
+	"""
+	Fetch, in batches, the time series of a response key of an order stored in "rows" mode, converting each batch of
+	rows straight into typed columns.
+	"""
+	by_meter = key.startswith('meter_')
+	fields = list(TIMESERIES_COLUMNS[key])
+	columns = ['meter_id'] * by_meter + ['step'] + ['cluster_weight'] * clustered + fields
+
+	cursor.execute(f'''
+		SELECT {', '.join(columns)} FROM {'Clustered_' * clustered}{TIMESERIES_TABLES[key]} WHERE order_id = ?
+		ORDER BY {'meter_id, ' * by_meter}step
+	''', (order_id,))
+	while rows := cursor.fetchmany(STREAM_BATCH_SIZE):
+		values = list(zip(*rows))
+		steps = np.asarray(values[by_meter], dtype=np.int64)
+		cluster_weights = np.asarray(values[by_meter + 1], dtype=np.int32) if clustered else None
+		arrays = [pa.array(values[0], pa.string())] if by_meter else []
+		arrays += __time_arrays(steps, start_epoch, 900, cluster_weights)
+		arrays += [pa.array(np.asarray(column, dtype=np.float64)) for column in values[by_meter + 1 + clustered:]]
+		yield pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def __columnar_timeseries_batches(cursor: sqlite3.Cursor,
+								  order_id: str,
+								  key: str,
+								  start_epoch: int,
+								  schema: pa.Schema) -> Iterator[pa.RecordBatch]:
+	"""
+	Decode, one meter ID at a time, the time series of a response key of an order stored in columnar mode, straight
+	into typed columns.
+	"""
+	cursor.execute('''
+		SELECT step_minutes, nr_steps, cluster_weights FROM Timeseries_Axes WHERE order_id = ?
+	''', (order_id,))
+	step_minutes, nr_steps, cluster_weights = cursor.fetchone()
+	steps = np.arange(nr_steps, dtype=np.int64)
+	if cluster_weights is not None:
+		cluster_weights = decode_cluster_weights(cluster_weights)[steps // (24 * 60 // step_minutes)]
+	time_arrays = __time_arrays(steps, start_epoch, step_minutes * 60, cluster_weights)
+
+	cursor.execute('''
+		SELECT meter_id, columns, encoding, data FROM Timeseries_Blobs WHERE order_id = ? AND table_name = ?
+		ORDER BY meter_id
+	''', (order_id, key))
+	while (blob := cursor.fetchone()) is not None:
+		meter_id, columns, encoding, data = blob
+		columns = columns.split(',')
+		values = decode_timeseries(encoding, data, len(columns))
+		# the meter ID is repeated for all time steps without building a list with it
+		arrays = [pa.array([meter_id], pa.string()).take(np.zeros(nr_steps, dtype=np.int32))] \
+			if key.startswith('meter_') else []
+		arrays += time_arrays
+		arrays += [pa.array(values[columns.index(field)]) for field in TIMESERIES_COLUMNS[key]]
+		yield pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def __write_table(archive: zipfile.ZipFile,
+				  name: str,
+				  schema: pa.Schema,
+				  batches: Iterator[pa.RecordBatch],
+				  export_format: ExportFormat):
+	"""
+	Write the batches of a table, as they are produced, into a file of the archive.
+	"""
+	with archive.open(f'{name}.{EXPORT_EXTENSIONS[export_format]}', 'w') as file:
+		if export_format == ExportFormat.parquet:
+			writer = pq.ParquetWriter(file, schema)
+		else:
+			writer = pa.ipc.new_file(file, schema)
+		with writer:
+			for batch in batches:
+				writer.write_batch(batch)
+
+
+def export_order_results(db: ResultDatabase,
+						 order_id: str,
+						 clustered: bool,
+						 export_format: ExportFormat) -> tempfile.SpooledTemporaryFile:
+	"""
+	Export the same tables assembled by milp_return_structure / milp_return_clustered_structure, as typed columnar
+	files (one per table) in a zip archive. The tables are built in batches, straight from the rows (or blobs) read
+	from the database, without going through Python dictionaries or pandas DataFrames.
+	:param db: access layer to the database
+	:param order_id: order id provided by the user
+	:param clustered: if the order is a clustered one
+	:param export_format: format of the files, "parquet" or "arrow" (Arrow IPC file format)
+	:return: temporary file with the zip archive, positioned at its start (see "iter_archive")
+	"""
+	cursor = db.reader().cursor()
+	cursor.execute('''
+		SELECT storage_mode, start_epoch FROM Orders WHERE order_id = ?
+	''', (order_id,))
+	storage_mode, start_epoch = cursor.fetchone()
+
+	# Parquet files are already compressed, while Arrow IPC files are not
+	compression = zipfile.ZIP_STORED if export_format == ExportFormat.parquet else zipfile.ZIP_DEFLATED
+	archive_file = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_SIZE)
+	try:
+		__write_archive(archive_file, cursor, order_id, clustered, export_format, storage_mode, start_epoch,
+						compression)
+	except BaseException:
+		archive_file.close()
+		raise
+	archive_file.seek(0)
+	return archive_file
+
+
+def __write_archive(archive_file: tempfile.SpooledTemporaryFile,
+					cursor: sqlite3.Cursor,
+					order_id: str,
+					clustered: bool,
+					export_format: ExportFormat,
+					storage_mode: str,
+					start_epoch: int,
+					compression: int):
+	with zipfile.ZipFile(archive_file, 'w', compression=compression) as archive:
+		# NON TIME-VARYING TABLES ######################################################################################
+		for name, (table, columns) in SCALAR_TABLES.items():
+			schema = __scalar_schema(columns)
+			__write_table(archive, name, schema, __scalar_batches(cursor, order_id, table, schema), export_format)
+
+		# TIME-VARYING TABLES ##########################################################################################
+		for key in TIMESERIES_TABLES:
+			schema = __timeseries_schema(key, clustered)
+			if storage_mode == 'columnar':
+				batches = __columnar_timeseries_batches(cursor, order_id, key, start_epoch, schema)
+			else:
+				batches = __rows_timeseries_batches(cursor, order_id, key, clustered, start_epoch, schema)
+			__write_table(archive, key, schema, batches, export_format)
+
+
+def archive_size(archive_file: tempfile.SpooledTemporaryFile) -> int:
+	"""
+	Size, in bytes, of an exported archive (which is left positioned at its start).
+	"""
+	size = archive_file.seek(0, 2)
+	archive_file.seek(0)
+	return size
+
+
+def iter_archive(archive_file: tempfile.SpooledTemporaryFile) -> Iterator[bytes]:
+	"""
+	Read an exported archive in chunks, e.g., for a streamed response, closing (and so deleting) it at the end.
+	"""
+	with archive_file:
+		while chunk := archive_file.read(EXPORT_CHUNK_SIZE):
+			yield chunk
@@ -0,0 +1,251 @@
+import numpy as np
+import pandas as pd
+import threading
+
+from datetime import datetime
+from loguru import logger
+
+from helpers.tariff_store import (
+	TariffStore,
+	get_tariff_store
+)
+
+
+# Rule-based model of the regulated tariffs (from ERSE) used by the API, composed of:
+# - the daily schedule of each tariff cycle, i.e., which tariff period applies to each quarter-hour (in local time),
+#   that can differ between the winter and summer (legal) time;
+# - the prices of each tariff period, per year.
+# With these, the 15' tariffs' time series are generated on demand for the steps of any horizon not covered by the
+# tariffs' store built from the "prices_and_tariffs.pkl" pickle (the tariffs of the steps it covers are sliced from it).
+# The prices are derived, once, from the tariffs in the store, for every tariff cycle and year it covers, so the pickle,
+# with the tariffs of every tariff cycle, is required: the API does not start without it.
+#
+# DESCRIPTION
+# {
+# 	tariff cycle: {
+# 		season ("winter" or "summer"): [(start time, end time, tariff period), ...]
+# 	}
+# }
+
+TARIFF_TIMEZONE = 'Europe/Lisbon'
+
+SINGLE_PERIOD_SCHEDULE = [('00:00', '24:00', 'normal')]
+
+TARIFF_CYCLES = {
+	'simples': {
+		'winter': SINGLE_PERIOD_SCHEDULE,
+		'summer': SINGLE_PERIOD_SCHEDULE
+	},
+	'bi-horárias': {
+		'winter': [('00:00', '08:00', 'vazio'), ('08:00', '22:00', 'fora_de_vazio'), ('22:00', '24:00', 'vazio')],
+		'summer': [('00:00', '08:00', 'vazio'), ('08:00', '22:00', 'fora_de_vazio'), ('22:00', '24:00', 'vazio')]
+	},
+	'tri-horárias': {
+		'winter': [('00:00', '08:00', 'vazio'), ('08:00', '09:00', 'cheias'), ('09:00', '10:30', 'ponta'),
+				   ('10:30', '18:00', 'cheias'), ('18:00', '20:30', 'ponta'), ('20:30', '22:00', 'cheias'),
+				   ('22:00', '24:00', 'vazio')],
+		'summer': [('00:00', '08:00', 'vazio'), ('08:00', '10:30', 'cheias'), ('10:30', '13:00', 'ponta'),
+				   ('13:00', '19:30', 'cheias'), ('19:30', '21:00', 'ponta'), ('21:00', '22:00', 'cheias'),
+				   ('22:00', '24:00', 'vazio')]
+	},
+	'autoconsumo_simples': {
+		'winter': SINGLE_PERIOD_SCHEDULE,
+		'summer': SINGLE_PERIOD_SCHEDULE
+	}
+}
+
+# Selling tariffs are defined as a fixed share of the buying tariffs for the same period
+SELL_TARIFF_RATIO = 0.25
+
+STEPS_PER_DAY = 96
+SEASONS = ('winter', 'summer')
+
+# Maximum deviation (in €/kWh) between the tariffs in the store and the ones generated with the prices derived from
+# them, above which the pickle is reported as not following the schedules of the tariff cycles
+MAX_PRICE_DEVIATION = 1e-6
+
+# Prices of each tariff cycle compiled by "load_tariff_prices", shared by all threads of a worker
+_COMPILED_PRICES = None
+_COMPILED_PRICES_LOCK = threading.Lock()
+
+
+def __quarter_hour(hh_mm: str) -> int:
+	hours, minutes = map(int, hh_mm.split(':'))
+	return hours * 4 + minutes // 15
+
+
+def __compile_schedule(tariff_type: str) -> (list[str], np.ndarray):
+	"""
+	Compile the schedule of a tariff cycle into its (sorted) tariff periods
+	and a (season x quarter-hour) table of period codes.
+	"""
+	schedules = TARIFF_CYCLES[tariff_type]
+	periods = sorted({period for schedule in schedules.values() for _, _, period in schedule})
+
+	period_codes = np.full((len(SEASONS), STEPS_PER_DAY), -1, dtype=np.int8)
+	for season_nr, season in enumerate(SEASONS):
+		for start, end, period in schedules[season]:
+			period_codes[season_nr, __quarter_hour(start):__quarter_hour(end)] = periods.index(period)
+	assert (period_codes >= 0).all(), f'schedule of tariff cycle "{tariff_type}" does not cover the whole day'
+
+	return periods, period_codes
+
+
+def __compile_prices(tariff_type: str, tariff_prices: dict[int, dict[str, float]]) -> (np.ndarray, np.ndarray):
+	"""
+	Compile the prices of a tariff cycle, per year and tariff period, into the (sorted) years
+	and a (year x period code) table of prices.
+	"""
+	periods, _ = COMPILED_SCHEDULES[tariff_type]
+	years = np.array(sorted(tariff_prices))
+	prices = np.array([[tariff_prices[year][period] for period in periods] for year in years])
+
+	return years, prices
+
+
+# the schedules are compiled once, when the module is first imported
+COMPILED_SCHEDULES = {tariff_type: __compile_schedule(tariff_type) for tariff_type in TARIFF_CYCLES}
+
+
+def __calendar(index: pd.DatetimeIndex) -> (np.ndarray, np.ndarray, np.ndarray):
+	"""
+	Get the season number, quarter-hour of the day and year of each (tz-aware) datetime, in the tariffs' local time.
+	"""
+	utc_index = index.tz_convert('UTC')
+	local_index = index.tz_convert(TARIFF_TIMEZONE)
+
+	# legal summer time is identified by a UTC offset greater than the one in winter
+	utc_offsets = (local_index.tz_localize(None) - utc_index.tz_localize(None)).to_numpy()
+	winter_offset = pd.Timestamp('2000-01-15', tz=TARIFF_TIMEZONE).utcoffset()
+	season_nrs = (utc_offsets > np.timedelta64(winter_offset)).astype(np.int8)
+	quarter_hours = local_index.hour.to_numpy() * 4 + local_index.minute.to_numpy() // 15
+
+	return season_nrs, quarter_hours, local_index.year.to_numpy()
+
+
+def derive_tariff_prices(tariffs: TariffStore) -> dict[int, dict[str, dict[str, float]]]:
+	"""
+	Derive the prices of each tariff period, per year, from the tariffs in the store, for the tariff cycles it holds:
+	the price of a period is the median of the tariffs in its quarter-hours of the year.
+	Only the years in which the store holds tariffs for every period of a cycle are derived.
+	:param tariffs: the tariffs' store
+	:return: the prices per year, tariff cycle and period, in €/kWh
+	"""
+	first_dt = pd.Timestamp(tariffs.start_ns, tz='UTC')
+	last_dt = pd.Timestamp(tariffs.start_ns + (tariffs.length - 1) * tariffs.step_ns, tz='UTC')
+
+	derived_prices = {}
+	for tariff_type in (tariff_type for tariff_type in TARIFF_CYCLES if tariff_type in tariffs.columns):
+		periods, period_codes = COMPILED_SCHEDULES[tariff_type]
+		stored_tariffs = tariffs.get(tariff_type, first_dt, last_dt)
+		season_nrs, quarter_hours, years = __calendar(stored_tariffs.index)
+		codes = period_codes[season_nrs, quarter_hours]
+
+		medians = stored_tariffs.groupby([years, codes]).median().dropna().unstack()
+		medians = medians.reindex(columns=range(len(periods))).dropna()
+		if medians.empty:
+			continue
+		for year, year_prices in medians.iterrows():
+			derived_prices.setdefault(int(year), {})[tariff_type] = dict(zip(periods, year_prices.tolist()))
+
+		# report stored tariffs that the schedule of the cycle does not explain (e.g., a different tariff period)
+		year_nrs = np.clip(np.searchsorted(medians.index.to_numpy(), years, side='right') - 1, 0, len(medians) - 1)
+		deviations = np.abs(stored_tariffs.to_numpy() - medians.to_numpy()[year_nrs, codes])
+		if np.nanmax(deviations, initial=0) > MAX_PRICE_DEVIATION:
+			logger.warning(f'Tariffs\' store deviates up to {np.nanmax(deviations):.4f} €/kWh from the schedule of the '
+						   f'"{tariff_type}" tariff cycle; the tariffs it does not cover are generated with the median price of each '
+						   f'tariff period.')
+
+	return derived_prices
+
+
+def load_tariff_prices() -> dict[str, (np.ndarray, np.ndarray)]:
+	"""
+	Compile the prices of every tariff cycle, derived from the tariffs' store.
+	Meant to be called once at startup; the compiled prices are kept and reused by all subsequent requests.
+	:return: the (sorted) years and the (year x period code) table of prices of each tariff cycle
+	:raise FileNotFoundError: if the tariffs' pickle is not deployed
+	:raise ValueError: if the tariffs' pickle lacks (a complete year of) the tariffs of any tariff cycle
+	"""
+	global _COMPILED_PRICES
+
+	with _COMPILED_PRICES_LOCK:
+		derived_prices = derive_tariff_prices(get_tariff_store())
+
+		compiled_prices = {}
+		for tariff_type in TARIFF_CYCLES:
+			tariff_prices = {year: prices[tariff_type] for year, prices in derived_prices.items()
+							 if tariff_type in prices}
+			if not tariff_prices:
+				raise ValueError(f'tariffs\' pickle holds no complete year of "{tariff_type}" tariffs')
+			compiled_prices[tariff_type] = __compile_prices(tariff_type, tariff_prices)
+		_COMPILED_PRICES = compiled_prices
+
+	return _COMPILED_PRICES
+
+
+def get_tariff_prices() -> dict[str, (np.ndarray, np.ndarray)]:
+	"""
+	Return the prices of every tariff cycle compiled at startup (compiling them if that has not happened yet).
+	"""
+	if _COMPILED_PRICES is None:
+		return load_tariff_prices()
+	return _COMPILED_PRICES
+
+
+def __modelled_tariffs(tariff_type: str, index: pd.DatetimeIndex) -> np.ndarray:
+	"""
+	Generate, with the rule-based model, the tariffs of a tariff cycle at each (tz-aware) datetime of an index.
+	"""
+	_, period_codes = COMPILED_SCHEDULES[tariff_type]
+	price_years, prices = get_tariff_prices()[tariff_type]
+
+	# years after the last one priced use its prices, years before the first one use the first one's prices
+	season_nrs, quarter_hours, years = __calendar(index)
+	year_nrs = np.searchsorted(price_years, years, side='right') - 1
+	year_nrs = np.clip(year_nrs, 0, len(price_years) - 1)
+
+	return prices[year_nrs, period_codes[season_nrs, quarter_hours]]
+
+
+def generate_tariffs(tariff_type: str, start_dt: datetime, end_dt: datetime) -> pd.Series:
+	"""
+	Generate the 15' time series of a tariff cycle for the horizon between start_dt and end_dt (both included).
+	:param tariff_type: one of "simples", "bi-horárias", "tri-horárias" or "autoconsumo_simples"
+	:param start_dt: first datetime of the horizon (tz-aware)
+	:param end_dt: last datetime of the horizon (tz-aware)
+	:return: a pandas Series with a UTC datetime index
+	"""
+	index = pd.date_range(start_dt, end_dt, freq='15T').tz_convert('UTC')
+	return pd.Series(__modelled_tariffs(tariff_type, index), index=index, name=tariff_type)
+
+
+def get_tariffs(tariff_type: str, start_dt: datetime, end_dt: datetime) -> pd.Series:
+	"""
+	Get the 15' time series of a tariff cycle for the horizon between start_dt and end_dt (both included).
+	The tariffs of every step covered by the tariffs' store are sliced from it, as deployed; only the other steps
+	(e.g., of years not covered by the store) are generated by the rule-based model. Either way, the same datetime
+	gets the same tariff whichever horizon it belongs to.
+	:param tariff_type: one of "simples", "bi-horárias", "tri-horárias" or "autoconsumo_simples"
+	:param start_dt: first datetime of the horizon (tz-aware)
+	:param end_dt: last datetime of the horizon (tz-aware)
+	:return: a pandas Series with a UTC datetime index
+	"""
+	index = pd.date_range(start_dt, end_dt, freq='15T').tz_convert('UTC')
+	buy_tariffs = get_tariff_store().get(tariff_type, start_dt, end_dt).reindex(index)
+
+	uncovered = buy_tariffs.isna().to_numpy()
+	if uncovered.any():
+		logger.debug(f'Generating {uncovered.sum()} step(s) of "{tariff_type}" tariffs from {start_dt} to {end_dt}.')
+		buy_tariffs[uncovered] = __modelled_tariffs(tariff_type, index[uncovered])
+
+	return buy_tariffs
+
+
+def get_sell_tariffs(buy_tariffs: pd.Series) -> pd.Series:
+	"""
+	Get the selling tariffs that correspond to the buying tariffs provided.
+	:param buy_tariffs: a pandas Series with the buying tariffs
+	:return: a pandas Series, with the same index, with the selling tariffs
+	"""
+	return buy_tariffs * SELL_TARIFF_RATIO
@@ -0,0 +1,194 @@
+import json
+import numpy as np
+import os
+import pandas as pd
+import pickle
+import shutil
+import tempfile
+import threading
+
+from datetime import datetime
+from loguru import logger
+
+
+# Paths to the original tariffs' pickle and to the directory with its columnar (memory-mappable) version;
+# each version of the store, built from a version of the pickle, is written to its own subdirectory, never changed
+# afterwards, and the version in use is named in the CURRENT_FILE, which is atomically replaced when a new one is built
+PICKLES_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'pickles'))
+TARIFFS_PKL_PATH = os.path.join(PICKLES_DIR, 'prices_and_tariffs.pkl')
+TARIFFS_STORE_DIR = os.path.join(PICKLES_DIR, 'tariffs')
+CURRENT_FILE = 'CURRENT'
+METADATA_FILE = 'metadata.json'
+TMP_PREFIX = 'tmp'
+
+# Process-wide store, shared by all threads of a worker; the underlying files are memory-mapped read-only,
+# so different worker processes share the same physical pages through the OS page cache
+_TARIFF_STORE = None
+_TARIFF_STORE_LOCK = threading.Lock()
+
+
+class TariffStore:
+	"""
+	Read-only, memory-mapped columnar store with the buying and self-consumption tariffs per tariff cycle.
+	All columns share the same regular time index, described by its first timestamp and time step,
+	so the offsets of any horizon are computed arithmetically instead of searched.
+	"""
+	def __init__(self, store_dir: str = TARIFFS_STORE_DIR):
+		# (the version in use is read once, so all columns are loaded from the same version)
+		version_dir = os.path.join(store_dir, current_version(store_dir))
+		with open(os.path.join(version_dir, METADATA_FILE), 'r', encoding='utf-8') as handle:
+			metadata = json.load(handle)
+
+		self.start_ns = metadata['start_ns']
+		self.step_ns = metadata['step_ns']
+		self.length = metadata['length']
+		self._columns = {
+			column: np.load(os.path.join(version_dir, file_name), mmap_mode='r')
+			for column, file_name in metadata['columns'].items()
+		}
+
+	@property
+	def columns(self) -> list[str]:
+		return list(self._columns.keys())
+
+	def __offset(self, dt: datetime) -> int:
+		return (pd.Timestamp(dt).value - self.start_ns) // self.step_ns
+
+	def get(self, column: str, start_dt: datetime, end_dt: datetime) -> pd.Series:
+		"""
+		Slice a tariff column for the horizon between start_dt and end_dt (both included).
+		As with a label-based slice, only the part of the horizon covered by the store is returned.
+		:param column: tariff column, e.g., one of "simples", "bi-horárias", "tri-horárias" or "autoconsumo_simples"
+		:param start_dt: first datetime of the horizon (tz-aware)
+		:param end_dt: last datetime of the horizon (tz-aware)
+		:return: a pandas Series with a UTC datetime index
+		"""
+		first = max(self.__offset(start_dt), 0)
+		last = min(self.__offset(end_dt), self.length - 1)
+		if last < first:
+			return pd.Series([], index=pd.DatetimeIndex([], tz='UTC'), dtype=float, name=column)
+
+		index = pd.date_range(start=pd.Timestamp(self.start_ns + first * self.step_ns, tz='UTC'),
+							  periods=last - first + 1,
+							  freq=pd.Timedelta(self.step_ns, unit='ns'))
+
+		return pd.Series(np.array(self._columns[column][first:last + 1]), index=index, name=column)
+
+
+def current_version(store_dir: str) -> str:
+	"""
+	Name of the version of the store in use, i.e., of its subdirectory.
+	:raise FileNotFoundError: if no version of the store was built yet
+	"""
+	with open(os.path.join(store_dir, CURRENT_FILE), 'r', encoding='utf-8') as handle:
+		return handle.read().strip()
+
+
+def pickle_version(pkl_path: str) -> str:
+	"""
+	Name of the version of the store built from the tariffs' pickle, identified by its modification time.
+	"""
+	return f'v{os.stat(pkl_path).st_mtime_ns}'
+
+
+def build_tariff_store(pkl_path: str = TARIFFS_PKL_PATH, store_dir: str = TARIFFS_STORE_DIR):
+	"""
+	Convert the tariffs' pickle into one .npy file per column, plus a metadata file describing the (regular) time index.
+	The new version of the store is written to a temporary directory, moved into place, and only then made the version
+	in use, so concurrent workers never load a partially written store. The version previously in use is kept, since
+	workers may still be loading it, and older ones are removed.
+	:param pkl_path: path to the pickled pandas DataFrame with the tariffs
+	:param store_dir: directory where the columnar store is to be created
+	"""
+	version = pickle_version(pkl_path)
+	version_dir = os.path.join(store_dir, version)
+	os.makedirs(store_dir, exist_ok=True)
+
+	if not os.path.isdir(version_dir):
+		with open(pkl_path, 'rb') as handle:
+			tariffs_df = pickle.load(handle)
+
+		# ensure a sorted, regular time index, so that offsets can be computed directly from the timestamps
+		tariffs_df = tariffs_df.sort_index()
+		step = pd.Series(tariffs_df.index).diff().min()
+		tariffs_df = tariffs_df.asfreq(step)
+		index = tariffs_df.index if tariffs_df.index.tz is not None else tariffs_df.index.tz_localize('UTC')
+
+		tmp_dir = tempfile.mkdtemp(prefix=TMP_PREFIX, dir=store_dir)
+		metadata = {
+			'start_ns': int(index[0].value),
+			'step_ns': int(step.value),
+			'length': len(tariffs_df),
+			'columns': {}
+		}
+		for nr, column in enumerate(tariffs_df.columns):
+			file_name = f'column_{nr}.npy'
+			np.save(os.path.join(tmp_dir, file_name), tariffs_df[column].to_numpy(dtype=np.float64))
+			metadata['columns'][column] = file_name
+		with open(os.path.join(tmp_dir, METADATA_FILE), 'w', encoding='utf-8') as handle:
+			json.dump(metadata, handle, ensure_ascii=False)
+
+		try:
+			os.rename(tmp_dir, version_dir)
+		except OSError:
+			# another worker already moved its own (identical) version into place
+			shutil.rmtree(tmp_dir, ignore_errors=True)
+
+	try:
+		previous_version = current_version(store_dir)
+	except FileNotFoundError:
+		previous_version = None
+	with tempfile.NamedTemporaryFile('w', encoding='utf-8', prefix=TMP_PREFIX, dir=store_dir, delete=False) as handle:
+		handle.write(version)
+	os.replace(handle.name, os.path.join(store_dir, CURRENT_FILE))
+
+	# (the temporary files and directories of workers still building a version are kept)
+	for name in os.listdir(store_dir):
+		if name not in (CURRENT_FILE, version, previous_version) and not name.startswith(TMP_PREFIX):
+			path = os.path.join(store_dir, name)
+			if os.path.isdir(path):
+				shutil.rmtree(path, ignore_errors=True)
+			else:
+				try:
+					os.remove(path)
+				except FileNotFoundError:
+					# (already removed by another worker)
+					pass
+
+
+def __is_store_outdated(pkl_path: str, store_dir: str) -> bool:
+	try:
+		version = current_version(store_dir)
+	except FileNotFoundError:
+		return True
+	return os.path.exists(pkl_path) and version != pickle_version(pkl_path)
+
+
+def load_tariff_store(pkl_path: str = TARIFFS_PKL_PATH, store_dir: str = TARIFFS_STORE_DIR) -> TariffStore:
+	"""
+	Load the columnar tariffs' store, (re)building it first from the pickle if it does not exist or is outdated.
+	Meant to be called once at startup; the loaded store is kept and reused by all subsequent requests.
+	:param pkl_path: path to the pickled pandas DataFrame with the tariffs
+	:param store_dir: directory with the columnar store
+	:return: the loaded tariffs' store
+	"""
+	global _TARIFF_STORE
+
+	with _TARIFF_STORE_LOCK:
+		if __is_store_outdated(pkl_path, store_dir):
+			if not os.path.exists(pkl_path):
+				raise FileNotFoundError(f'tariffs\' pickle not found: {pkl_path}')
+			logger.info('Converting tariffs\' pickle into a columnar store.')
+			build_tariff_store(pkl_path, store_dir)
+		_TARIFF_STORE = TariffStore(store_dir)
+
+	return _TARIFF_STORE
+
+
+def get_tariff_store() -> TariffStore:
+	"""
+	Return the tariffs' store loaded at startup (loading it if that has not happened yet).
+	"""
+	if _TARIFF_STORE is None:
+		return load_tariff_store()
+	return _TARIFF_STORE
@@ -1,40 +1,97 @@
 import threading
+import time
 import warnings
 
 from fastapi import (
 	FastAPI,
+	Query,
+	Request,
 	status
 )
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import (
+	JSONResponse,
+	Response,
+	StreamingResponse
+)
 from loguru import logger
+from typing import (
+	Annotated,
+	Union
+)
 
-from helpers.database_interactions import connect_to_sqlite_db
-from helpers.dataspace_interactions import fetch_meters_location
+from helpers.database_interactions import connect_to_database
+from helpers.dataspace_interactions import (
+	fetch_meters_in_areas,
+	fetch_meters_location,
+	fetch_nearest_meters
+)
 from helpers.log_setting import (
 	remove_logfile_handler,
 	set_logfile_handler,
 	set_stdout_logger
 )
 from helpers.main_helpers import (
+	arrays_milp_return_structure,
 	generate_order_id,
+	has_cluster_assignment,
 	milp_return_clustered_structure,
-	milp_return_structure
+	milp_return_structure,
+	stream_expanded_milp_return_structure,
+	stream_milp_return_structure,
+	summary_return_structure,
+	to_json,
+	windowed_milp_return_structure
+)
+from helpers.order_status import (
+	OrderStatusRegistry,
+	order_status
+)
+from helpers.response_cache import ResponseCache
+from helpers.result_export import (
+	archive_size,
+	export_order_results,
+	iter_archive
+)
+from helpers.tariff_engine import load_tariff_prices
+from schemas.enums import (
+	ExportFormat,
+	OrderStage,
+	ResponseFormat,
+	SummaryGranularity
 )
 from schemas.input_schemas import (
+	DatetimeRetrievalParams,
+	ExpansionParams,
 	MeterByArea,
+	MeterByAreas,
+	NearestMeters,
+	RetrievalParams,
 	SizingInputs,
 	SizingInputsWithShared
 )
 from schemas.output_schemas import (
 	AcceptedResponse,
+	ClusterAssignmentNotFound,
 	ClusteredMILPOutputs,
 	OrderNotFound,
 	OrderNotProcessed,
+	OrderPinned,
+	OrderProcessingFailed,
+	OrderStatus,
+	OrderSummary,
 	MeterIDNotFound,
 	MILPOutputs,
 	TimeseriesDataNotFound,
-	MeterIDs
+	MeterIDs,
+	MeterIDsByArea,
+	MeterIDsWithCoverage,
+	NearestMeterIDs,
+	SummaryGranularityNotAvailable
+)
+from threads.retention_thread import (
+	is_retention_enabled,
+	run_retention_thread
 )
 from threads.run_milp_thread import run_dual_thread
 
@@ -74,36 +131,94 @@ set_stdout_logger()
 app.state.handler = set_logfile_handler('logs')
 
 
-# Runs when the API is started: set loggers and create / connect to SQLite database ####################################
+# Runs when the API is started: set loggers, create / connect to results' database and load tariffs ####################
 @app.on_event('startup')
 def startup_event():
 	# Set up logging
 	set_stdout_logger()
 	app.state.handler = set_logfile_handler('logs')
 
-	# Get cursor and connection to SQLite database
-	app.state.conn, app.state.cursor = connect_to_sqlite_db()
+	# Get the (thread-safe) access layer to the database of the result store configured (SQLite by default)
+	app.state.db = connect_to_database()
 
+	# Load (once) the memory-mapped tariffs' store and derive from it the tariff prices shared by all requests
+	# (the API does not start if the tariffs' pickle is missing, or lacks the tariffs of any tariff cycle)
+	load_tariff_prices()
 
-# Runs when the API is closed: remove logger handlers and disconnect SQLite database ###################################
+	# Cache (in memory, and optionally on disk) the serialized responses with the results of processed orders
+	app.state.response_cache = ResponseCache()
+
+	# Keep (in memory) the status of the orders, updated by the threads that process them
+	app.state.order_status = OrderStatusRegistry()
+
+	# Enforce the orders' retention policy in the background, if configured
+	app.state.retention_stop = threading.Event()
+	app.state.retention_thread = None
+	if is_retention_enabled():
+		# (databases created before the retention policy existed are first migrated, once, so that the space of deleted
+		# orders can be reclaimed; this rebuilds the whole database file, so it is done before any order is processed)
+		if app.state.db.enable_space_reclaim():
+			logger.info('Database migrated so that the space of deleted orders can be reclaimed.')
+		app.state.retention_thread = threading.Thread(target=run_retention_thread,
+													  args=(app.state.db, app.state.retention_stop,
+															app.state.response_cache, app.state.order_status),
+													  daemon=True)
+		app.state.retention_thread.start()
+
+
+# Runs when the API is closed: remove logger handlers and disconnect results' database #################################
 @app.on_event('shutdown')
 def shutdown_event():
 	# Remove all handlers associated with the logger object
 	remove_logfile_handler(app.state.handler)
 
-	# Get cursor and connection to SQLite database
-	app.state.conn.close()
+	# Stop the retention policy's thread (between batches)
+	app.state.retention_stop.set()
+	if app.state.retention_thread is not None:
+		app.state.retention_thread.join()
+
+	# Close all connections to the results' database
+	app.state.db.close()
 
 
 # GEOGRAPHICAL ENDPOINT ################################################################################################
 @app.post('/search_meters_in_area',
 		  description='Search which meters are located within the geographical '
-					  'circle formed by a point [lat, long] and a radius.',
+					  'circle formed by a point [lat, long] and a radius. If a sizing horizon is provided, each '
+					  'meter found is annotated with the (estimated) share of the horizon with measured data, as '
+					  'known from the data previously fetched from the dataspace, and, optionally, the meters whose '
+					  'share is below a threshold are left out.',
 		  status_code=status.HTTP_200_OK,
 		  tags=['Search Meter IDs'])
-def search_meters_in_area(inputs_body: MeterByArea) -> MeterIDs:
+def search_meters_in_area(inputs_body: MeterByArea) -> Union[MeterIDs, MeterIDsWithCoverage]:
 	logger.info('Computing REC area and finding meter IDs within that area.')
-	found_meters = fetch_meters_location(inputs_body)
+	found_meters = fetch_meters_location(inputs_body, app.state.db)
+	return JSONResponse(content=found_meters.dict(), status_code=status.HTTP_200_OK)
+
+
+@app.post('/search_meters_in_areas',
+		  description='Search which meters are located within each of many areas, in a single request. '
+					  'Areas can be circles, formed by a point [lat, long] and a radius, and/or polygons, formed by '
+					  'their vertices [lat, long]; the meter IDs found are returned for each area, in the order the '
+					  'areas were provided.',
+		  status_code=status.HTTP_200_OK,
+		  tags=['Search Meter IDs'])
+def search_meters_in_areas(inputs_body: MeterByAreas) -> MeterIDsByArea:
+	logger.info(f'Finding meter IDs within {len(inputs_body.circles)} circle(s) and '
+				f'{len(inputs_body.polygons)} polygon(s).')
+	found_meters = fetch_meters_in_areas(inputs_body)
+	return JSONResponse(content=found_meters.dict(), status_code=status.HTTP_200_OK)
+
+
+@app.post('/search_nearest_meters',
+		  description='Search which meters are the closest to a point [lat, long] (e.g., a transformer), '
+					  'optionally up to a maximum distance. The meter IDs found are returned with their distance to '
+					  'the point, in km, from the closest to the farthest.',
+		  status_code=status.HTTP_200_OK,
+		  tags=['Search Meter IDs'])
+def search_nearest_meters(inputs_body: NearestMeters) -> NearestMeterIDs:
+	logger.info(f'Finding the {inputs_body.nr_meters} meter ID(s) closest to the location.')
+	found_meters = fetch_nearest_meters(inputs_body)
 	return JSONResponse(content=found_meters.dict(), status_code=status.HTTP_200_OK)
 
 
@@ -122,17 +237,19 @@ def compute_sizing_with_shared_resources(inputs_body: SizingInputsWithShared) ->
 
 	# update the database with the new order ID
 	logger.info('Creating registry in database for new order ID.')
-	app.state.cursor.execute('''
-				INSERT INTO Orders (order_id, processed, error, message, clustered)
-				VALUES (?, ?, ?, ?, ?)
-			''', (id_order, False, '', '', is_clustered))
-	app.state.conn.commit()
+	with app.state.db.writer() as conn:
+		conn.execute('''
+					INSERT INTO Orders (order_id, processed, error, message, clustered, created_at)
+					VALUES (?, ?, ?, ?, ?, ?)
+				''', (id_order, False, '', '', is_clustered, int(time.time())))
+	app.state.order_status.update(id_order, processed=False, clustered=is_clustered, stage=OrderStage.queued,
+								  error='', message='')
 
 	# initiate a parallel process (thread) to start computing the prices
 	# while a message is immediately sent to the user
 	logger.info('Launching thread.')
 	threading.Thread(target=run_dual_thread,
-					 args=(inputs_body, id_order, app.state.conn, app.state.cursor)).start()
+					 args=(inputs_body, id_order, app.state.db, app.state.order_status)).start()
 
 	return JSONResponse(content={'message': 'Processing has started. Use the order ID for status updates.',
 									 'order_id': id_order},
@@ -153,17 +270,19 @@ def compute_sizing_without_shared_resources(inputs_body: SizingInputs) -> Accept
 
 	# update the database with the new order ID
 	logger.info('Creating registry in database for new order ID.')
-	app.state.cursor.execute('''
-				INSERT INTO Orders (order_id, processed, error, message, clustered)
-				VALUES (?, ?, ?, ?, ?)
-			''', (id_order, False, '', '', is_clustered))
-	app.state.conn.commit()
+	with app.state.db.writer() as conn:
+		conn.execute('''
+					INSERT INTO Orders (order_id, processed, error, message, clustered, created_at)
+					VALUES (?, ?, ?, ?, ?, ?)
+				''', (id_order, False, '', '', is_clustered, int(time.time())))
+	app.state.order_status.update(id_order, processed=False, clustered=is_clustered, stage=OrderStage.queued,
+								  error='', message='')
 
 	# initiate a parallel process (thread) to start computing the prices
 	# while a message is immediately sent to the user
 	logger.info('Launching thread.')
 	threading.Thread(target=run_dual_thread,
-					 args=(inputs_body, id_order, app.state.conn, app.state.cursor)).start()
+					 args=(inputs_body, id_order, app.state.db, app.state.order_status)).start()
 
 	return JSONResponse(content={'message': 'Processing has started. Use the order ID for status updates.',
 									 'order_id': id_order},
@@ -171,27 +290,61 @@ def compute_sizing_without_shared_resources(inputs_body: SizingInputs) -> Accept
 
 
 # RETRIEVE SIZING ENDPOINTS ############################################################################################
+@app.get('/orders/{order_id}/status',
+		 summary='Get Order Status',
+		 description='Endpoint for polling the status of an order, provided the order ID: if it was already processed, '
+					 'the stage of its processing, the error raised (if any) and, once correctly processed, the headline '
+					 'results (objective value, MILP status and total REC cost). It never reads nor serializes the '
+					 'full results, so it is advised over the retrieval endpoints for checking if an order is ready.',
+		 responses={
+			 404: {'model': OrderNotFound, 'description': 'Order not found.'}
+		 },
+		 status_code=status.HTTP_200_OK,
+		 tags=['Retrieve Sizing Results'])
+def get_order_status(order_id: str) -> OrderStatus:
+	current_status = order_status(app.state.db, app.state.order_status, order_id)
+
+	if current_status is None:
+		# If the order is not found, return 404 Not Found
+		return JSONResponse(content={'message': 'Order not found.',
+									 'order_id': order_id},
+							status_code=status.HTTP_404_NOT_FOUND)
+
+	return JSONResponse(content=current_status, status_code=status.HTTP_200_OK)
+
+
 @app.get('/get_sizing/{order_id}',
          summary='Get Sizing Results',
-         description='Endpoint for retrieving the sizing results\', provided the order ID.',
+         description='Endpoint for retrieving the sizing results\', provided the order ID. '
+					 'The time-varying outputs can be restricted to some meter IDs, fields and/or time window (start and '
+					 'end), and paged (with limit and cursor). With format=columnar, they are returned as one array per '
+					 'field (per meter ID), aligned with a single shared time axis. '
+					 'With stream=true, the (same) response is streamed as it is read from the database, '
+					 'which is advised for orders with long horizons and/or many meters. '
+					 'Otherwise, responses are cached once built, compressed with gzip or brotli (as accepted by '
+					 'the client), and served with an ETag, so that clients holding them get a 304 Not Modified.',
 		 responses={
 			 202: {'model': OrderNotProcessed, 'description': 'Order found but not yet processed.'},
 			 404: {'model': OrderNotFound, 'description': 'Order not found.'},
 			 412: {'model': MeterIDNotFound, 'description': 'One or more meter IDs not found.'},
 			 422: {'model': TimeseriesDataNotFound,
-				   'description': 'One or more data point for one or more meter IDs not found.'}
+				   'description': 'One or more data point for one or more meter IDs not found.'},
+			 500: {'model': OrderProcessingFailed, 'description': 'Processing of the order failed unexpectedly.'}
 		 },
          status_code=status.HTTP_200_OK,
          tags=['Retrieve Sizing Results'])
-def get_sizing_results(order_id: str) -> MILPOutputs:
+def get_sizing_results(order_id: str,
+					   params: Annotated[DatetimeRetrievalParams, Query()],
+					   request: Request) -> MILPOutputs:
 	# Check if the order_id exists in the database
 	logger.info('Searching for order ID in local database.')
-	app.state.cursor.execute('''
+	cursor = app.state.db.reader().cursor()
+	cursor.execute('''
 		SELECT * FROM Orders WHERE order_id = ? AND clustered = False
 	''', (order_id,))
 
 	# Fetch one row
-	order = app.state.cursor.fetchone()
+	order = cursor.fetchone()
 
 	if order is not None:
 		logger.info('Order ID found. Checking if order has already been processed.')
@@ -214,14 +367,40 @@ def get_sizing_results(order_id: str) -> MILPOutputs:
 											 'order_id': order_id},
 									status_code=status.HTTP_422_UNPROCESSABLE_ENTITY)
 
+			elif error == '500':
+				# If the order is found but its processing failed unexpectedly
+				return JSONResponse(content={'message': message,
+											 'order_id': order_id},
+									status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
 			else:
 				logger.info('Order ID correctly processed. Fetching outputs.')
-				# If the order resulted from a request to a "vanilla" endpoint,
-				# prepare the response message accordingly
-				milp_return = milp_return_structure(app.state.cursor, order_id)
+				if params.stream:
+					# Write the response incrementally, straight from the database, instead of building it in memory
+					return StreamingResponse(stream_milp_return_structure(app.state.db, order_id, clustered=False,
+																		  params=params),
+											 media_type='application/json')
+
+				def build_body() -> bytes:
+					if params.format == ResponseFormat.columnar:
+						# Return the (requested) time-varying outputs as one array per field, instead of as records
+						milp_return = arrays_milp_return_structure(cursor, order_id, clustered=False, params=params)
+
+					elif params.is_windowed():
+						# Only retrieve the time-varying outputs requested
+						milp_return = windowed_milp_return_structure(cursor, order_id, clustered=False, params=params)
 
-				return JSONResponse(content=milp_return,
-									status_code=status.HTTP_200_OK)
+					else:
+						# If the order resulted from a request to a "vanilla" endpoint,
+						# prepare the response message accordingly
+						milp_return = milp_return_structure(cursor, order_id)
+
+					return to_json(milp_return)
+
+				# Results of processed orders never change, so their responses are only built (and serialized) once
+				return app.state.response_cache.response(request, order_id,
+														 f'get_sizing?{params.model_dump_json(exclude={"stream"})}',
+														 build_body)
 
 		else:
 			# If the order is found but not processed, return 202 Accepted
@@ -238,25 +417,35 @@ def get_sizing_results(order_id: str) -> MILPOutputs:
 
 @app.get('/get_clustered_sizing/{order_id}',
          summary='Get (Clustered) Sizing Results',
-         description='Endpoint for retrieving the *clustered* sizing results\', provided the order ID.',
+         description='Endpoint for retrieving the *clustered* sizing results\', provided the order ID. '
+					 'The time-varying outputs can be restricted to some meter IDs and/or fields, and paged '
+					 '(with limit and cursor). With format=columnar, they are returned as one array per field (per meter '
+					 'ID), aligned with a single shared time axis. '
+					 'With stream=true, the (same) response is streamed as it is read from the database. '
+					 'Otherwise, responses are cached once built, compressed with gzip or brotli (as accepted by '
+					 'the client), and served with an ETag, so that clients holding them get a 304 Not Modified.',
 		 responses={
 			 202: {'model': OrderNotProcessed, 'description': 'Order found but not yet processed.'},
 			 404: {'model': OrderNotFound, 'description': 'Order not found.'},
 			 412: {'model': MeterIDNotFound, 'description': 'One or more meter IDs not found.'},
 			 422: {'model': TimeseriesDataNotFound,
-				   'description': 'One or more data point for one or more meter IDs not found.'}
+				   'description': 'One or more data point for one or more meter IDs not found.'},
+			 500: {'model': OrderProcessingFailed, 'description': 'Processing of the order failed unexpectedly.'}
 		 },
          status_code=status.HTTP_200_OK,
          tags=['Retrieve Sizing Results'])
-def get_clustered_sizing_results(order_id: str) -> ClusteredMILPOutputs:
+def get_clustered_sizing_results(order_id: str,
+								 params: Annotated[RetrievalParams, Query()],
+								 request: Request) -> ClusteredMILPOutputs:
 	# Check if the order_id exists in the database
 	logger.info('Searching for order ID in local database.')
-	app.state.cursor.execute('''
+	cursor = app.state.db.reader().cursor()
+	cursor.execute('''
 		SELECT * FROM Orders WHERE order_id = ? AND clustered = True
 	''', (order_id,))
 
 	# Fetch one row
-	order = app.state.cursor.fetchone()
+	order = cursor.fetchone()
 
 	if order is not None:
 		logger.info('Order ID found. Checking if order has already been processed.')
@@ -279,14 +468,123 @@ def get_clustered_sizing_results(order_id: str) -> ClusteredMILPOutputs:
 											 'order_id': order_id},
 									status_code=status.HTTP_422_UNPROCESSABLE_ENTITY)
 
+			elif error == '500':
+				# If the order is found but its processing failed unexpectedly
+				return JSONResponse(content={'message': message,
+											 'order_id': order_id},
+									status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
 			else:
 				logger.info('Order ID correctly processed. Fetching outputs.')
-				# If the order resulted from a request to a "vanilla" endpoint,
-				# prepare the response message accordingly
-				milp_return = milp_return_clustered_structure(app.state.cursor, order_id)
+				if params.stream:
+					# Write the response incrementally, straight from the database, instead of building it in memory
+					return StreamingResponse(stream_milp_return_structure(app.state.db, order_id, clustered=True,
+																		  params=params),
+											 media_type='application/json')
+
+				def build_body() -> bytes:
+					if params.format == ResponseFormat.columnar:
+						# Return the (requested) time-varying outputs as one array per field, instead of as records
+						milp_return = arrays_milp_return_structure(cursor, order_id, clustered=True, params=params)
+
+					elif params.is_windowed():
+						# Only retrieve the time-varying outputs requested
+						milp_return = windowed_milp_return_structure(cursor, order_id, clustered=True, params=params)
+
+					else:
+						# If the order resulted from a request to a "vanilla" endpoint,
+						# prepare the response message accordingly
+						milp_return = milp_return_clustered_structure(cursor, order_id)
+
+					return to_json(milp_return)
+
+				# Results of processed orders never change, so their responses are only built (and serialized) once
+				return app.state.response_cache.response(request, order_id,
+														 f'get_clustered_sizing?{params.model_dump_json(exclude={"stream"})}',
+														 build_body)
+
+		else:
+			# If the order is found but not processed, return 202 Accepted
+			return JSONResponse(content={'message': 'Order found but not yet processed.',
+										 'order_id': order_id},
+								status_code=status.HTTP_202_ACCEPTED)
+
+	else:
+		# If the order is not found, return 404 Not Found
+		return JSONResponse(content={'message': 'Order not found.',
+									 'order_id': order_id},
+							status_code=status.HTTP_404_NOT_FOUND)
 
-				return JSONResponse(content=milp_return,
-									status_code=status.HTTP_200_OK)
+
+@app.get('/orders/{order_id}/expanded',
+		 summary='Get (Clustered) Sizing Results Expanded to the Full Horizon',
+		 description='Endpoint for retrieving the *clustered* sizing results\', provided the order ID, expanded to the '
+					 'original calendar: each day of the horizon takes the time-varying outputs of the representative '
+					 'day it was assigned to (given in "cluster_nr"), in the same structure as the non-clustered '
+					 'results. The response is streamed, built on the fly from the representative days. '
+					 'The time-varying outputs can be restricted to some meter IDs, fields and/or time window.',
+		 responses={
+			 202: {'model': OrderNotProcessed, 'description': 'Order found but not yet processed.'},
+			 404: {'model': OrderNotFound, 'description': 'Order not found.'},
+			 409: {'model': ClusterAssignmentNotFound,
+				   'description': 'Day-to-cluster assignment not stored for the order.'},
+			 412: {'model': MeterIDNotFound, 'description': 'One or more meter IDs not found.'},
+			 422: {'model': TimeseriesDataNotFound,
+				   'description': 'One or more data point for one or more meter IDs not found.'},
+			 500: {'model': OrderProcessingFailed, 'description': 'Processing of the order failed unexpectedly.'}
+		 },
+		 status_code=status.HTTP_200_OK,
+		 tags=['Retrieve Sizing Results'])
+def get_expanded_clustered_sizing_results(order_id: str,
+										  params: Annotated[ExpansionParams, Query()]) -> MILPOutputs:
+	# Check if the order_id exists in the database
+	logger.info('Searching for order ID in local database.')
+	cursor = app.state.db.reader().cursor()
+	cursor.execute('''
+		SELECT * FROM Orders WHERE order_id = ? AND clustered = True
+	''', (order_id,))
+
+	# Fetch one row
+	order = cursor.fetchone()
+
+	if order is not None:
+		logger.info('Order ID found. Checking if order has already been processed.')
+		processed = bool(order[1])
+		error = order[2]
+		message = order[3]
+
+		# Check if the order is processed
+		if processed:
+			logger.info('Order ID processed. Checking if process raised error.')
+			if error == '412':
+				# If the order is found but was met with missing meter ID(s)
+				return JSONResponse(content={'message': message,
+											 'order_id': order_id},
+									status_code=status.HTTP_412_PRECONDITION_FAILED)
+
+			elif error == '422':
+				# If the order is found but was met with missing data point(s)
+				return JSONResponse(content={'message': message,
+											 'order_id': order_id},
+									status_code=status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+			elif error == '500':
+				# If the order is found but its processing failed unexpectedly
+				return JSONResponse(content={'message': message,
+											 'order_id': order_id},
+									status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+			elif not has_cluster_assignment(cursor, order_id):
+				# If the order was processed before the day-to-cluster assignments were stored
+				return JSONResponse(content={'message': 'The day-to-cluster assignment of this order was not stored, '
+														'so its results cannot be expanded.',
+											 'order_id': order_id},
+									status_code=status.HTTP_409_CONFLICT)
+
+			else:
+				logger.info('Order ID correctly processed. Expanding outputs.')
+				return StreamingResponse(stream_expanded_milp_return_structure(app.state.db, order_id, params),
+										 media_type='application/json')
 
 		else:
 			# If the order is found but not processed, return 202 Accepted
@@ -301,6 +599,212 @@ def get_clustered_sizing_results(order_id: str) -> ClusteredMILPOutputs:
 							status_code=status.HTTP_404_NOT_FOUND)
 
 
+@app.get('/orders/{order_id}/export',
+		 summary='Export Sizing Results',
+		 description='Endpoint for exporting the (clustered or non-clustered) sizing results\', provided the order ID, '
+					 'as a zip archive with one typed columnar file per table (general MILP outputs, member costs, '
+					 'meter investment outputs, meter operation inputs and outputs, self-consumption tariffs and LEM '
+					 'prices), in Apache Parquet or Apache Arrow (IPC file) format. The rows of the meter tables are '
+					 'ordered by meter ID and then by time step.',
+		 responses={
+			 200: {'content': {'application/zip': {}}, 'description': 'Zip archive with the tables of the order.'},
+			 202: {'model': OrderNotProcessed, 'description': 'Order found but not yet processed.'},
+			 404: {'model': OrderNotFound, 'description': 'Order not found.'},
+			 412: {'model': MeterIDNotFound, 'description': 'One or more meter IDs not found.'},
+			 422: {'model': TimeseriesDataNotFound,
+				   'description': 'One or more data point for one or more meter IDs not found.'},
+			 500: {'model': OrderProcessingFailed, 'description': 'Processing of the order failed unexpectedly.'}
+		 },
+		 response_class=Response,
+		 status_code=status.HTTP_200_OK,
+		 tags=['Retrieve Sizing Results'])
+def export_sizing_results(order_id: str, export_format: ExportFormat = Query(ExportFormat.parquet, alias='format')):
+	# Check if the order_id exists in the database
+	logger.info('Searching for order ID in local database.')
+	cursor = app.state.db.reader().cursor()
+	cursor.execute('''
+		SELECT * FROM Orders WHERE order_id = ?
+	''', (order_id,))
+
+	# Fetch one row
+	order = cursor.fetchone()
+
+	if order is not None:
+		logger.info('Order ID found. Checking if order has already been processed.')
+		processed = bool(order[1])
+		error = order[2]
+		message = order[3]
+		clustered = bool(order[4])
+
+		# Check if the order is processed
+		if processed:
+			logger.info('Order ID processed. Checking if process raised error.')
+			if error == '412':
+				# If the order is found but was met with missing meter ID(s)
+				return JSONResponse(content={'message': message,
+											 'order_id': order_id},
+									status_code=status.HTTP_412_PRECONDITION_FAILED)
+
+			elif error == '422':
+				# If the order is found but was met with missing data point(s)
+				return JSONResponse(content={'message': message,
+											 'order_id': order_id},
+									status_code=status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+			elif error == '500':
+				# If the order is found but its processing failed unexpectedly
+				return JSONResponse(content={'message': message,
+											 'order_id': order_id},
+									status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+			else:
+				logger.info('Order ID correctly processed. Exporting outputs.')
+				archive_file = export_order_results(app.state.db, order_id, clustered, export_format)
+				filename = f'{order_id}_{export_format.value}.zip'
+
+				# the archive is streamed from its temporary file, which is deleted once sent
+				return StreamingResponse(iter_archive(archive_file),
+										 media_type='application/zip',
+										 headers={'Content-Disposition': f'attachment; filename="{filename}"',
+												  'Content-Length': str(archive_size(archive_file))},
+										 status_code=status.HTTP_200_OK)
+
+		else:
+			# If the order is found but not processed, return 202 Accepted
+			return JSONResponse(content={'message': 'Order found but not yet processed.',
+										 'order_id': order_id},
+								status_code=status.HTTP_202_ACCEPTED)
+
+	else:
+		# If the order is not found, return 404 Not Found
+		return JSONResponse(content={'message': 'Order not found.',
+									 'order_id': order_id},
+							status_code=status.HTTP_404_NOT_FOUND)
+
+
+@app.get('/orders/{order_id}/summary',
+		 summary='Get Sizing Results Summary',
+		 description='Endpoint for retrieving a summary of the (clustered or non-clustered) sizing results\', provided '
+					 'the order ID: the energy supplied, purchased in the LEM and sold in the LEM, summed per meter ID '
+					 'and for the whole community, and the mean and percentiles of the LEM prices, per period. '
+					 'Periods are days (the default) or months for non-clustered orders, and the representative days '
+					 'for clustered orders. The aggregates are precomputed when the results are stored, so no '
+					 'time-varying results are read.',
+		 responses={
+			 202: {'model': OrderNotProcessed, 'description': 'Order found but not yet processed.'},
+			 400: {'model': SummaryGranularityNotAvailable,
+				   'description': 'Aggregates not available for the granularity requested.'},
+			 404: {'model': OrderNotFound, 'description': 'Order not found.'},
+			 412: {'model': MeterIDNotFound, 'description': 'One or more meter IDs not found.'},
+			 422: {'model': TimeseriesDataNotFound,
+				   'description': 'One or more data point for one or more meter IDs not found.'},
+			 500: {'model': OrderProcessingFailed, 'description': 'Processing of the order failed unexpectedly.'}
+		 },
+		 status_code=status.HTTP_200_OK,
+		 tags=['Retrieve Sizing Results'])
+def get_sizing_summary(order_id: str, request: Request, granularity: SummaryGranularity = None) -> OrderSummary:
+	# Check if the order_id exists in the database
+	logger.info('Searching for order ID in local database.')
+	cursor = app.state.db.reader().cursor()
+	cursor.execute('''
+		SELECT * FROM Orders WHERE order_id = ?
+	''', (order_id,))
+
+	# Fetch one row
+	order = cursor.fetchone()
+
+	if order is not None:
+		logger.info('Order ID found. Checking if order has already been processed.')
+		processed = bool(order[1])
+		error = order[2]
+		message = order[3]
+		clustered = bool(order[4])
+
+		# Check if the order is processed
+		if processed:
+			logger.info('Order ID processed. Checking if process raised error.')
+			if error == '412':
+				# If the order is found but was met with missing meter ID(s)
+				return JSONResponse(content={'message': message,
+											 'order_id': order_id},
+									status_code=status.HTTP_412_PRECONDITION_FAILED)
+
+			elif error == '422':
+				# If the order is found but was met with missing data point(s)
+				return JSONResponse(content={'message': message,
+											 'order_id': order_id},
+									status_code=status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+			elif error == '500':
+				# If the order is found but its processing failed unexpectedly
+				return JSONResponse(content={'message': message,
+											 'order_id': order_id},
+									status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+			available = [SummaryGranularity.representative_day] if clustered \
+				else [SummaryGranularity.day, SummaryGranularity.month]
+			granularity = granularity or available[0]
+			if granularity not in available:
+				# If the periods requested are not those of the order (e.g., calendar months for a clustered order)
+				return JSONResponse(content={'message': f'Aggregates per "{granularity.value}" are not available for '
+														f'this order; use one of: '
+														f'{", ".join(option.value for option in available)}.',
+											 'order_id': order_id},
+									status_code=status.HTTP_400_BAD_REQUEST)
+
+			logger.info('Order ID correctly processed. Fetching summary.')
+			# Results of processed orders never change, so their responses are only built (and serialized) once
+			return app.state.response_cache.response(
+				request, order_id, f'summary?{granularity.value}',
+				lambda: to_json(summary_return_structure(app.state.db, order_id, granularity))
+			)
+
+		else:
+			# If the order is found but not processed, return 202 Accepted
+			return JSONResponse(content={'message': 'Order found but not yet processed.',
+										 'order_id': order_id},
+								status_code=status.HTTP_202_ACCEPTED)
+
+	else:
+		# If the order is not found, return 404 Not Found
+		return JSONResponse(content={'message': 'Order not found.',
+									 'order_id': order_id},
+							status_code=status.HTTP_404_NOT_FOUND)
+
+
+# MANAGE ORDERS ENDPOINTS ##############################################################################################
+@app.post('/pin_order/{order_id}',
+		  summary='Pin / Unpin Order',
+		  description='Endpoint for excluding an order (and its results) from the retention policy, '
+					  'so that it is never deleted; use pinned=false to include it again.',
+		  responses={
+			  404: {'model': OrderNotFound, 'description': 'Order not found.'}
+		  },
+		  status_code=status.HTTP_200_OK,
+		  tags=['Manage Orders'])
+def pin_order(order_id: str, pinned: bool = True) -> OrderPinned:
+	logger.info(f'{"Pinning" if pinned else "Unpinning"} order ID.')
+	with app.state.db.writer() as conn:
+		order = conn.execute('''
+			SELECT order_id FROM Orders WHERE order_id = ?
+		''', (order_id,)).fetchone()
+		if order is not None:
+			conn.execute('''
+				UPDATE Orders SET pinned = ? WHERE order_id = ?
+			''', (pinned, order_id))
+
+	if order is None:
+		# If the order is not found, return 404 Not Found
+		return JSONResponse(content={'message': 'Order not found.',
+									 'order_id': order_id},
+							status_code=status.HTTP_404_NOT_FOUND)
+
+	return JSONResponse(content={'message': f'Order {"pinned" if pinned else "unpinned"}.',
+								 'order_id': order_id,
+								 'pinned': pinned},
+						status_code=status.HTTP_200_OK)
+
+
 if __name__ == '__main__':
 	import uvicorn
 	import os
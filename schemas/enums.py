@@ -10,3 +10,45 @@ class MILPStatus(str, Enum):
 	optimal = 'Optimal',
 	unbounded = 'Unbounded',
 	infeasible = 'Infeasible'
+
+
+class TimeseriesField(str, Enum):
+	energy_generated = 'energy_generated'
+	energy_consumed = 'energy_consumed'
+	buy_tariff = 'buy_tariff'
+	sell_tariff = 'sell_tariff'
+	energy_surplus = 'energy_surplus'
+	energy_supplied = 'energy_supplied'
+	energy_purchased_lem = 'energy_purchased_lem'
+	energy_sold_lem = 'energy_sold_lem'
+	net_load = 'net_load'
+	bess_energy_charged = 'bess_energy_charged'
+	bess_energy_discharged = 'bess_energy_discharged'
+	bess_energy_content = 'bess_energy_content'
+	self_consumption_tariff = 'self_consumption_tariff'
+	lem_price = 'value'
+
+
+class ResponseFormat(str, Enum):
+	records = 'records'
+	columnar = 'columnar'
+
+
+class ExportFormat(str, Enum):
+	parquet = 'parquet'
+	arrow = 'arrow'
+
+
+class OrderStage(str, Enum):
+	queued = 'queued'
+	fetching_data = 'fetching_data'
+	optimizing = 'optimizing'
+	storing_results = 'storing_results'
+	finished = 'finished'
+	failed = 'failed'
+
+
+class SummaryGranularity(str, Enum):
+	day = 'day'
+	month = 'month'
+	representative_day = 'representative_day'
@@ -6,7 +6,8 @@ from datetime import (
 from pydantic import (
 	BaseModel,
 	Field,
-	field_validator
+	field_validator,
+	model_validator
 )
 from pydantic_extra_types.coordinate import Coordinate
 from typing import (
@@ -15,7 +16,11 @@ from typing import (
 	Set
 )
 
-from .enums import DatasetOrigin
+from .enums import (
+	DatasetOrigin,
+	ResponseFormat,
+	TimeseriesField
+)
 
 
 # GEOGRAPHICAL ENDPOINT ################################################################################################
@@ -39,6 +44,110 @@ class MeterByArea(BaseModel):
 		description='Radius, in km, that gives origin to a circle with the center in Latitude and Longitude. Meters '
 					'within this circle will be retrieved from dataspace to form the REC.'
 	)
+	start_datetime: Optional[datetime] = Field(
+		default=None,
+		description='Start date of the sizing horizon (included in it) in ISO 8601 format. If provided, together with '
+					'"end_datetime", each meter ID found is annotated with its data coverage for the horizon, '
+					'estimated from the data availability known locally (i.e., from the data previously fetched from '
+					'the dataspace), without querying the dataspace.',
+		examples=['2024-05-16T00:00:00Z']
+	)
+	end_datetime: Optional[datetime] = Field(
+		default=None,
+		description='End date of the sizing horizon (included in it) in ISO 8601 format.',
+		examples=['2024-05-23T00:00:00Z']
+	)
+	min_coverage: Optional[float] = Field(
+		default=None,
+		ge=0,
+		le=1,
+		description='If provided (with a horizon), meter IDs whose data coverage for the horizon is below this share '
+					'(between 0 and 1) are left out; meter IDs whose coverage is not known yet are kept.',
+		examples=[0.95]
+	)
+
+	@field_validator('start_datetime', 'end_datetime')
+	def parse_datetime(cls, dt):
+		return dt if dt is None else dt.astimezone(timezone.utc)
+
+	@model_validator(mode='after')
+	def is_horizon_complete(self):
+		assert (self.start_datetime is None) == (self.end_datetime is None), \
+			'start_datetime and end_datetime must be provided together'
+		assert self.start_datetime is None or self.end_datetime > self.start_datetime, \
+			'end_datetime <= start_datetime'
+		assert self.min_coverage is None or self.start_datetime is not None, \
+			'min_coverage requires start_datetime and end_datetime'
+		return self
+
+
+class CircleArea(BaseModel):
+	center: Coordinate = Field(
+		description='Latitude and Longitude of the center of the circle.',
+		examples=[{'latitude': 41.1579, 'longitude': -8.6291}]
+	)
+	radius: float = Field(
+		ge=0,
+		description='Radius of the circle, in km.',
+		examples=[4]
+	)
+
+
+class PolygonArea(BaseModel):
+	vertices: List[Coordinate] = Field(
+		min_length=3,
+		description='Latitude and Longitude of each vertex of the polygon, in order (the last vertex is connected back '
+					'to the first one). Edges are taken as straight lines between the vertices\' coordinates.',
+		examples=[[{'latitude': 41.14, 'longitude': -8.66},
+				   {'latitude': 41.18, 'longitude': -8.66},
+				   {'latitude': 41.18, 'longitude': -8.60},
+				   {'latitude': 41.14, 'longitude': -8.60}]]
+	)
+
+
+class MeterByAreas(BaseModel):
+	dataset_origin: DatasetOrigin = Field(
+		description='Dataset origin from which the meter IDs\' data is to be retrieved from. '
+					'Two options are provided:\n - SEL (Smart Energy Lab)\n - INDATA',
+		default='INDATA',
+		examples=['INDATA']
+	)
+	circles: List[CircleArea] = Field(
+		default=[],
+		max_length=1000,
+		description='Circles, formed by a point [lat, long] and a radius, in which to search for meters.'
+	)
+	polygons: List[PolygonArea] = Field(
+		default=[],
+		max_length=1000,
+		description='Polygons in which to search for meters.'
+	)
+
+
+class NearestMeters(BaseModel):
+	dataset_origin: DatasetOrigin = Field(
+		description='Dataset origin from which the meter IDs\' data is to be retrieved from. '
+					'Two options are provided:\n - SEL (Smart Energy Lab)\n - INDATA',
+		default='INDATA',
+		examples=['INDATA']
+	)
+	location: Coordinate = Field(
+		description='Latitude and Longitude of the location (e.g., of a transformer) from which to search for meters.',
+		examples=[{'latitude': 41.1579, 'longitude': -8.6291}]
+	)
+	nr_meters: int = Field(
+		ge=1,
+		le=1000,
+		description='Number of meters to find, the closest to the location.',
+		examples=[10]
+	)
+	max_distance: Optional[float] = Field(
+		default=None,
+		ge=0,
+		description='If provided, only meters up to this distance from the location, in km, are found (hence, fewer '
+					'meters than requested may be returned).',
+		examples=[5]
+	)
 
 
 # LAUNCH SIZING ENDPOINTS ##############################################################################################
@@ -213,3 +322,93 @@ class SizingInputsWithShared(SizingInputs):
 					f'The sum of all ownerships for shared_meter_id {shared_meter_id} must equal 100%.'
 
 			return ownerships
+
+
+# RETRIEVE SIZING ENDPOINTS ############################################################################################
+class RetrievalParams(BaseModel):
+	stream: bool = Field(
+		default=False,
+		description='If true, the response is streamed as it is read from the database, which is advised for orders '
+					'with long horizons and/or many meters.'
+	)
+	format: ResponseFormat = Field(
+		default='records',
+		description='Layout of the time-varying results. Two options are provided:\n'
+					' - records: a list of records (i.e., objects with all fields) per time step (and meter ID)\n'
+					' - columnar: one array per field (per meter ID), aligned with a single shared "time_axis", '
+					'which makes for much smaller responses.'
+	)
+	meter_ids: Optional[List[str]] = Field(
+		default=None,
+		description='Only return the time-varying results of these meter IDs (all, if not provided).',
+		examples=[['Meter#1']]
+	)
+	fields: Optional[List[TimeseriesField]] = Field(
+		default=None,
+		description='Only return these time-varying fields (all, if not provided). '
+					'Time-varying arrays without any of the fields are left out of the response.',
+		examples=[['net_load', 'value']]
+	)
+	cursor: Optional[int] = Field(
+		default=None,
+		ge=0,
+		description='Cursor of the page of time steps to return, as given in the "next_cursor" of the previous page.'
+	)
+	limit: Optional[int] = Field(
+		default=None,
+		ge=1,
+		description='Maximum number of time steps per page. If provided, the response includes the "next_cursor" of '
+					'the following page (null on the last page).',
+		examples=[672]
+	)
+
+	def is_windowed(self) -> bool:
+		# if only part of the time-varying results is requested
+		return any(value is not None for value in self.model_dump(exclude={'stream', 'format'}).values())
+
+
+class DatetimeRetrievalParams(RetrievalParams):
+	start: Optional[datetime] = Field(
+		default=None,
+		description='Only return the time-varying results from this datetime onward (included), in ISO 8601 format.',
+		examples=['2024-05-16T00:00:00Z']
+	)
+	end: Optional[datetime] = Field(
+		default=None,
+		description='Only return the time-varying results up to this datetime (included), in ISO 8601 format.',
+		examples=['2024-05-22T23:45:00Z']
+	)
+
+	@field_validator('start', 'end')
+	def parse_datetime(cls, dt):
+		return dt if dt is None else dt.astimezone(timezone.utc)
+
+
+class ExpansionParams(BaseModel):
+	meter_ids: Optional[List[str]] = Field(
+		default=None,
+		description='Only return the time-varying results of these meter IDs (all, if not provided).',
+		examples=[['Meter#1']]
+	)
+	fields: Optional[List[TimeseriesField]] = Field(
+		default=None,
+		description='Only return these time-varying fields (all, if not provided). '
+					'Time-varying arrays without any of the fields are left out of the response.',
+		examples=[['net_load', 'value']]
+	)
+	start: Optional[datetime] = Field(
+		default=None,
+		description='Only return the (expanded) time-varying results from this datetime onward (included), '
+					'in ISO 8601 format.',
+		examples=['2024-05-16T00:00:00Z']
+	)
+	end: Optional[datetime] = Field(
+		default=None,
+		description='Only return the (expanded) time-varying results up to this datetime (included), '
+					'in ISO 8601 format.',
+		examples=['2024-05-22T23:45:00Z']
+	)
+
+	@field_validator('start', 'end')
+	def parse_datetime(cls, dt):
+		return dt if dt is None else dt.astimezone(timezone.utc)
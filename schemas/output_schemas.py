@@ -6,8 +6,13 @@ from pydantic import (
 	BaseModel,
 	Field
 )
+from typing import Optional
 
-from schemas.enums import MILPStatus
+from schemas.enums import (
+	MILPStatus,
+	OrderStage,
+	SummaryGranularity
+)
 
 
 ########################################################################################################################
@@ -48,6 +53,46 @@ class OrderNotFound(BaseModel):
 	)
 
 
+class OrderPinned(BaseModel):
+	message: str = Field(
+		examples=['Order pinned.']
+	)
+	order_id: str = Field(
+		max_length=45,
+		min_length=45,
+		description='Order identifier for the request.',
+		examples=['iaMiULXA9BktPUu2b_PwTtycCSNe0_wYpPt9muwlEtgL49GDg-kggSktAjtu']
+	)
+	pinned: bool = Field(
+		description='If the order is excluded from the retention policy, i.e., if it is never deleted.',
+		examples=[True]
+	)
+
+
+class SummaryGranularityNotAvailable(BaseModel):
+	message: str = Field(
+		examples=['Aggregates per "month" are not available for this order; use one of: day, month.']
+	)
+	order_id: str = Field(
+		max_length=45,
+		min_length=45,
+		description='Order identifier for the request.',
+		examples=['iaMiULXA9BktPUu2b_PwTtycCSNe0_wYpPt9muwlEtgL49GDg-kggSktAjtu']
+	)
+
+
+class ClusterAssignmentNotFound(BaseModel):
+	message: str = Field(
+		examples=['The day-to-cluster assignment of this order was not stored, so its results cannot be expanded.']
+	)
+	order_id: str = Field(
+		max_length=45,
+		min_length=45,
+		description='Order identifier for the request.',
+		examples=['iaMiULXA9BktPUu2b_PwTtycCSNe0_wYpPt9muwlEtgL49GDg-kggSktAjtu']
+	)
+
+
 class MeterIDNotFound(BaseModel):
 	message: str = Field(
 		examples=['Data for one or more meter IDs not found on registry system.']
@@ -76,6 +121,18 @@ class TimeseriesDataNotFound(BaseModel):
 	)
 
 
+class OrderProcessingFailed(BaseModel):
+	message: str = Field(
+		examples=['The processing of the order failed unexpectedly (ConnectionError).']
+	)
+	order_id: str = Field(
+		max_length=45,
+		min_length=45,
+		description='Order identifier for the request.',
+		examples=['iaMiULXA9BktPUu2b_PwTtycCSNe0_wYpPt9muwlEtgL49GDg-kggSktAjtu']
+	)
+
+
 ########################################################################################################################
 # DATA RESPONSES
 ########################################################################################################################
@@ -87,6 +144,54 @@ class MeterIDs(BaseModel):
 	)
 
 
+class MeterCoverage(BaseModel):
+	meter_id: str = Field(
+		description='Meter ID found.',
+		examples=['Meter#1']
+	)
+	coverage: Optional[float] = Field(
+		description='Estimated share of the 15\' time steps of the horizon with measured data, over the days of the '
+					'horizon whose data availability is known locally (null if none is).',
+		examples=[0.98]
+	)
+	indexed: float = Field(
+		description='Share of the 15\' time steps of the horizon on days whose data availability is known locally.',
+		examples=[1.0]
+	)
+
+
+class MeterIDsWithCoverage(MeterIDs):
+	coverage: list[MeterCoverage] = Field(
+		description='Data coverage of each meter ID found, for the horizon provided, in the same order.'
+	)
+
+
+class MeterIDsByArea(BaseModel):
+	circles: list[MeterIDs] = Field(
+		description='Meter IDs found within each circle, in the order the circles were provided.'
+	)
+	polygons: list[MeterIDs] = Field(
+		description='Meter IDs found within each polygon, in the order the polygons were provided.'
+	)
+
+
+class NearbyMeter(BaseModel):
+	meter_id: str = Field(
+		description='Meter ID found.',
+		examples=['Meter#1']
+	)
+	distance: float = Field(
+		description='Great-circle distance, in km, from the location to the meter.',
+		examples=[0.42]
+	)
+
+
+class NearestMeterIDs(BaseModel):
+	meters: list[NearbyMeter] = Field(
+		description='Meter IDs found, from the closest to the farthest from the location.'
+	)
+
+
 # RETRIEVE SIZING ENDPOINT #############################################################################################
 class IndividualCosts(BaseModel):
 	meter_id: str = Field(
@@ -364,10 +469,12 @@ class NoDatetimeVaryingOutputs(BaseModel):
 
 class MILPOutputs(NoDatetimeVaryingOutputs):
 	meter_operation_inputs: list[InputsPerMeterAndDatetime] = Field(
-		description='All time-varying inputs that were fed into the MILP, per meter ID.'
+		description='All time-varying inputs that were fed into the MILP, per meter ID '
+					'(ordered by meter ID and then by datetime).'
 	)
 	meter_operation_outputs: list[OutputsPerMeterAndDatetime] = Field(
-		description='Time-varying outputs calculated in the MILP, per meter ID.'
+		description='Time-varying outputs calculated in the MILP, per meter ID '
+					'(ordered by meter ID and then by datetime).'
 	)
 	self_consumption_tariffs: list[SelfConsumptionTariffsPerDatetime] = Field(
 		description='List with the self-consumption tariffs considered by the MILP.'
@@ -375,14 +482,22 @@ class MILPOutputs(NoDatetimeVaryingOutputs):
 	lem_prices: list[LemPrice] = Field(
 		description='List with the local energy market prices computed for the requested horizon.'
 	)
+	next_cursor: Optional[int] = Field(
+		default=None,
+		description='Only when a page of time steps is requested (i.e., with "limit"): cursor of the following page, '
+					'or null if this is the last one.',
+		examples=[672]
+	)
 
 
 class ClusteredMILPOutputs(NoDatetimeVaryingOutputs):
 	clustered_meter_operation_inputs: list[ClusteredInputsPerMeterAndDatetime] = Field(
-		description='All (clustered) time-varying inputs that were fed into the MILP, per meter ID.'
+		description='All (clustered) time-varying inputs that were fed into the MILP, per meter ID '
+					'(ordered by meter ID, and then by cluster number and time).'
 	)
 	clustered_meter_operation_outputs: list[ClusteredOutputsPerMeterAndDatetime] = Field(
-		description='(Clustered) time-varying outputs calculated in the MILP, per meter ID.'
+		description='(Clustered) time-varying outputs calculated in the MILP, per meter ID '
+					'(ordered by meter ID, and then by cluster number and time).'
 	)
 	clustered_self_consumption_tariffs: list[ClusteredSelfConsumptionTariffsPerDatetime] = Field(
 		description='List with the (clustered) self-consumption tariffs considered by the MILP.'
@@ -390,3 +505,135 @@ class ClusteredMILPOutputs(NoDatetimeVaryingOutputs):
 	clustered_lem_prices: list[ClusteredLemPrice] = Field(
 		description='List with the (clustered) local energy market prices computed for the requested horizon.'
 	)
+	next_cursor: Optional[int] = Field(
+		default=None,
+		description='Only when a page of time steps is requested (i.e., with "limit"): cursor of the following page, '
+					'or null if this is the last one.',
+		examples=[672]
+	)
+
+
+# ORDER STATUS ENDPOINT ################################################################################################
+class OrderStatus(BaseModel):
+	order_id: str = Field(
+		max_length=45,
+		min_length=45,
+		description='Order identifier for the request.',
+		examples=['iaMiULXA9BktPUu2b_PwTtycCSNe0_wYpPt9muwlEtgL49GDg-kggSktAjtu']
+	)
+	processed: bool = Field(
+		description='If the processing of the order is over, either with its results or with an error.',
+		examples=[True]
+	)
+	clustered: bool = Field(
+		description='If the order is a clustered one, i.e., if its results are retrieved with /get_clustered_sizing.',
+		examples=[False]
+	)
+	stage: Optional[OrderStage] = Field(
+		description='Stage of the processing of the order; null if unknown, i.e., if the order is still being '
+					'processed, but by an instance of the API other than the one answering.',
+		examples=['optimizing']
+	)
+	error: str = Field(
+		description='HTTP status code with which the results are refused ("412" for meter IDs not found, '
+					'"422" for data points not found, "500" for an unexpected failure of its processing), '
+					'or an empty string if there was no error.',
+		examples=['']
+	)
+	message: str = Field(
+		description='Message describing the error, if any.',
+		examples=['']
+	)
+	objective_value: Optional[float] = Field(
+		default=None,
+		description='Only once the order is correctly processed: objective value found for the MILP solution.',
+		examples=[5.0]
+	)
+	milp_status: Optional[MILPStatus] = Field(
+		default=None,
+		description='Only once the order is correctly processed: if the MILP was optimally solved.'
+	)
+	total_rec_cost: Optional[float] = Field(
+		default=None,
+		description='Only once the order is correctly processed: total cost (operation + investment) for the whole '
+					'community, in €.',
+		examples=[5.0]
+	)
+
+
+# ORDER SUMMARY ENDPOINT ###############################################################################################
+class CommonPeriodAggregates(BaseModel):
+	period: str = Field(
+		description='Period of the aggregates: the date ("YYYY-MM-DD") for daily aggregates, the month ("YYYY-MM") for '
+					'monthly aggregates, or the cluster number for the representative days of clustered orders.',
+		examples=['2024-05-16']
+	)
+	energy_supplied: float = Field(
+		description='Total energy supplied that was bought from the retailer in the period, in kWh.',
+		examples=[5.0]
+	)
+	energy_purchased_lem: float = Field(
+		description='Total energy that was purchased in the local energy market (LEM) in the period, in kWh.',
+		examples=[5.0]
+	)
+	energy_sold_lem: float = Field(
+		description='Total energy that was sold in the local energy market (LEM) in the period, in kWh.',
+		examples=[5.0]
+	)
+
+
+class CommunityPeriodAggregates(CommonPeriodAggregates):
+	nr_days: float = Field(
+		description='Number of days of the period within the horizon of the order (for the representative days of '
+					'clustered orders, the number of days each one represents).',
+		examples=[1.0]
+	)
+	lem_price_mean: float = Field(
+		description='Mean LEM price in the period, in €/kWh.',
+		examples=[0.1]
+	)
+	lem_price_min: float = Field(
+		description='Minimum LEM price in the period, in €/kWh.',
+		examples=[0.05]
+	)
+	lem_price_p10: float = Field(
+		description='10th percentile of the LEM prices in the period, in €/kWh.',
+		examples=[0.06]
+	)
+	lem_price_median: float = Field(
+		description='Median LEM price in the period, in €/kWh.',
+		examples=[0.1]
+	)
+	lem_price_p90: float = Field(
+		description='90th percentile of the LEM prices in the period, in €/kWh.',
+		examples=[0.14]
+	)
+	lem_price_max: float = Field(
+		description='Maximum LEM price in the period, in €/kWh.',
+		examples=[0.15]
+	)
+
+
+class MeterPeriodAggregates(CommonPeriodAggregates):
+	meter_id: str = Field(
+		description='The string that identifies the meter of the REC.',
+		examples=['Meter#1']
+	)
+
+
+class OrderSummary(BaseModel):
+	order_id: str = Field(
+		max_length=45,
+		min_length=45,
+		description='Order identifier for the request.',
+		examples=['iaMiULXA9BktPUu2b_PwTtycCSNe0_wYpPt9muwlEtgL49GDg-kggSktAjtu']
+	)
+	granularity: SummaryGranularity = Field(
+		description='Periods of the aggregates.'
+	)
+	community_aggregates: list[CommunityPeriodAggregates] = Field(
+		description='Energy flows of the whole community and statistics of the LEM prices, per period.'
+	)
+	meter_aggregates: list[MeterPeriodAggregates] = Field(
+		description='Energy flows per meter ID and period.'
+	)
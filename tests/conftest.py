@@ -0,0 +1,19 @@
+import pytest
+
+from helpers.database_interactions import connect_to_database
+
+
+@pytest.fixture(params=['sqlite', 'duckdb'])
+def db(request, tmp_path, monkeypatch):
+	"""
+	Results' database of each backend, created from scratch under a temporary directory.
+	"""
+	if request.param == 'duckdb':
+		pytest.importorskip('duckdb')
+	# the databases are created under "files/", relative to the working directory
+	monkeypatch.chdir(tmp_path)
+	(tmp_path / 'files').mkdir()
+	db = connect_to_database(request.param)
+	yield db
+	db.close()
+
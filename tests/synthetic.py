@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+import time
+
+from helpers.database_interactions import store_milp_results
+
+
+def store_synthetic_order(db, order_id: str, nr_meters: int = 3, nr_steps: int = 96, created_at: int = None,
+						  seed: int = 0, day_clusters: list[int] = None):
+	"""
+	Store an order with random results, as the sizing threads do.
+	If the representative day (cluster number) of each day of the horizon is provided, the order is a clustered one,
+	with the time series of the representative days only (and "nr_steps" is ignored).
+	"""
+	rng = np.random.default_rng(seed)
+	nr_clusters = max(day_clusters) + 1 if day_clusters else 0
+	nr_datetimes = len(day_clusters) * 96 if day_clusters else nr_steps
+	if nr_clusters:
+		nr_steps = nr_clusters * 96
+	meter_ids = [f'meter_{nr}' for nr in range(nr_meters)]
+
+	def series_by_meter():
+		return {meter_id: list(rng.random(nr_steps)) for meter_id in meter_ids}
+
+	def scalar_by_meter():
+		return {meter_id: float(rng.random()) for meter_id in meter_ids}
+
+	inputs = {
+		'meters': {meter_id: {key: list(rng.random(nr_steps)) for key in ('e_g_factor', 'e_c', 'l_buy', 'l_sell')}
+				   for meter_id in meter_ids},
+		'l_grid': list(rng.random(nr_steps))
+	}
+	if nr_clusters:
+		inputs['w_clustering'] = list(np.repeat(np.bincount(day_clusters, minlength=nr_clusters), 96).astype(float))
+	results = {'milp_status': 'Optimal', 'e_cmet': series_by_meter()}
+	results_pp = {'obj_value': float(rng.random()), 'dual_prices': list(rng.random(nr_steps))}
+	for key in ('e_sur', 'e_sup', 'e_pur_pool', 'e_sale_pool', 'e_bc', 'e_bd', 'e_bat', 'e_slc_pool'):
+		results_pp[key] = series_by_meter()
+	for key in ('member_cost', 'member_cost_compensations', 'installation_cost_compensations', 'p_gn_new',
+				'PV_investments_cost', 'e_bn_new', 'batteries_investments_cost', 'p_gn_total', 'e_bn_total', 'p_cont',
+				'contractedpower_cost'):
+		results_pp[key] = scalar_by_meter()
+	datetimes = list(pd.date_range('2024-01-01', periods=nr_datetimes, freq='15min', tz='UTC')
+					 .strftime('%Y-%m-%dT%H:%M:%SZ'))
+
+	with db.writer() as conn:
+		conn.execute('''
+			INSERT INTO Orders (order_id, processed, error, message, clustered, created_at) VALUES (?, ?, ?, ?, ?, ?)
+		''', (order_id, False, '', '', bool(nr_clusters), int(time.time()) if created_at is None else created_at))
+	store_milp_results(db, order_id, set(meter_ids), meter_ids, inputs, results, results_pp, datetimes, nr_clusters,
+					   day_clusters)
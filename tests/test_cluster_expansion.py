@@ -0,0 +1,105 @@
+import numpy as np
+import orjson
+import pytest
+
+pytest.importorskip('rec_sizing')
+
+from helpers import database_interactions
+from helpers.main_helpers import (
+	cluster_assignment,
+	daily_profiles,
+	milp_return_clustered_structure,
+	stream_expanded_milp_return_structure
+)
+from schemas.input_schemas import ExpansionParams
+from tests.synthetic import store_synthetic_order
+
+
+# representative day (cluster number) of each day of the horizon
+DAY_CLUSTERS = [0, 1, 2, 0, 1, 2, 0, 0, 1, 2]
+NR_CLUSTERS = 3
+METER_IDS = ['meter_0', 'meter_1']
+
+
+def profiles(nr_days: int, seed: int) -> dict:
+	rng = np.random.default_rng(seed)
+	return {meter_id: {variable: rng.random((nr_days, 96)) for variable in ('e_c', 'e_g_factor')}
+			for meter_id in METER_IDS}
+
+
+def milp_inputs(day_profiles: dict, weights: list[int] = None) -> dict:
+	# (only the keys read when assigning the days to clusters)
+	inputs = {'meters': {meter_id: {variable: list(days.ravel()) for variable, days in variables.items()}
+						 for meter_id, variables in day_profiles.items()}}
+	if weights is not None:
+		inputs['w_clustering'] = list(np.repeat(weights, 96).astype(float))
+	return inputs
+
+
+def clustered_horizon(day_clusters: list[int], seed: int = 0) -> (dict, dict):
+	"""
+	Inputs of the whole horizon, in which each day deviates slightly from its representative day, and of the
+	representative days only (i.e., after clustering).
+	"""
+	representative = profiles(NR_CLUSTERS, seed)
+	noise = profiles(len(day_clusters), seed + 1)
+	horizon = {meter_id: {variable: days[day_clusters] + 0.01 * noise[meter_id][variable]
+						  for variable, days in variables.items()}
+			   for meter_id, variables in representative.items()}
+	return horizon, representative
+
+
+def test_days_are_assigned_to_their_representative_days():
+	horizon, representative = clustered_horizon(DAY_CLUSTERS)
+	weights = np.bincount(DAY_CLUSTERS).tolist()
+
+	day_profiles = daily_profiles(milp_inputs(horizon))
+	assert day_profiles.shape == (len(DAY_CLUSTERS), 2 * len(METER_IDS) * 96)
+	assert cluster_assignment(day_profiles, milp_inputs(representative, weights), NR_CLUSTERS) == DAY_CLUSTERS
+
+
+def test_assignment_keeps_the_weights_of_the_clusters():
+	horizon, representative = clustered_horizon(DAY_CLUSTERS)
+	# one day less for the first cluster, and one more for the second, than their closest days
+	weights = [3, 4, 3]
+
+	day_clusters = cluster_assignment(daily_profiles(milp_inputs(horizon)), milp_inputs(representative, weights),
+									  NR_CLUSTERS)
+
+	assert np.bincount(day_clusters).tolist() == weights
+	assert sum(assigned != closest for assigned, closest in zip(day_clusters, DAY_CLUSTERS)) == 1
+
+
+def test_days_are_assigned_to_their_closest_clusters_if_weights_do_not_add_up():
+	horizon, representative = clustered_horizon(DAY_CLUSTERS)
+
+	day_clusters = cluster_assignment(daily_profiles(milp_inputs(horizon)), milp_inputs(representative, [1, 1, 1]),
+									  NR_CLUSTERS)
+
+	assert day_clusters == DAY_CLUSTERS
+
+
+@pytest.mark.parametrize('storage_mode', ['rows', 'columnar'])
+def test_expanded_days_take_the_results_of_their_representative_days(db, monkeypatch, storage_mode):
+	monkeypatch.setattr(database_interactions, 'STORAGE_MODE', storage_mode)
+	horizon, representative = clustered_horizon(DAY_CLUSTERS)
+	day_clusters = cluster_assignment(daily_profiles(milp_inputs(horizon)),
+									  milp_inputs(representative, np.bincount(DAY_CLUSTERS).tolist()), NR_CLUSTERS)
+	store_synthetic_order(db, 'order', nr_meters=len(METER_IDS), day_clusters=day_clusters)
+
+	expanded = orjson.loads(''.join(stream_expanded_milp_return_structure(db, 'order', ExpansionParams())))
+	clustered = milp_return_clustered_structure(db.reader().cursor(), 'order')
+
+	for key in ('meter_operation_inputs', 'meter_operation_outputs', 'self_consumption_tariffs', 'lem_prices'):
+		by_meter = key.startswith('meter_')
+		representative_records = {
+			(record.get('meter_id'), record['cluster_nr'], str(record['time'])): record for record in clustered[key]
+		}
+		assert len(expanded[key]) == len(METER_IDS if by_meter else [None]) * len(day_clusters) * 96
+		for record in expanded[key]:
+			day = (np.datetime64(record['datetime'].rstrip('Z')) - np.datetime64('2024-01-01')) // np.timedelta64(1, 'D')
+			assert record['cluster_nr'] == day_clusters[day]
+			representative_record = representative_records[
+				(record.get('meter_id'), record['cluster_nr'], record['datetime'][11:19])]
+			assert {field: value for field, value in record.items() if field not in ('datetime', 'cluster_nr')} == \
+				   {field: representative_record[field] for field in record if field not in ('datetime', 'cluster_nr')}
@@ -0,0 +1,111 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from helpers.database_interactions import (
+	epoch_days,
+	meter_data_coverage,
+	store_data_availability
+)
+
+
+METER_IDS = ['meter_0', 'meter_1', 'meter_2', 'not_indexed']
+
+
+def observed_datetimes(seed: int) -> dict[str, pd.DatetimeIndex]:
+	# measurements of the meters (except the last one) on some days of a week, with random gaps
+	rng = np.random.default_rng(seed)
+	steps = pd.date_range('2024-01-01', '2024-01-07 23:45', freq='15min', tz='UTC')
+	return {meter_id: steps[rng.random(len(steps)) < rng.uniform(0.3, 1)] + pd.Timedelta('2min')
+			for meter_id in METER_IDS[:-1]}
+
+
+def index_availability(db, observed: dict[str, pd.DatetimeIndex], checked_days: list[str]):
+	# (each day fully checked, as when its data is fetched by a sizing)
+	days = [pd.date_range(day, periods=96, freq='15min', tz='UTC') for day in checked_days]
+	steps = days[0].append(days[1:])
+	availability = {}
+	for meter_id, datetimes in observed.items():
+		is_observed = steps.isin(datetimes.floor('15min'))
+		availability[meter_id] = pd.DataFrame({'day': epoch_days(steps), 'is_observed': is_observed}) \
+			.groupby('day')['is_observed'].agg(checked_steps='size', observed_steps='sum')
+	store_data_availability(db, 'INDATA', availability)
+
+
+def brute_force_coverage(observed: dict[str, pd.DatetimeIndex], checked_days: list[str], horizon: pd.DatetimeIndex) \
+		-> dict[str, tuple[float, float]]:
+	# step by step, each step of an indexed day counts as the share of the day's steps with measured data
+	checked_days = {pd.Timestamp(day, tz='UTC').date() for day in checked_days}
+	coverage = {}
+	for meter_id in METER_IDS:
+		# (meters whose data was never fetched are not indexed)
+		datetimes = observed[meter_id].floor('15min') if meter_id in observed else None
+		estimated, indexed = 0.0, 0
+		for step in horizon:
+			if datetimes is None or step.date() not in checked_days:
+				continue
+			day_steps = pd.date_range(step.floor('D'), periods=96, freq='15min')
+			estimated += day_steps.isin(datetimes).mean()
+			indexed += 1
+		coverage[meter_id] = (estimated / indexed if indexed else np.nan, indexed / len(horizon))
+	return coverage
+
+
+@pytest.mark.parametrize('start, end', [
+	('2024-01-02', '2024-01-04'),
+	('2024-01-02 06:00', '2024-01-05 12:15'),
+	('2023-12-31 20:00', '2024-01-02 03:00'),
+	('2024-01-06 23:45', '2024-01-09')
+])
+def test_coverage_matches_a_step_by_step_estimate(db, start, end):
+	observed = observed_datetimes(0)
+	checked_days = ['2024-01-01', '2024-01-02', '2024-01-03', '2024-01-05', '2024-01-06']
+	index_availability(db, observed, checked_days)
+	horizon = pd.date_range(start, end, freq='15min', tz='UTC')
+
+	coverage = meter_data_coverage(db, 'INDATA', METER_IDS, horizon)
+
+	assert list(coverage.index) == METER_IDS
+	for meter_id, (expected_coverage, expected_indexed) in brute_force_coverage(observed, checked_days, horizon).items():
+		np.testing.assert_allclose(coverage.loc[meter_id, 'coverage'], expected_coverage, equal_nan=True)
+		assert coverage.loc[meter_id, 'indexed'] == pytest.approx(expected_indexed)
+
+
+def test_coverage_of_fully_indexed_days_is_the_share_of_observed_steps(db):
+	observed = observed_datetimes(1)
+	checked_days = ['2024-01-02', '2024-01-03']
+	index_availability(db, observed, checked_days)
+	horizon = pd.date_range('2024-01-02', '2024-01-03 23:45', freq='15min', tz='UTC')
+
+	coverage = meter_data_coverage(db, 'INDATA', METER_IDS, horizon)
+
+	for meter_id, datetimes in observed.items():
+		assert coverage.loc[meter_id, 'coverage'] == pytest.approx(horizon.isin(datetimes.floor('15min')).mean())
+		assert coverage.loc[meter_id, 'indexed'] == 1
+	assert np.isnan(coverage.loc['not_indexed', 'coverage'])
+	assert coverage.loc['not_indexed', 'indexed'] == 0
+
+
+def test_area_search_is_filtered_by_coverage(db, monkeypatch):
+	pytest.importorskip('tsg_client')
+	from helpers import dataspace_interactions
+	from helpers.meter_location_index import MeterLocationIndex
+	from schemas.input_schemas import MeterByArea
+
+	observed = observed_datetimes(2)
+	index_availability(db, observed, ['2024-01-02', '2024-01-03'])
+	monkeypatch.setitem(dataspace_interactions.LOCATION_INDICES, 'INDATA',
+						MeterLocationIndex({meter_id: [41.1579, -8.6291] for meter_id in METER_IDS}))
+	horizon = pd.date_range('2024-01-02', '2024-01-03 23:45', freq='15min', tz='UTC')
+	coverage = meter_data_coverage(db, 'INDATA', METER_IDS, horizon)['coverage']
+	min_coverage = float(coverage.dropna().median())
+
+	found = dataspace_interactions.fetch_meters_location(MeterByArea(
+		dataset_origin='INDATA', rec_location={'latitude': 41.1579, 'longitude': -8.6291}, radius=1,
+		start_datetime='2024-01-02T00:00:00Z', end_datetime='2024-01-03T23:45:00Z', min_coverage=min_coverage
+	), db)
+
+	# meter IDs whose coverage is not known are kept
+	assert found.meter_ids == [meter_id for meter_id in METER_IDS
+							   if np.isnan(coverage[meter_id]) or coverage[meter_id] >= min_coverage]
+	assert 0 < len(found.meter_ids) < len(METER_IDS)
@@ -0,0 +1,158 @@
+import numpy as np
+import pytest
+
+from helpers.calculate_circle import (
+	haversine_distances,
+	points_in_polygon
+)
+from helpers.meter_location_index import MeterLocationIndex
+
+
+CENTER = (41.1579, -8.6291)
+
+
+def random_locations(nr_meters: int, seed: int, spread: float = 0.1) -> dict[str, list[float]]:
+	rng = np.random.default_rng(seed)
+	coordinates = np.array(CENTER) + rng.uniform(-spread, spread, size=(nr_meters, 2))
+	return {f'meter_{nr}': coordinate.tolist() for nr, coordinate in enumerate(coordinates)}
+
+
+def distances_to_all(locations: dict[str, list[float]], center: tuple[float, float]) -> np.ndarray:
+	# brute-force scan of all meters
+	latitudes, longitudes = np.array(list(locations.values())).T
+	return haversine_distances(center, latitudes, longitudes)
+
+
+def winding_number(latitude: float, longitude: float, vertices: np.ndarray) -> int:
+	# (a different rule than the even-odd one, which agrees with it on simple polygons away from their edges)
+	angles = np.arctan2(vertices[:, 0] - latitude, vertices[:, 1] - longitude)
+	turns = np.diff(np.append(angles, angles[0]))
+	return round(((turns + np.pi) % (2 * np.pi) - np.pi).sum() / (2 * np.pi))
+
+
+def distance_to_edges(latitude: float, longitude: float, vertices: np.ndarray) -> float:
+	start, end = vertices, np.roll(vertices, -1, axis=0)
+	point = np.array([latitude, longitude])
+	edges = end - start
+	share = np.clip(((point - start) * edges).sum(axis=1) / (edges ** 2).sum(axis=1), 0, 1)
+	return np.linalg.norm(start + share[:, np.newaxis] * edges - point, axis=1).min()
+
+
+def star_polygon(nr_vertices: int, seed: int) -> np.ndarray:
+	# simple (and mostly concave) polygon, with its vertices at random distances from its center
+	rng = np.random.default_rng(seed)
+	angles = np.sort(rng.uniform(0, 2 * np.pi, nr_vertices))
+	radii = rng.uniform(0.01, 0.1, nr_vertices)
+	return np.array(CENTER) + np.column_stack((radii * np.sin(angles), radii * np.cos(angles)))
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_points_in_polygon_match_the_winding_number(seed):
+	vertices = star_polygon(12, seed)
+	latitudes, longitudes = np.array(list(random_locations(2000, seed).values())).T
+
+	inside = points_in_polygon(latitudes, longitudes, vertices[:, 0], vertices[:, 1])
+
+	expected = [winding_number(latitude, longitude, vertices) != 0 for latitude, longitude in zip(latitudes, longitudes)]
+	assert inside.tolist() == expected
+
+
+def test_rays_through_vertices_and_horizontal_edges():
+	# concave ("U"-shaped) polygon with horizontal edges, and points level with its vertices
+	vertices = np.array([(0, 0), (0, 3), (3, 3), (3, 2), (1, 2), (1, 1), (3, 1), (3, 0)], dtype=np.float64)[:, ::-1]
+	latitudes, longitudes = np.meshgrid(np.arange(-0.5, 3.6, 0.5), np.arange(-0.5, 3.6, 0.25))
+	latitudes, longitudes = latitudes.ravel(), longitudes.ravel()
+	off_edges = np.array([distance_to_edges(latitude, longitude, vertices) > 1e-9
+						  for latitude, longitude in zip(latitudes, longitudes)])
+
+	inside = points_in_polygon(latitudes, longitudes, vertices[:, 0], vertices[:, 1])
+
+	expected = [winding_number(latitude, longitude, vertices) != 0
+				for latitude, longitude in zip(latitudes[off_edges], longitudes[off_edges])]
+	assert inside[off_edges].tolist() == expected
+	# (the notch of the "U" is outside)
+	assert not points_in_polygon([1.5], [2], vertices[:, 0], vertices[:, 1])[0]
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_within_polygon_matches_a_scan_of_all_meters(seed):
+	locations = random_locations(2000, seed)
+	vertices = star_polygon(12, seed)
+	# meters on the vertices, and on the edges of the bounding box, of the polygon
+	for nr, (latitude, longitude) in enumerate(vertices):
+		locations[f'vertex_{nr}'] = [latitude, longitude]
+		locations[f'box_{nr}'] = [vertices[:, 0].min(), longitude]
+		locations[f'box_{nr}_side'] = [latitude, vertices[:, 1].max()]
+	latitudes, longitudes = np.array(list(locations.values())).T
+
+	found_meters = MeterLocationIndex(locations).within_polygon(vertices.tolist())
+
+	inside = points_in_polygon(latitudes, longitudes, vertices[:, 0], vertices[:, 1])
+	assert found_meters == [meter_id for meter_id, is_inside in zip(locations, inside) if is_inside]
+
+
+def test_within_polygon_includes_meters_on_the_bottom_edge():
+	locations = {'bottom': [41.0, -8.5], 'top': [41.1, -8.5], 'inside': [41.05, -8.5], 'outside': [40.99, -8.5]}
+	vertices = [(41.0, -8.6), (41.0, -8.4), (41.1, -8.4), (41.1, -8.6)]
+
+	# (with the even-odd rule, points on the bottom edge are inside and those on the top edge outside)
+	assert MeterLocationIndex(locations).within_polygon(vertices) == ['bottom', 'inside']
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_within_circles_matches_a_scan_of_all_meters(seed):
+	locations = random_locations(2000, seed)
+	rng = np.random.default_rng(seed)
+	centers = [tuple(np.array(CENTER) + rng.uniform(-0.1, 0.1, 2)) for _ in range(10)]
+	radii = rng.uniform(0, 15, len(centers)).tolist()
+	# circles whose boundary goes exactly through a meter
+	meter_ids = list(locations)
+	for center in centers[:5]:
+		centers.append(center)
+		radii.append(float(distances_to_all(locations, center)[rng.integers(len(meter_ids))]))
+
+	found_meters = MeterLocationIndex(locations).within_circles(centers, radii)
+
+	for center, radius, found in zip(centers, radii, found_meters):
+		expected = [meter_id for meter_id, distance in zip(meter_ids, distances_to_all(locations, center))
+					if distance <= radius]
+		assert found == expected
+	assert all(found_meters[10:])
+
+
+def brute_force_nearest(locations: dict[str, list[float]], center: tuple[float, float], nr_meters: int,
+						max_distance: float = None) -> list[tuple[str, float]]:
+	distances = distances_to_all(locations, center)
+	order = [nr for nr in np.lexsort((np.arange(len(distances)), distances))
+			 if max_distance is None or distances[nr] <= max_distance][:nr_meters]
+	meter_ids = list(locations)
+	return [(meter_ids[nr], distances[nr]) for nr in order]
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_nearest_matches_a_scan_of_all_meters(seed):
+	locations = random_locations(500, seed)
+	rng = np.random.default_rng(seed)
+	# meters in the same building (i.e., at the same distance from any location)
+	meter_ids = list(locations)
+	for nr in rng.integers(len(meter_ids), size=50):
+		locations[f'{meter_ids[nr]}_{len(locations)}'] = locations[meter_ids[nr]]
+	meter_index = MeterLocationIndex(locations)
+	center = tuple(np.array(CENTER) + rng.uniform(-0.05, 0.05, 2))
+	distances = np.sort(distances_to_all(locations, center))
+
+	for nr_meters in (1, 10, 100, len(locations) + 1):
+		for max_distance in (None, float(distances[20]), float(distances[5]) / 2):
+			found = meter_index.nearest(*center, nr_meters, max_distance)
+			expected = brute_force_nearest(locations, center, nr_meters, max_distance)
+			assert [meter_id for meter_id, _ in found] == [meter_id for meter_id, _ in expected]
+			np.testing.assert_allclose([distance for _, distance in found], [distance for _, distance in expected])
+
+
+def test_nearest_ties_are_broken_by_the_order_the_meters_were_indexed():
+	locations = {f'meter_{nr}': list(CENTER) for nr in range(5)}
+	locations['farther'] = [CENTER[0] + 0.01, CENTER[1]]
+
+	found = MeterLocationIndex(locations).nearest(CENTER[0] + 0.001, CENTER[1], 3)
+
+	assert [meter_id for meter_id, _ in found] == ['meter_0', 'meter_1', 'meter_2']
@@ -0,0 +1,48 @@
+import gzip
+import threading
+import time
+
+from starlette.requests import Request
+
+from helpers import response_cache
+from helpers.response_cache import ResponseCache
+
+
+BODY = b'{"meter_ids": []}' * 1000
+
+
+def gzip_request() -> Request:
+	return Request({'type': 'http', 'headers': [(b'accept-encoding', b'gzip')]})
+
+
+def slow_gzip(nr_compressions: list):
+	def compress(body: bytes) -> bytes:
+		nr_compressions.append(1)
+		time.sleep(0.05)
+		return gzip.compress(body)
+	return compress
+
+
+def test_concurrent_requests_compress_a_response_once(tmp_path, monkeypatch):
+	nr_compressions = []
+	monkeypatch.setitem(response_cache.COMPRESSORS, 'gzip', slow_gzip(nr_compressions))
+	cache = ResponseCache(directory=str(tmp_path))
+	# (the response is first cached uncompressed)
+	cache.response(Request({'type': 'http', 'headers': []}), 'order', 'key', lambda: BODY)
+	responses = []
+	threads = [threading.Thread(target=lambda: responses.append(cache.response(gzip_request(), 'order', 'key',
+																			   lambda: BODY)))
+			   for _ in range(8)]
+	for thread in threads:
+		thread.start()
+	for thread in threads:
+		thread.join()
+
+	assert len(nr_compressions) == 1
+	assert all(gzip.decompress(response.body) == BODY for response in responses)
+
+	# the compressed body was also written to disk, with the entry
+	reloaded = ResponseCache(max_bytes=0, directory=str(tmp_path))
+	response = reloaded.response(gzip_request(), 'order', 'key', lambda: b'')
+	assert len(nr_compressions) == 1
+	assert gzip.decompress(response.body) == BODY
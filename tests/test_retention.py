@@ -0,0 +1,68 @@
+import sqlite3
+
+from helpers.database_backends import AUTO_VACUUM_INCREMENTAL, DB_PATH
+from helpers.database_interactions import connect_to_database, delete_orders
+from tests.synthetic import store_synthetic_order
+from threads import retention_thread
+
+
+def stored_order_ids(db) -> list[str]:
+	return [order_id for order_id, in db.reader().execute('SELECT order_id FROM Orders ORDER BY created_at')]
+
+
+def test_used_size_drops_after_delete(db):
+	for nr in range(4):
+		store_synthetic_order(db, f'order_{nr}', nr_meters=5, nr_steps=96 * 7, created_at=nr, seed=nr)
+	size_before = db.used_size()
+	assert size_before > 0
+
+	delete_orders(db, ['order_0', 'order_1'])
+	assert db.used_size() < size_before
+
+
+def test_size_retention_only_deletes_the_oldest_orders_needed(db, monkeypatch):
+	nr_orders = 8
+	for nr in range(nr_orders):
+		store_synthetic_order(db, f'order_{nr}', nr_meters=5, nr_steps=96 * 7, created_at=nr, seed=nr)
+	max_size = 0.8 * db.used_size()
+	monkeypatch.setattr(retention_thread, 'RETENTION_DAYS', 0)
+	monkeypatch.setattr(retention_thread, 'MAX_DB_SIZE_MB', max_size / 1024 / 1024)
+	monkeypatch.setattr(retention_thread, 'PAUSE_BETWEEN_BATCHES', 0)
+
+	retention_thread.enforce_retention(db)
+
+	remaining = stored_order_ids(db)
+	assert db.used_size() <= max_size
+	# the oldest orders are deleted first, and only as many as needed to get below the maximum size
+	assert remaining == [f'order_{nr}' for nr in range(nr_orders - len(remaining), nr_orders)]
+	assert nr_orders // 2 <= len(remaining) < nr_orders
+
+
+def test_size_retention_keeps_pinned_orders(db, monkeypatch):
+	for nr in range(3):
+		store_synthetic_order(db, f'order_{nr}', created_at=nr, seed=nr)
+	with db.writer() as conn:
+		conn.execute('UPDATE Orders SET pinned = ? WHERE order_id = ?', (True, 'order_0'))
+	monkeypatch.setattr(retention_thread, 'RETENTION_DAYS', 0)
+	monkeypatch.setattr(retention_thread, 'MAX_DB_SIZE_MB', 1e-6)
+	monkeypatch.setattr(retention_thread, 'PAUSE_BETWEEN_BATCHES', 0)
+
+	retention_thread.enforce_retention(db)
+
+	assert stored_order_ids(db) == ['order_0']
+
+
+def test_space_reclaim_is_enabled_once_on_legacy_sqlite_databases(tmp_path, monkeypatch):
+	# database created before the retention policy existed, i.e., without auto-vacuum
+	monkeypatch.chdir(tmp_path)
+	(tmp_path / 'files').mkdir()
+	conn = sqlite3.connect(DB_PATH)
+	conn.execute('CREATE TABLE Legacy (value INTEGER)')
+	conn.close()
+	db = connect_to_database('sqlite')
+	try:
+		assert db.enable_space_reclaim()
+		assert db.reader().execute('PRAGMA auto_vacuum').fetchone() == (AUTO_VACUUM_INCREMENTAL,)
+		assert not db.enable_space_reclaim()
+	finally:
+		db.close()
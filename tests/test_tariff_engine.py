@@ -0,0 +1,86 @@
+import pandas as pd
+import pytest
+
+from helpers import tariff_engine
+from helpers.tariff_store import TariffStore, build_tariff_store
+
+
+# the tariffs in the pickle, of 2023 and 2024 only ("tri-horárias" tariffs are flat, for simplicity)
+STORED_PRICES = {
+	2023: {
+		'simples': {'normal': 0.15},
+		'bi-horárias': {'fora_de_vazio': 0.2, 'vazio': 0.1},
+		'tri-horárias': {'cheias': 0.2, 'ponta': 0.2, 'vazio': 0.2},
+		'autoconsumo_simples': {'normal': 0.03}
+	},
+	2024: {
+		'simples': {'normal': 0.16},
+		'bi-horárias': {'fora_de_vazio': 0.3, 'vazio': 0.15},
+		'tri-horárias': {'cheias': 0.25, 'ponta': 0.25, 'vazio': 0.25},
+		'autoconsumo_simples': {'normal': 0.04}
+	}
+}
+HOLIDAY = (6, 10)
+
+
+def is_holiday(dt: pd.Timestamp) -> bool:
+	return (dt.month, dt.day) == HOLIDAY
+
+
+def stored_tariff(tariff_type: str, dt: pd.Timestamp) -> float:
+	# "bi-horárias" tariffs are "vazio" from 22:00 to 08:00, local time, except for a holiday, all "vazio",
+	# which is not modelled by the schedule of the cycle
+	prices = STORED_PRICES[dt.year][tariff_type]
+	if tariff_type == 'bi-horárias':
+		return prices['vazio' if dt.hour < 8 or dt.hour >= 22 or is_holiday(dt) else 'fora_de_vazio']
+	return max(prices.values())
+
+
+def load_store(tmp_path, monkeypatch, tariff_types: list[str] = tuple(tariff_engine.TARIFF_CYCLES)) -> TariffStore:
+	index = pd.date_range('2023-01-01', '2024-12-31 23:45', freq='15min', tz=tariff_engine.TARIFF_TIMEZONE)
+	tariffs_df = pd.DataFrame({tariff_type: [stored_tariff(tariff_type, dt) for dt in index]
+							   for tariff_type in tariff_types}, index=index.tz_convert('UTC'))
+	tariffs_df.to_pickle(tmp_path / 'prices_and_tariffs.pkl')
+	build_tariff_store(str(tmp_path / 'prices_and_tariffs.pkl'), str(tmp_path / 'tariffs'))
+
+	tariffs = TariffStore(str(tmp_path / 'tariffs'))
+	monkeypatch.setattr(tariff_engine, 'get_tariff_store', lambda: tariffs)
+	monkeypatch.setattr(tariff_engine, '_COMPILED_PRICES', None)
+	return tariffs
+
+
+def test_prices_are_derived_from_the_store(tmp_path, monkeypatch):
+	tariffs = load_store(tmp_path, monkeypatch)
+
+	assert tariff_engine.derive_tariff_prices(tariffs) == STORED_PRICES
+
+
+def test_same_datetime_gets_the_same_tariff_whatever_the_horizon(tmp_path, monkeypatch):
+	load_store(tmp_path, monkeypatch)
+	start_dt = pd.Timestamp('2024-12-30', tz='UTC')
+
+	covered = tariff_engine.get_tariffs('bi-horárias', start_dt, start_dt + pd.Timedelta('1D'))
+	uncovered = tariff_engine.get_tariffs('bi-horárias', start_dt, start_dt + pd.Timedelta('7D'))
+
+	pd.testing.assert_series_equal(covered, uncovered[covered.index], check_freq=False)
+	# years after the last one in the store use its prices
+	assert set(uncovered.tolist()) == set(STORED_PRICES[2024]['bi-horárias'].values())
+
+
+def test_stored_tariffs_are_returned_even_if_they_deviate_from_the_schedule(tmp_path, monkeypatch):
+	load_store(tmp_path, monkeypatch)
+	start_dt = pd.Timestamp('2024-06-09', tz=tariff_engine.TARIFF_TIMEZONE)
+
+	tariffs = tariff_engine.get_tariffs('bi-horárias', start_dt, start_dt + pd.Timedelta('3D'))
+
+	holiday = tariffs[[is_holiday(dt) for dt in tariffs.index.tz_convert(tariff_engine.TARIFF_TIMEZONE)]]
+	assert len(holiday) == 96
+	assert set(holiday.tolist()) == {STORED_PRICES[2024]['bi-horárias']['vazio']}
+	assert tariffs.max() == STORED_PRICES[2024]['bi-horárias']['fora_de_vazio']
+
+
+def test_pickle_lacking_a_tariff_cycle_is_rejected(tmp_path, monkeypatch):
+	load_store(tmp_path, monkeypatch, tariff_types=['simples', 'bi-horárias', 'tri-horárias'])
+
+	with pytest.raises(ValueError, match='autoconsumo_simples'):
+		tariff_engine.load_tariff_prices()
@@ -0,0 +1,38 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from helpers.tariff_store import CURRENT_FILE, TariffStore, build_tariff_store, load_tariff_store
+
+
+def write_pickle(pkl_path, price: float, mtime_ns: int):
+	index = pd.date_range('2024-01-01', periods=96 * 2, freq='15min', tz='UTC')
+	pd.DataFrame({'simples': np.full(len(index), price)}, index=index).to_pickle(pkl_path)
+	os.utime(pkl_path, ns=(mtime_ns, mtime_ns))
+
+
+def test_horizon_is_sliced_from_the_store(tmp_path):
+	write_pickle(tmp_path / 'tariffs.pkl', 0.1, 1)
+	tariffs = load_tariff_store(str(tmp_path / 'tariffs.pkl'), str(tmp_path / 'tariffs'))
+
+	sliced = tariffs.get('simples', pd.Timestamp('2023-12-31T23:00Z'), pd.Timestamp('2024-01-01T00:30Z'))
+
+	# only the part of the horizon covered by the store is returned
+	assert sliced.index[0] == pd.Timestamp('2024-01-01T00:00Z')
+	assert sliced.tolist() == [0.1, 0.1, 0.1]
+
+
+def test_rebuilt_store_is_swapped_without_changing_the_loaded_versions(tmp_path):
+	pkl_path, store_dir = str(tmp_path / 'tariffs.pkl'), str(tmp_path / 'tariffs')
+	loaded = []
+	for nr, price in enumerate((0.1, 0.2, 0.3)):
+		write_pickle(pkl_path, price, nr + 1)
+		build_tariff_store(pkl_path, store_dir)
+		loaded.append(TariffStore(store_dir))
+
+	# each store keeps the tariffs of the version it loaded
+	start_dt = pd.Timestamp('2024-01-01T00:00Z')
+	assert [tariffs.get('simples', start_dt, start_dt).iloc[0] for tariffs in loaded] == [0.1, 0.2, 0.3]
+	# only the version in use and the previous one, which workers may still be loading, are kept
+	assert sorted(os.listdir(store_dir)) == sorted([CURRENT_FILE, 'v2', 'v3'])
@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+import pytest
+import sqlite3
+
+from helpers.database_backends import DB_PATH
+from helpers.database_interactions import (
+	TIME_VARYING_TABLES,
+	connect_to_database,
+	create_tables,
+	decode_timeseries,
+	encode_timeseries
+)
+
+
+@pytest.mark.parametrize('scale', [1, 1e7])
+def test_timeseries_round_trip(scale):
+	values = np.random.default_rng(0).normal(size=(3, 96)) * scale
+
+	encoding, data = encode_timeseries(values)
+
+	# (the time series are stored with 3 decimal places, in 64-bit integers if they do not fit in 32-bit ones)
+	assert encoding == ('<i4:1000:zlib' if scale == 1 else '<i8:1000:zlib')
+	np.testing.assert_array_equal(decode_timeseries(encoding, data, 3), np.round(values, 3))
+
+
+def test_unknown_compression_is_rejected():
+	encoding, data = encode_timeseries(np.zeros((1, 4)))
+
+	with pytest.raises(ValueError, match='compression'):
+		decode_timeseries(encoding.replace('zlib', 'lz4'), data, 1)
+
+
+def create_legacy_database():
+	"""
+	Database as created before time was stored as integer time steps, i.e., with the datetime (or, for clustered
+	orders, the time of the day and the cluster number) of each row of the time-varying results' tables.
+	"""
+	conn = sqlite3.connect(DB_PATH)
+	create_tables(conn.cursor())
+	for table, create_table_statement in TIME_VARYING_TABLES.items():
+		conn.execute(f'DROP TABLE {table}')
+		time_columns = 'time TEXT,\n    cluster_nr INTEGER' if table.startswith('Clustered_') else 'datetime TEXT'
+		conn.execute(create_table_statement.replace('step INTEGER', time_columns))
+	conn.commit()
+	return conn
+
+
+def test_legacy_database_is_migrated_to_integer_steps(tmp_path, monkeypatch):
+	monkeypatch.chdir(tmp_path)
+	(tmp_path / 'files').mkdir()
+	conn = create_legacy_database()
+	datetimes = [str(dt) for dt in pd.date_range('2024-05-16T00:00Z', periods=8, freq='15min')]
+	prices = [0.1 * nr for nr in range(len(datetimes))]
+	conn.executemany("INSERT INTO Orders (order_id, processed, error, message, clustered) VALUES (?, 1, '', '', ?)",
+					 [('order', False), ('clustered_order', True)])
+	conn.executemany("INSERT INTO Lem_Prices (order_id, datetime, value) VALUES ('order', ?, ?)",
+					 zip(datetimes, prices))
+	conn.executemany('''
+		INSERT INTO Clustered_Lem_Prices (order_id, time, cluster_nr, cluster_weight, value)
+		VALUES ('clustered_order', ?, ?, 10, ?)
+	''', [('00:00:00', 0, 0.1), ('23:45:00', 0, 0.2), ('00:15:00', 1, 0.3)])
+	conn.commit()
+	conn.close()
+
+	db = connect_to_database('sqlite')
+	try:
+		reader = db.reader()
+		start_epoch, = reader.execute("SELECT start_epoch FROM Orders WHERE order_id = 'order'").fetchone()
+		assert start_epoch == pd.Timestamp(datetimes[0]).timestamp()
+		# the same payload is retrieved, with each datetime rebuilt from the order's start and the time step
+		migrated = reader.execute("SELECT step, value FROM Lem_Prices WHERE order_id = 'order' ORDER BY id").fetchall()
+		assert [(str(pd.Timestamp(start_epoch + step * 900, unit='s', tz='UTC')), value)
+				for step, value in migrated] == list(zip(datetimes, prices))
+		# ... and, for clustered orders, the cluster number and the time of the day
+		migrated = reader.execute('''
+			SELECT step, cluster_weight, value FROM Clustered_Lem_Prices WHERE order_id = 'clustered_order' ORDER BY id
+		''').fetchall()
+		assert migrated == [(0, 10, 0.1), (95, 10, 0.2), (97, 10, 0.3)]
+		assert not reader.execute("SELECT name FROM sqlite_master WHERE name LIKE 'Legacy_%'").fetchall()
+	finally:
+		db.close()
@@ -0,0 +1,105 @@
+import os
+import threading
+import time
+
+from loguru import logger
+
+from helpers.database_backends import ResultDatabase
+from helpers.database_interactions import (
+	delete_orders,
+	expired_order_ids,
+	oldest_order_ids
+)
+from helpers.order_status import OrderStatusRegistry
+from helpers.response_cache import ResponseCache
+
+
+# Retention policy of the orders (and their results); pinned orders are never deleted:
+# - orders older than SIZING_RETENTION_DAYS days are deleted (0 to keep orders regardless of their age);
+# - while the database is larger than SIZING_MAX_DB_SIZE_MB megabytes, the oldest processed orders are deleted
+#   (0 for no size limit).
+# The policy is enforced by a background thread every SIZING_RETENTION_INTERVAL seconds.
+RETENTION_DAYS = float(os.getenv('SIZING_RETENTION_DAYS', 0))
+MAX_DB_SIZE_MB = float(os.getenv('SIZING_MAX_DB_SIZE_MB', 0))
+RETENTION_INTERVAL = float(os.getenv('SIZING_RETENTION_INTERVAL', 3600))
+
+# Orders are deleted, and free pages reclaimed, in small batches (each within its own short transaction),
+# with a pause in between, so that the API's requests and the sizing threads never wait long for the write lock
+DELETE_BATCH_SIZE = 20
+RECLAIM_BATCH_PAGES = 2000
+PAUSE_BETWEEN_BATCHES = 0.05
+
+
+def is_retention_enabled() -> bool:
+	return bool(RETENTION_DAYS or MAX_DB_SIZE_MB)
+
+
+def run_retention_thread(db: ResultDatabase,
+						 stop_event: threading.Event,
+						 response_cache: ResponseCache = None,
+						 order_status: OrderStatusRegistry = None):
+	try:
+		while not stop_event.is_set():
+			try:
+				enforce_retention(db, stop_event, response_cache, order_status)
+			except Exception as e:
+				# keep the policy running, e.g., if the database was locked for longer than the busy timeout
+				logger.warning(f'Failed to enforce the retention policy: {e}')
+			stop_event.wait(RETENTION_INTERVAL)
+	finally:
+		# close the database connections opened by this thread
+		db.release()
+
+
+def enforce_retention(db: ResultDatabase,
+					  stop_event: threading.Event = None,
+					  response_cache: ResponseCache = None,
+					  order_status: OrderStatusRegistry = None):
+	"""
+	Delete the expired orders (by age and by database size) and reclaim the space they used.
+	:param db: access layer to the database
+	:param stop_event: event that, when set, interrupts the process between batches
+	:param response_cache: cache of the responses with the results of the orders, from which the deleted ones are evicted
+	:param order_status: in-memory status of the orders, from which the deleted ones are forgotten
+	"""
+	stop_event = stop_event or threading.Event()
+	nr_deleted = 0
+
+	# EXPIRE BY AGE ####################################################################################################
+	if RETENTION_DAYS:
+		created_before = int(time.time() - RETENTION_DAYS * 24 * 3600)
+		while not stop_event.is_set():
+			order_ids = expired_order_ids(db, created_before, DELETE_BATCH_SIZE)
+			if not order_ids:
+				break
+			delete_orders(db, order_ids)
+			if response_cache is not None:
+				response_cache.evict_orders(order_ids)
+			if order_status is not None:
+				order_status.forget(order_ids)
+			nr_deleted += len(order_ids)
+			stop_event.wait(PAUSE_BETWEEN_BATCHES)
+
+	# EXPIRE BY DATABASE SIZE ##########################################################################################
+	if MAX_DB_SIZE_MB:
+		max_size = MAX_DB_SIZE_MB * 1024 * 1024
+		while not stop_event.is_set() and db.used_size() > max_size:
+			# one order at a time, so that no more orders are deleted than needed to get below the maximum size
+			order_ids = oldest_order_ids(db, 1)
+			if not order_ids:
+				logger.warning('Database exceeds its maximum size, but only pinned or unprocessed orders are left.')
+				break
+			delete_orders(db, order_ids)
+			if response_cache is not None:
+				response_cache.evict_orders(order_ids)
+			if order_status is not None:
+				order_status.forget(order_ids)
+			nr_deleted += len(order_ids)
+			stop_event.wait(PAUSE_BETWEEN_BATCHES)
+
+	if nr_deleted:
+		logger.info(f'Retention policy deleted {nr_deleted} order(s).')
+
+	# RECLAIM FREE PAGES ###############################################################################################
+	while not stop_event.is_set() and db.reclaim_free_pages(RECLAIM_BATCH_PAGES):
+		stop_event.wait(PAUSE_BETWEEN_BATCHES)
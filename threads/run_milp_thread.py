@@ -1,44 +1,80 @@
-import pandas as pd
-import sqlite3
-
 from loguru import logger
 from typing import Union
 
 from rec_sizing.optimization_functions import run_pre_collective_pool_milp
 from rec_sizing.post_processing_functions import run_post_processing
+from helpers.database_backends import ResultDatabase
+from helpers.database_interactions import (
+	store_data_availability,
+	store_milp_results
+)
 from helpers.dataspace_interactions import fetch_dataspace
-from helpers.main_helpers import milp_inputs
+from helpers.main_helpers import (
+	cluster_assignment,
+	daily_profiles,
+	milp_inputs
+)
+from helpers.order_status import OrderStatusRegistry
+from schemas.enums import OrderStage
 from schemas.input_schemas import (SizingInputs, SizingInputsWithShared)
 
 
 def run_dual_thread(user_params: Union[SizingInputs, SizingInputsWithShared],
 					id_order: str,
-					conn: sqlite3.Connection,
-					curs: sqlite3.Cursor):
+					db: ResultDatabase,
+					order_status: OrderStatusRegistry):
+	try:
+		__run_dual_thread(user_params, id_order, db, order_status)
+	except Exception as e:
+		# report the order as failed, instead of leaving it at the stage where its processing stopped
+		logger.exception(f'Failed to process order {id_order}.')
+		message = f'The processing of the order failed unexpectedly ({type(e).__name__}).'
+		try:
+			__store_failure(db, id_order, '500', message)
+		finally:
+			order_status.update(id_order, processed=True, stage=OrderStage.failed, error='500', message=message)
+	finally:
+		# close the database connections opened by this (short-lived) thread
+		db.release()
+
+
+def __store_failure(db: ResultDatabase, id_order: str, error: str, message: str):
+	"""
+	Update the database with the error (HTTP status code) with which the results of the order are refused.
+	"""
+	with db.writer() as conn:
+		conn.execute('''
+			UPDATE Orders
+			SET processed = ?, error = ?, message = ?
+			WHERE order_id = ?
+		''', (True, error, message, id_order))
+
+
+def __run_dual_thread(user_params: Union[SizingInputs, SizingInputsWithShared],
+					  id_order: str,
+					  db: ResultDatabase,
+					  order_status: OrderStatusRegistry):
 	# get the necessary meters' data from the dataspace
 	logger.info('Fetching data from dataspace.')
-	data_df, sc_series, list_of_datetimes, missing_ids, missing_dts = fetch_dataspace(user_params)
+	order_status.update(id_order, stage=OrderStage.fetching_data)
+	data_df, sc_series, list_of_datetimes, missing_ids, missing_dts, availability = fetch_dataspace(user_params)
+	# keep the data availability index updated, so that the meters' searches can tell the coverage of their data
+	store_data_availability(db, user_params.dataset_origin.value, availability)
 
 	# if any missing meter ids or missing datetimes in the data for those meter ids was found,
 	# update the database with an error and an indication of which data is missing
 	if missing_ids:
 		logger.warning('Missing meter IDs in dataspace.')
 		message = f'Data for one or more meter IDs not found on registry system: {missing_ids}'
-		curs.execute('''
-			UPDATE Orders
-			SET processed = ?, error = ?, message = ?
-			WHERE order_id = ?
-		''', (True, '412', message, id_order))
+		__store_failure(db, id_order, '412', message)
+		order_status.update(id_order, processed=True, stage=OrderStage.failed, error='412', message=message)
 
 	elif any(missing_dts.values()):
 		logger.warning('Missing data points in dataspace.')
 		missing_pairs = {k: v for k, v in missing_dts.items() if v}
 		message = f'One or more data point for one or more meter IDs not found on registry system: {missing_pairs}'
-		curs.execute('''
-			UPDATE Orders
-			SET processed = ?, error = ?, message = ?
-			WHERE order_id = ?
-		''', (True, '422', message, id_order))
+		__store_failure(db, id_order, '422', message)
+		order_status.update(id_order, processed=True, stage=OrderStage.failed, error='422', message=message)
 
 	# otherwise, proceed normally
 	else:
@@ -49,8 +85,11 @@ def run_dual_thread(user_params: Union[SizingInputs, SizingInputsWithShared],
 		# prepare the inputs for the MILP
 		logger.info('Building inputs.')
 		inputs = milp_inputs(user_params, data_df, sc_series)
+		# keep the daily profiles of the whole horizon, since clustering replaces them by those of the representative days
+		day_profiles = daily_profiles(inputs) if is_clustered else None
 		# run optimization
 		logger.info('Running MILP.')
+		order_status.update(id_order, stage=OrderStage.optimizing)
 		results = run_pre_collective_pool_milp(inputs)
 		# Create the INPUTS_OWNERSHIP_PP dictionary
 		INPUTS_OWNERSHIP_PP = {'ownership': {}}
@@ -76,202 +115,19 @@ def run_dual_thread(user_params: Union[SizingInputs, SizingInputsWithShared],
 
 		results_pp = run_post_processing(results, inputs, INPUTS_OWNERSHIP_PP)
 
-		# update the database with the new order ID
+		# update the database with the results for the order ID
 		logger.info('Updating database with results.')
-		curs.execute('''
-			UPDATE Orders
-			SET processed = ?
-			WHERE order_id = ?
-		''', (True, id_order))
-
-		curs.execute('''
-			INSERT INTO General_MILP_Outputs (order_id, objective_value, milp_status, total_rec_cost)
-			VALUES (?, ?, ?, ?)
-		''', (
-			id_order,
-			round(results_pp['obj_value'], 2),
-			results['milp_status'],
-			round(results_pp['obj_value'], 2)
-		))
+		order_status.update(id_order, stage=OrderStage.storing_results)
 		if hasattr(user_params, 'shared_meter_id'):
-			for meter_id in [i for i in meter_ids if i != user_params.shared_meter_id]:
-				curs.execute('''
-					INSERT INTO Member_Costs (order_id, meter_id, member_cost, member_cost_compensation, member_savings)
-					VALUES (?, ?, ?, ?, ?)
-				''', (
-					id_order,
-					meter_id,
-					round(results_pp['member_cost'][meter_id], 2),
-					round(results_pp['member_cost_compensations'][meter_id], 2),
-					0
-				))
-		else:
-			for meter_id in meter_ids:
-				curs.execute('''
-									INSERT INTO Member_Costs (
-									order_id, meter_id, member_cost, member_cost_compensation, member_savings
-									)
-									VALUES (?, ?, ?, ?, ?)
-								''', (
-					id_order,
-					meter_id,
-					round(results_pp['member_cost'][meter_id], 2),
-					round(results_pp['member_cost_compensations'][meter_id], 2),
-					0
-				))
-
-		for meter_id in meter_ids:
-			curs.execute('''
-				INSERT INTO Meter_Investment_Outputs (
-				order_id, meter_id, installation_cost, installation_cost_compensation, installation_savings, 
-				installed_pv, pv_investment_cost, installed_storage, storage_investment_cost, total_pv, total_storage, 
-				contracted_power, contracted_power_cost, retailer_exchange_costs, sc_tariffs_costs)
-				VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-			''', (
-				id_order,
-				meter_id,
-				round(results_pp['installation_cost_compensations'][meter_id], 3),
-				round(results_pp['installation_cost_compensations'][meter_id], 3),
-				0,
-				round(results_pp['p_gn_new'][meter_id], 3),
-				round(results_pp['PV_investments_cost'][meter_id], 3),
-				round(results_pp['e_bn_new'][meter_id], 3),
-				round(results_pp['batteries_investments_cost'][meter_id], 3),
-				round(results_pp['p_gn_total'][meter_id], 3),
-				round(results_pp['e_bn_total'][meter_id], 3),
-				round(results_pp['p_cont'][meter_id], 3),
-				round(results_pp['contractedpower_cost'][meter_id], 3),
-				round(sum(results_pp['e_sup'][meter_id]), 3),
-				round(sum(results_pp['e_slc_pool'][meter_id]), 3)
-			))
-
-		if is_clustered:
-			nr_clusters = user_params.nr_representative_days
-			list_of_times = list(map(str,
-									 pd.date_range(start=pd.Timestamp('00:00:00'),
-												   end=pd.Timestamp('23:45:00'),
-												   freq='15T').time)
-								 ) * nr_clusters
-			list_of_cluster_nrs = [x//96 for x in list(range(len(list_of_times)))]
-			for idx, tempo in enumerate(list_of_times):
-				curs.execute('''
-					INSERT INTO Clustered_Lem_Prices (order_id, time, cluster_nr, cluster_weight, value)
-					VALUES (?, ?, ?, ?, ?)
-				''', (
-					id_order,
-					tempo,
-					list_of_cluster_nrs[idx],
-					int(inputs['w_clustering'][idx]),
-					round(results_pp['dual_prices'][idx], 3)
-				))
-
-				curs.execute('''
-					INSERT INTO Clustered_Pool_Self_Consumption_Tariffs 
-					(order_id, time, cluster_nr, cluster_weight, self_consumption_tariff)
-					VALUES (?, ?, ?, ?, ?)
-				''', (
-					id_order,
-					tempo,
-					list_of_cluster_nrs[idx],
-					int(inputs['w_clustering'][idx]),
-					round(inputs['l_grid'][idx], 3)
-				))
-
-				# todo: energy_generated é, na verdade,e_g_factor
-				for meter_id in meter_ids:
-					curs.execute('''
-						INSERT INTO Clustered_Meter_Operation_Inputs 
-						(order_id, meter_id, time, cluster_nr, cluster_weight, energy_generated, energy_consumed, 
-						buy_tariff, sell_tariff)
-						VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-					''', (
-						id_order,
-						meter_id,
-						tempo,
-						list_of_cluster_nrs[idx],
-						int(inputs['w_clustering'][idx]),
-						round(inputs['meters'][meter_id]['e_g_factor'][idx], 3),
-						round(inputs['meters'][meter_id]['e_c'][idx], 3),
-						round(inputs['meters'][meter_id]['l_buy'][idx], 3),
-						round(inputs['meters'][meter_id]['l_sell'][idx], 3),
-					))
-
-					curs.execute('''
-						INSERT INTO Clustered_Meter_Operation_Outputs 
-						(order_id, meter_id, time, cluster_nr, cluster_weight, energy_surplus, energy_supplied, 
-						energy_purchased_lem, energy_sold_lem, net_load, bess_energy_charged, 
-						bess_energy_discharged, bess_energy_content)
-						VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-					''', (
-						id_order,
-						meter_id,
-						tempo,
-						list_of_cluster_nrs[idx],
-						int(inputs['w_clustering'][idx]),
-						round(results_pp['e_sur'][meter_id][idx], 3),
-						round(results_pp['e_sup'][meter_id][idx], 3),
-						round(results_pp['e_pur_pool'][meter_id][idx], 3),
-						round(results_pp['e_sale_pool'][meter_id][idx], 3),
-						round(results['e_cmet'][meter_id][idx], 3),
-						round(results_pp['e_bc'][meter_id][idx], 3),
-						round(results_pp['e_bd'][meter_id][idx], 3),
-						round(results_pp['e_bat'][meter_id][idx], 3)
-					))
+			member_meter_ids = [i for i in meter_ids if i != user_params.shared_meter_id]
 		else:
-			for idx, dt in enumerate(list_of_datetimes):
-				curs.execute('''
-					INSERT INTO Lem_Prices (order_id, datetime, value)
-					VALUES (?, ?, ?)
-				''', (
-					id_order,
-					dt,
-					round(results_pp['dual_prices'][idx], 3)
-				))
-
-				curs.execute('''
-					INSERT INTO Pool_Self_Consumption_Tariffs (order_id, datetime, self_consumption_tariff)
-					VALUES (?, ?, ?)
-				''', (
-					id_order,
-					dt,
-					round(inputs['l_grid'][idx], 3)
-				))
-
-				# todo: energy_generated é, na verdade,e_g_factor
-				for meter_id in meter_ids:
-					curs.execute('''
-						INSERT INTO Meter_Operation_Inputs (order_id, meter_id, datetime, energy_generated, 
-							energy_consumed, buy_tariff, sell_tariff)
-						VALUES (?, ?, ?, ?, ?, ?, ?)
-					''', (
-						id_order,
-						meter_id,
-						dt,
-						round(inputs['meters'][meter_id]['e_g_factor'][idx], 3),
-						round(inputs['meters'][meter_id]['e_c'][idx], 3),
-						round(inputs['meters'][meter_id]['l_buy'][idx], 3),
-						round(inputs['meters'][meter_id]['l_sell'][idx], 3),
-					))
-
-					curs.execute('''
-						INSERT INTO Meter_Operation_Outputs (order_id, meter_id, datetime, energy_surplus, 
-							energy_supplied, energy_purchased_lem, energy_sold_lem, net_load, 
-							bess_energy_charged, bess_energy_discharged, bess_energy_content)
-						VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-					''', (
-						id_order,
-						meter_id,
-						dt,
-						round(results_pp['e_sur'][meter_id][idx], 3),
-						round(results_pp['e_sup'][meter_id][idx], 3),
-						round(results_pp['e_pur_pool'][meter_id][idx], 3),
-						round(results_pp['e_sale_pool'][meter_id][idx], 3),
-						round(results['e_cmet'][meter_id][idx], 3),
-						round(results_pp['e_bc'][meter_id][idx], 3),
-						round(results_pp['e_bd'][meter_id][idx], 3),
-						round(results_pp['e_bat'][meter_id][idx], 3)
-					))
-
-		conn.commit()
+			member_meter_ids = list(meter_ids)
+		nr_clusters = user_params.nr_representative_days if is_clustered else 0
+		# representative day of each day of the horizon, to later expand the clustered results to the full horizon
+		day_clusters = cluster_assignment(day_profiles, inputs, nr_clusters) if is_clustered else None
+		store_milp_results(db, id_order, meter_ids, member_meter_ids, inputs, results, results_pp,
+						   list_of_datetimes, nr_clusters, day_clusters)
+		# only reported as finished once the results were committed, so that they can be retrieved right away
+		order_status.update(id_order, processed=True, stage=OrderStage.finished)
 
 		logger.info('Finished!')